@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'dashboard.middleware.MedicionPeticionesMiddleware', # Consultas y tiempos de cada petición
     'dashboard.middleware.BasicAuthMiddleware', # Guardián global del sitio
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +58,7 @@ MIDDLEWARE = [
     'dashboard.middleware.ForcePasswordChangeMiddleware', # Nuestro guardián para forzar cambio de contraseña
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'dashboard.middleware.PerfiladoPeticionesMiddleware', # cProfile a pedido de staff (token firmado)
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -132,6 +134,104 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# ==================================================
+# === CONFIGURACIÓN DE CACHÉ ===
+# ==================================================
+# Por defecto se usa la caché en memoria del proceso (locmem). En producción
+# puede apuntarse a un backend compartido con CACHE_URL, por ejemplo
+# 'filecache:///var/tmp/prestamos_cache' o 'rediscache://127.0.0.1:6379/1'.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://prestamos'),
+}
+# Segundos que puede vivir la foto de métricas del panel aunque no haya cambios
+# (cubre cambios que dependen solo de la fecha, como las cuotas en atraso).
+DASHBOARD_METRICAS_TTL = env.int('DASHBOARD_METRICAS_TTL', default=300)
+# Segundos que vive el resumen del portal de cada cliente (se borra antes si
+# cambian sus préstamos, cuotas o pagos).
+PORTAL_RESUMEN_TTL = env.int('PORTAL_RESUMEN_TTL', default=900)
+# Segundos máximos que cada proceso conserva su copia de los datos de
+# referencia (configuración de impresión, tipos, grupos). Con una caché
+# compartida los cambios se ven al instante; ver gestion_prestamos/referencias.py.
+REFERENCIAS_TTL = env.int('REFERENCIAS_TTL', default=3600)
+# Carpeta donde se guardan los estados de cuenta y recibos ya generados en PDF
+# (WeasyPrint, en requirements.txt). Solo se usa con una caché compartida: con
+# la locmem por defecto cada pedido vuelve a generar el documento. En
+# producción se necesitan las dos cosas, por ejemplo:
+#     CACHE_URL=rediscache://127.0.0.1:6379/1
+#     DOCUMENTOS_CACHE_DIR=/var/lib/prestamos/documentos
+# `manage.py check --deploy` avisa si falta alguna. La carpeta se puede vaciar
+# en cualquier momento; `limpiar_documentos` borra lo viejo cada noche.
+DOCUMENTOS_CACHE_DIR = env('DOCUMENTOS_CACHE_DIR', default=str(BASE_DIR / 'cache_documentos'))
+
+# ==================================================
+# === MEDICIÓN DE PETICIONES ===
+# ==================================================
+# dashboard.middleware.MedicionPeticionesMiddleware anota en el log
+# 'dashboard.peticiones' la vista, el estado, las consultas y los tiempos de
+# cada petición, y manda a LOG_DIR/peticiones_lentas.log (rotativo) las que
+# superan alguno de los umbrales, con sus consultas más lentas. La línea por
+# petición se escribe en la consola (en PythonAnywhere, el server log) solo
+# con LOG_PETICIONES_NIVEL=INFO; el log de lentas está siempre activo.
+MEDICION_PETICIONES = env.bool('MEDICION_PETICIONES', default=True)
+# Agrega la cabecera Server-Timing para ver el desglose en las herramientas del navegador.
+SERVER_TIMING = env.bool('SERVER_TIMING', default=True)
+# Umbrales de una petición lenta: milisegundos totales o cantidad de consultas.
+PETICION_LENTA_MS = env.int('PETICION_LENTA_MS', default=1000)
+PETICION_LENTA_CONSULTAS = env.int('PETICION_LENTA_CONSULTAS', default=50)
+# Una sola consulta que tarde más que esto también marca la petición como lenta.
+CONSULTA_LENTA_MS = env.int('CONSULTA_LENTA_MS', default=200)
+# La carpeta se crea al escribir el primer registro (ver dashboard/registro.py).
+LOG_DIR = env('LOG_DIR', default=str(BASE_DIR / 'logs'))
+
+# Perfilado a pedido con cProfile (ver dashboard/perfilado.py).
+PERFILES_DIR = env('PERFILES_DIR', default=str(BASE_DIR / 'perfiles'))
+# Segundos de vigencia de un token de `manage.py token_perfilado`.
+PERFILADO_VIGENCIA = env.int('PERFILADO_VIGENCIA', default=3600)
+# De las peticiones con token válido se perfila una de cada N.
+PERFILADO_MUESTREO = env.int('PERFILADO_MUESTREO', default=1)
+# Funciones que se listan en el resumen en texto de cada perfil.
+PERFILADO_TOP = env.int('PERFILADO_TOP', default=40)
+
+# Telemetría para /metrics (ver gestion_prestamos/telemetria.py). Con
+# METRICAS_DIR cada worker vuelca sus contadores ahí, como mucho cada
+# METRICAS_INTERVALO segundos, y el endpoint suma todos; sin carpeta solo se
+# ve el proceso que atiende el scrape.
+METRICAS_DIR = env('METRICAS_DIR', default='')
+METRICAS_INTERVALO = env.int('METRICAS_INTERVALO', default=10)
+# IPs que pueden leer /metrics sin iniciar sesión (además de los usuarios staff).
+METRICAS_IPS_PERMITIDAS = env.list('METRICAS_IPS_PERMITIDAS', default=[])
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+        'peticiones_lentas': {
+            'class': 'dashboard.registro.ArchivoRotativoHandler',
+            'filename': os.path.join(LOG_DIR, 'peticiones_lentas.log'),
+            'maxBytes': 5 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'dashboard.peticiones': {
+            'handlers': ['console'],
+            'level': env('LOG_PETICIONES_NIVEL', default='WARNING'),
+            'propagate': False,
+        },
+        'dashboard.peticiones_lentas': {
+            'handlers': ['peticiones_lentas'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 # ==================================================
 # === CONFIGURACIÓN DE AUTENTICACIÓN ===
 # ==================================================
@@ -1,5 +1,7 @@
+import copy
 from django.db import models
 from django.core.exceptions import ValidationError
+from gestion_prestamos.referencias import REF_CONFIGURACION_IMPRESION, invalidar_referencia, obtener_referencia
 
 class ConfiguracionImpresion(models.Model):
     """
@@ -51,6 +53,7 @@ class ConfiguracionImpresion(models.Model):
         # Asegura que este objeto sea siempre el único que exista.
         self.pk = 1
         super(ConfiguracionImpresion, self).save(*args, **kwargs)
+        invalidar_referencia(REF_CONFIGURACION_IMPRESION)
 
     def delete(self, *args, **kwargs):
         # Previene la eliminación de este objeto.
@@ -59,5 +62,7 @@ class ConfiguracionImpresion(models.Model):
     @classmethod
     def load(cls):
         # Método de conveniencia para obtener o crear la única instancia de configuración.
-        obj, created = cls.objects.get_or_create(pk=1)
-        return obj
\ No newline at end of file
+        # Se sirve desde la caché de referencias; se devuelve una copia para
+        # que quien la edite (p. ej. un formulario) no toque la compartida.
+        obj = obtener_referencia(REF_CONFIGURACION_IMPRESION, lambda: cls.objects.get_or_create(pk=1)[0])
+        return copy.copy(obj)
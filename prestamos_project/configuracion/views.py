@@ -7,8 +7,15 @@ from .forms import ConfiguracionImpresionForm
 def es_administrador(user):
     """
     Verifica si un usuario pertenece al grupo 'Administradores' o es superusuario.
+    La membresía se consulta en la base, nunca en la caché de referencias, para
+    que quitar a alguien del grupo valga enseguida en todos los procesos; el
+    resultado se guarda en el usuario, que dura lo que la petición.
     """
-    return user.is_staff or user.groups.filter(name='Administradores').exists()
+    if user.is_staff:
+        return True
+    if not hasattr(user, '_es_administrador'):
+        user._es_administrador = user.groups.filter(name='Administradores').exists()
+    return user._es_administrador
 
 @login_required
 @user_passes_test(es_administrador, login_url='/')
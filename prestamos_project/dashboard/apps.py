@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class DashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dashboard'
-9
\ No newline at end of file
+
+    def ready(self):
+        import dashboard.checks
+        import dashboard.signals
@@ -0,0 +1,29 @@
+from django.core.checks import Tags, Warning, register
+from . import documentos
+
+# ==================================================
+# === REVISIONES DE DESPLIEGUE ===
+# ==================================================
+# `manage.py check --deploy` avisa si los estados de cuenta y recibos no van
+# a salir en PDF o no se van a guardar en disco (ver dashboard/documentos.py).
+
+
+@register(Tags.caches, deploy=True)
+def revisar_documentos_imprimibles(app_configs, **kwargs):
+    avisos = []
+    if documentos.HTML is None:
+        avisos.append(Warning(
+            'WeasyPrint no está instalado: los estados de cuenta y recibos se sirven en HTML, no en PDF.',
+            hint='Instale las dependencias de requirements.txt (y las librerías de sistema de WeasyPrint).',
+            id='dashboard.W001',
+        ))
+    if not documentos.cache_en_disco_activa():
+        avisos.append(Warning(
+            'Los estados de cuenta y recibos se generan de nuevo en cada pedido.',
+            hint=(
+                'Defina DOCUMENTOS_CACHE_DIR y un CACHE_URL compartido por todos los procesos, '
+                'p. ej. CACHE_URL=rediscache://127.0.0.1:6379/1.'
+            ),
+            id='dashboard.W002',
+        ))
+    return avisos
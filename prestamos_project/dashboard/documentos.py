@@ -0,0 +1,159 @@
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+from django.conf import settings
+from django.http import FileResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+from gestion_prestamos import telemetria
+from gestion_prestamos.referencias import REF_CONFIGURACION_IMPRESION, cache_compartida, invalidar_referencia, version_referencia
+
+try:
+    from weasyprint import HTML
+except ImportError:  # Sin WeasyPrint (p. ej. faltan sus librerías de sistema) se sirve el HTML imprimible.
+    HTML = None
+
+# ==================================================
+# === DOCUMENTOS IMPRIMIBLES CON CACHÉ EN DISCO ===
+# ==================================================
+# Estados de cuenta y recibos se generan una sola vez y se guardan en
+# DOCUMENTOS_CACHE_DIR con un nombre derivado de su contenido: el tipo de
+# documento, los objetos que muestra, la versión de datos de cada uno y la
+# versión de la configuración de impresión. Mientras nada de eso cambie, una
+# reimpresión se sirve directo del archivo sin consultar ni escribir en la
+# base. Cualquier cambio publica una versión nueva (ver dashboard.signals) y
+# el siguiente pedido genera un archivo nuevo.
+#
+# Las versiones viven en la caché por defecto, así que el disco solo se usa
+# con una caché compartida (CACHE_URL): con locmem, un pago atendido por un
+# worker de WSGI no cambiaría la versión que ven los demás y seguirían
+# sirviendo el documento viejo. Sin caché compartida, o con
+# DOCUMENTOS_CACHE_DIR vacío, cada pedido genera el documento sin guardarlo.
+#
+# Los archivos reemplazados no se borran solos; `limpiar_documentos` quita los
+# que no se tocaron en los últimos días (ver el comando).
+#
+# Los documentos se generan en PDF con WeasyPrint (requirements.txt). Si no se
+# puede importar, se sirve el HTML imprimible que ya se mostraba al navegador.
+# `manage.py check --deploy` avisa de ambos casos (ver dashboard/checks.py).
+
+
+def version_datos(modelo, pk):
+    """Versión de los datos de un objeto que aparece en un documento."""
+    return version_referencia(f'documentos:{modelo}:{pk}')
+
+
+def invalidar_documentos(modelo, pks):
+    """Publica una versión nueva para los objetos indicados al confirmar la transacción."""
+    nombres = [f'documentos:{modelo}:{pk}' for pk in set(pks) if pk is not None]
+    if nombres:
+        invalidar_referencia(*nombres)
+
+
+def clave_documento(tipo, *partes):
+    """
+    Nombre del archivo de un documento. `partes` son los objetos que muestra,
+    como tuplas (modelo, pk); se les agrega su versión de datos.
+    """
+    componentes = [tipo, version_referencia(REF_CONFIGURACION_IMPRESION)]
+    for modelo, pk in partes:
+        componentes.append(f'{modelo}:{pk}:{version_datos(modelo, pk)}')
+    return hashlib.sha256('|'.join(map(str, componentes)).encode()).hexdigest()
+
+
+def _extension():
+    return 'pdf' if HTML is not None else 'html'
+
+
+def _ruta(clave):
+    return Path(settings.DOCUMENTOS_CACHE_DIR) / clave[:2] / f'{clave}.{_extension()}'
+
+
+def _renderizar(request, plantilla, contexto):
+    html = render_to_string(plantilla, contexto, request=request)
+    if HTML is None:
+        return html.encode('utf-8')
+    return HTML(string=html, base_url=request.build_absolute_uri('/')).write_pdf()
+
+
+def _guardar(ruta, contenido):
+    # Se escribe en un temporal y se renombra, así otro proceso nunca lee un archivo a medias.
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as archivo:
+            archivo.write(contenido)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+
+
+def cache_en_disco_activa():
+    """Indica si los documentos se guardan en DOCUMENTOS_CACHE_DIR (ver arriba)."""
+    return bool(settings.DOCUMENTOS_CACHE_DIR) and cache_compartida()
+
+
+def respuesta_documento(request, clave, plantilla, construir_contexto, nombre_archivo):
+    """
+    Sirve el documento `clave` desde el disco, generándolo con
+    `construir_contexto()` y `plantilla` solo si aún no existe. Sin caché en
+    disco activa, lo genera en cada pedido.
+    """
+    if cache_en_disco_activa():
+        ruta = _ruta(clave)
+        existe = ruta.exists()
+        telemetria.registrar_lectura_cache('documentos', existe)
+        if not existe:
+            _guardar(ruta, _renderizar(request, plantilla, construir_contexto()))
+        contenido = open(ruta, 'rb')
+    else:
+        contenido = io.BytesIO(_renderizar(request, plantilla, construir_contexto()))
+
+    extension = _extension()
+    respuesta = FileResponse(
+        contenido,
+        content_type='application/pdf' if extension == 'pdf' else 'text/html; charset=utf-8',
+    )
+    if extension == 'pdf':
+        respuesta['Content-Disposition'] = f'inline; filename="{nombre_archivo}.pdf"'
+    return respuesta
+
+
+def clave_estado_cuenta(prestamo):
+    """
+    El estado de cuenta marca las cuotas en atraso según la fecha de hoy, así
+    que la fecha también forma parte de la clave.
+    """
+    partes = [('prestamo', prestamo.pk), ('cliente', prestamo.cliente_id)]
+    if prestamo.garante_id:
+        partes.append(('garante', prestamo.garante_id))
+    return clave_documento(f'estado_cuenta:{timezone.now().date()}', *partes)
+
+
+def limpiar_documentos(antiguedad):
+    """
+    Borra de DOCUMENTOS_CACHE_DIR los documentos (y temporales huérfanos) sin
+    modificar desde hace más de `antiguedad` (un timedelta). Si alguno todavía
+    estaba vigente, se vuelve a generar en el próximo pedido. Las subcarpetas
+    (como mucho 256) se dejan, para no borrar una en la que otro proceso está
+    por escribir. Devuelve (archivos borrados, bytes liberados).
+    """
+    carpeta = Path(settings.DOCUMENTOS_CACHE_DIR) if settings.DOCUMENTOS_CACHE_DIR else None
+    if carpeta is None or not carpeta.is_dir():
+        return 0, 0
+    limite = (timezone.now() - antiguedad).timestamp()
+    borrados = liberados = 0
+    for ruta in carpeta.glob('*/*'):
+        try:
+            datos = ruta.stat()
+            if ruta.is_file() and datos.st_mtime < limite:
+                ruta.unlink()
+                borrados += 1
+                liberados += datos.st_size
+        except FileNotFoundError:
+            # Otro proceso lo reemplazó o lo borró mientras tanto.
+            continue
+    return borrados, liberados
@@ -0,0 +1,240 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# ==================================================
+# === EXPORTACIÓN EN STREAMING (CSV / XLSX) ===
+# ==================================================
+# Las filas se leen con `.iterator(chunk_size=...)` y se escriben a la
+# respuesta a medida que llegan, así que exportar medio millón de cuotas usa
+# la misma memoria que exportar diez y la descarga empieza de inmediato.
+# El XLSX se genera con la librería estándar (zipfile en modo streaming),
+# sin cargar el libro completo en memoria.
+
+FILAS_POR_BLOQUE = 2000
+
+TIPOS_CONTENIDO = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+class Columna:
+    """Una columna del archivo: su título y cómo obtener el valor de cada objeto."""
+
+    def __init__(self, titulo, valor):
+        self.titulo = titulo
+        self.valor = valor if callable(valor) else self._ruta(valor)
+
+    @staticmethod
+    def _ruta(ruta):
+        def leer(objeto):
+            for parte in ruta.split('.'):
+                objeto = getattr(objeto, parte)
+                if objeto is None:
+                    return None
+            return objeto() if callable(objeto) else objeto
+        return leer
+
+
+def _filas(queryset, columnas):
+    for objeto in queryset.iterator(chunk_size=FILAS_POR_BLOQUE):
+        yield [columna.valor(objeto) for columna in columnas]
+
+
+# --- CSV ---
+
+class _Eco:
+    """Objeto con `write` que devuelve lo escrito, para usar csv.writer como generador."""
+
+    def write(self, valor):
+        return valor
+
+
+# Un texto que empieza con uno de estos caracteres Excel lo toma como fórmula
+# al abrir el CSV. Nombres y direcciones los escriben los clientes, así que
+# esas celdas se exportan con un apóstrofo delante (Excel lo oculta).
+_INICIOS_DE_FORMULA = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _texto_csv(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).strftime('%Y-%m-%d %H:%M') if timezone.is_aware(valor) else valor.strftime('%Y-%m-%d %H:%M')
+    if isinstance(valor, (int, float, Decimal, date)):
+        return valor
+    # Cualquier otro valor (p. ej. un Cliente, que se escribe con su `__str__`)
+    # se convierte aquí para que también pase por la comprobación de fórmulas.
+    valor = str(valor)
+    if valor.startswith(_INICIOS_DE_FORMULA):
+        return "'" + valor
+    return valor
+
+
+def _generar_csv(queryset, columnas):
+    escritor = csv.writer(_Eco())
+    # BOM para que Excel abra el archivo como UTF-8 (acentos y ñ).
+    yield '\ufeff' + escritor.writerow([columna.titulo for columna in columnas])
+    for fila in _filas(queryset, columnas):
+        yield escritor.writerow([_texto_csv(valor) for valor in fila])
+
+
+# --- XLSX ---
+
+class _SalidaSinRetroceso(io.RawIOBase):
+    """Destino de zipfile que no admite `seek`, de modo que el ZIP se escribe en orden y se puede ir enviando."""
+
+    def __init__(self):
+        self._partes = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes.clear()
+        return datos
+
+
+_CARACTERES_INVALIDOS_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_FIJOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Datos" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Estilos: 0 = general, 1 = fecha, 2 = fecha y hora, 3 = encabezado en negrita.
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="2"><numFmt numFmtId="164" formatCode="dd/mm/yyyy"/><numFmt numFmtId="165" formatCode="dd/mm/yyyy hh:mm"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="4">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '</cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+# Día 0 de las fechas de Excel (sistema 1900).
+_EPOCA_EXCEL = datetime(1899, 12, 30)
+
+
+def _celda_xlsx(valor, estilo=0):
+    if valor is None or valor == '':
+        return '<c/>'
+    if isinstance(valor, bool):
+        return f'<c t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (int, float, Decimal)):
+        return f'<c><v>{valor}</v></c>'
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.make_naive(valor)
+        dias = (valor - _EPOCA_EXCEL).total_seconds() / 86400
+        return f'<c s="2"><v>{dias:.6f}</v></c>'
+    if isinstance(valor, date):
+        return f'<c s="1"><v>{(valor - _EPOCA_EXCEL.date()).days}</v></c>'
+    # El texto va siempre como cadena en línea (t="inlineStr"), nunca como <f>:
+    # Excel no evalúa como fórmula un '=...' escrito así, sin necesidad de apóstrofo.
+    texto = escape(_CARACTERES_INVALIDOS_XML.sub('', str(valor)))
+    estilo_attr = f' s="{estilo}"' if estilo else ''
+    return f'<c t="inlineStr"{estilo_attr}><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _fila_xlsx(valores, estilo=0):
+    return '<row>' + ''.join(_celda_xlsx(valor, estilo) for valor in valores) + '</row>'
+
+
+def _generar_xlsx(queryset, columnas):
+    salida = _SalidaSinRetroceso()
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED) as libro:
+        for nombre, contenido in _XLSX_FIJOS.items():
+            libro.writestr(nombre, contenido)
+        yield salida.vaciar()
+
+        with libro.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            hoja.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>'
+                + _fila_xlsx([columna.titulo for columna in columnas], estilo=3)
+            ).encode())
+            for numero, fila in enumerate(_filas(queryset, columnas), start=1):
+                hoja.write(_fila_xlsx(fila).encode())
+                if numero % FILAS_POR_BLOQUE == 0:
+                    yield salida.vaciar()
+            hoja.write(b'</sheetData></worksheet>')
+    yield salida.vaciar()
+
+
+_GENERADORES = {
+    'csv': _generar_csv,
+    'xlsx': _generar_xlsx,
+}
+
+
+def respuesta_exportacion(queryset, columnas, nombre_archivo, formato='csv'):
+    """
+    Devuelve una `StreamingHttpResponse` que descarga `queryset` como CSV o
+    XLSX con las `columnas` indicadas, en el orden que ya tenga la consulta.
+
+    Args:
+        queryset (QuerySet): Consulta filtrada y ordenada.
+        columnas (list): Lista de `Columna`.
+        nombre_archivo (str): Nombre del archivo sin extensión.
+        formato (str): 'csv' o 'xlsx'.
+
+    Raises:
+        ValueError: Si el formato no es válido.
+    """
+    if formato not in _GENERADORES:
+        raise ValueError(f"Formato de exportación no soportado: {formato}")
+    respuesta = StreamingHttpResponse(
+        _GENERADORES[formato](queryset, columnas),
+        content_type=TIPOS_CONTENIDO[formato]
+    )
+    respuesta['Content-Disposition'] = f'attachment; filename="{nombre_archivo}.{formato}"'
+    return respuesta
@@ -0,0 +1,101 @@
+from django.db.models import F
+from django.utils import timezone
+from gestion_prestamos.busqueda import buscar_por_cliente
+from gestion_prestamos.models import Cliente, Cuota, Prestamo
+
+# ==================================================
+# === CONSULTAS DE LOS LISTADOS ===
+# ==================================================
+# Filtros y orden de cada listado, compartidos por las vistas HTML y por la
+# exportación, para que un archivo exportado contenga exactamente lo que el
+# usuario está viendo. Cada función recibe los parámetros GET de la petición
+# y devuelve la consulta sin ordenar junto con el orden a aplicar (siempre
+# terminado en 'id' para la paginación por cursor).
+
+ORDEN_CLIENTES = ['-fecha_registro', '-id']
+ORDEN_PRESTAMOS = ['-fecha_creacion', '-id']
+# Órdenes de préstamos por `sort`, sobre la tabla SituacionPrestamo (indexada).
+# 'atraso' empieza por el vencimiento impago más antiguo, o sea el mayor atraso.
+ORDENES_PRESTAMOS = {
+    'saldo': ['-situacion__saldo_pendiente', '-id'],
+    '-saldo': ['situacion__saldo_pendiente', 'id'],
+    'atraso': ['situacion__proximo_vencimiento', 'id'],
+}
+
+ESTADOS_CUOTA_EN_COBRO = ['pendiente', 'pagada_parcialmente', 'vencida']
+ORDEN_COBROS_POR_DEFECTO = '-dias_vencido'
+ORDENES_COBROS_VALIDOS = [
+    'fecha_vencimiento', '-fecha_vencimiento',
+    'dias_vencido', '-dias_vencido',
+    'monto_cuota', '-monto_cuota',
+    'monto_penalidad_acumulada', '-monto_penalidad_acumulada',
+    'numero_cuota', '-numero_cuota',
+    'prestamo__cliente__nombres', '-prestamo__cliente__nombres'
+]
+
+
+def consultar_clientes(parametros):
+    """Clientes filtrados por la búsqueda `q`."""
+    clientes = buscar_por_cliente(Cliente.objects.all(), parametros.get('q'))
+    return clientes, ORDEN_CLIENTES
+
+
+def consultar_prestamos(parametros, estado, hoy=None):
+    """
+    Préstamos en `estado`, filtrados por la búsqueda `q` y, con `atraso`, solo
+    los que tienen una cuota impaga vencida. `sort` elige uno de
+    ORDENES_PRESTAMOS; por defecto, los más recientes primero.
+    """
+    prestamos = Prestamo.objects.filter(estado=estado).select_related('cliente', 'tipo_prestamo', 'situacion')
+    prestamos = buscar_por_cliente(prestamos, parametros.get('q'), ruta_cliente='cliente__')
+    if parametros.get('atraso'):
+        hoy = hoy or timezone.now().date()
+        prestamos = prestamos.filter(situacion__proximo_vencimiento__lt=hoy)
+
+    orden = ORDENES_PRESTAMOS.get(parametros.get('sort'), ORDEN_PRESTAMOS)
+    if orden[0].lstrip('-') == 'situacion__proximo_vencimiento':
+        # Sin cuotas abiertas no hay vencimiento; el cursor no puede compararse con NULL.
+        prestamos = prestamos.filter(situacion__proximo_vencimiento__isnull=False)
+    return prestamos, orden
+
+
+def consultar_cuotas(parametros):
+    """Cuotas filtradas por préstamo (`prestamo`), estado (`estado`) y búsqueda (`q`)."""
+    cuotas = Cuota.objects.select_related('prestamo__cliente')
+    if str(parametros.get('prestamo', '')).isdigit():
+        cuotas = cuotas.filter(prestamo_id=parametros['prestamo'])
+    if parametros.get('estado'):
+        cuotas = cuotas.filter(estado=parametros['estado'])
+    cuotas = buscar_por_cliente(cuotas, parametros.get('q'), ruta_cliente='prestamo__cliente__', campo_id='prestamo_id')
+    return cuotas, ['prestamo_id', 'numero_cuota', 'id']
+
+
+def consultar_cobros(parametros, hoy=None):
+    """
+    Cuotas vencidas y no pagadas, filtradas por la búsqueda `q` y anotadas
+    con `dias_vencido`.
+
+    Returns:
+        tuple: (consulta, orden elegido en `sort`, orden para paginar).
+    """
+    hoy = hoy or timezone.now().date()
+    cuotas = Cuota.objects.filter(
+        fecha_vencimiento__lt=hoy,
+        estado__in=ESTADOS_CUOTA_EN_COBRO
+    ).select_related('prestamo__cliente')
+    cuotas = buscar_por_cliente(cuotas, parametros.get('q'), ruta_cliente='prestamo__cliente__', campo_id='prestamo_id')
+
+    # Usamos F() para referenciar un campo de la base de datos directamente
+    cuotas = cuotas.annotate(dias_vencido=hoy - F('fecha_vencimiento'))
+
+    sort_by = parametros.get('sort', ORDEN_COBROS_POR_DEFECTO)
+    if sort_by not in ORDENES_COBROS_VALIDOS:
+        sort_by = ORDEN_COBROS_POR_DEFECTO
+
+    # Los días de atraso son hoy - fecha_vencimiento, así que se pagina sobre
+    # fecha_vencimiento (indexada) en sentido contrario. El id desempata.
+    if sort_by.lstrip('-') == 'dias_vencido':
+        orden = ['fecha_vencimiento', 'id'] if sort_by.startswith('-') else ['-fecha_vencimiento', '-id']
+    else:
+        orden = [sort_by, '-id' if sort_by.startswith('-') else 'id']
+    return cuotas, sort_by, orden
@@ -0,0 +1,340 @@
+import json
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+import django
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from configuracion.models import ConfiguracionImpresion
+from gestion_prestamos.models import ESTADOS_CUOTA_ABIERTA, Cliente, Cuota, Pago, Prestamo, ReciboPago, TipoPrestamo
+from . import urls
+
+# ==================================================
+# === MEDICIÓN DE VISTAS CON PRESUPUESTOS ===
+# ==================================================
+# Recorre cada URL de dashboard/urls.py (incluido el portal de clientes) con
+# el cliente de pruebas de Django, sobre los datos que haya en la base, y
+# anota cuántas consultas hace y cuánto tarda. Cada vista tiene un
+# presupuesto de consultas y de milisegundos; el informe marca las que se
+# pasan, las URLs sin caso de medición y las mediciones sin presupuesto, así
+# que una URL nueva obliga a declarar los suyos.
+#
+# Cada repetición se mide "en frío": antes se vacían la caché (una caché
+# locmem propia, nunca la compartida) y la carpeta de documentos, de modo que
+# las vistas cacheadas muestran lo que cuesta generar su contenido. Un N+1
+# hace crecer las consultas con los datos, por eso los presupuestos de
+# consultas son fijos y valen igual para la base chica de los tests que para
+# una generada con `populate_data`. Los milisegundos dependen de la máquina y
+# del tamaño de la base; están pensados para el conjunto por defecto de
+# `medir_vistas` (300 clientes) y los tests no los validan.
+
+# (consultas, milisegundos) por medición. Las consultas incluyen las de la
+# sesión y el usuario que hace cualquier petición autenticada.
+PRESUPUESTOS = {
+    'panel_informativo': (8, 300),
+    'profile': (2, 100),
+    'client_list': (3, 200),
+    'client_add': (2, 200),
+    'client_edit': (3, 200),
+    'client_detail': (5, 200),
+    'loan_add': (5, 300),
+    # Incluye el UPDATE de penalidades y la situación del préstamo (primera visita del día).
+    'loan_detail': (18, 300),
+    'loan_detail_print': (9, 300),
+    'loan_list': (3, 200),
+    'loan_application_list': (3, 200),
+    'loan_application_detail': (5, 200),
+    'paid_loan_list': (3, 200),
+    'payment_add': (4, 200),
+    'payment_import': (2, 100),
+    'payment_receipt_print': (10, 300),
+    'recibo_pago_print': (4, 200),
+    'cobros_list': (4, 300),
+    'export_list[clientes]': (3, 500),
+    'export_list[prestamos]': (3, 500),
+    'export_list[prestamos-pagados]': (3, 500),
+    'export_list[solicitudes]': (3, 200),
+    'export_list[cuotas]': (3, 5000),
+    'export_list[cobros]': (3, 500),
+    'search_clients': (4, 100),
+    'search_cuotas': (3, 100),
+    'get_tipo_prestamo_details': (3, 100),
+    'calculate_amortization_api': (7, 100),
+    'financial_details': (10, 300),
+    'antiguedad_mora': (3, 300),
+    'antiguedad_mora_api': (3, 300),
+    'metrics': (2, 100),
+    'client_login': (0, 100),
+    'portal_dashboard': (7, 200),
+    'portal_loan_detail': (5, 200),
+    'client_change_password': (2, 100),
+    'portal_request_loan': (4, 100),
+    'client_password_reset': (0, 100),
+    'password_reset_done': (0, 100),
+    'password_reset_confirm': (1, 100),
+    'password_reset_complete': (0, 100),
+}
+
+# URLs que no se miden y por qué.
+EXCLUIDAS = {
+    'client_logout': 'Cierra la sesión con la que se miden las demás vistas del portal.',
+    'loan_application_approve': 'Solo modifica datos (POST); por GET redirige al listado.',
+    'loan_application_reject': 'Solo modifica datos (POST); por GET redirige al listado.',
+}
+
+USUARIO_STAFF = 'medicion_vistas'
+
+
+def nombres_de_urls():
+    """Nombres de todas las URLs de la app, incluidas las del portal."""
+    patrones = [*urls.urlpatterns, *urls.portal_patterns]
+    return [patron.name for patron in patrones if getattr(patron, 'name', None)]
+
+
+# --- Datos de muestra ---
+
+def _datos_de_muestra():
+    """
+    Elige de la base los objetos que usan los casos: el préstamo aprobado con
+    más cuotas vencidas y, a igualdad, con más cuotas (el peor caso para un
+    N+1), su cliente y sus pagos, un recibo, una solicitud pendiente y un tipo
+    de préstamo. Lo que no exista queda en None y sus casos se informan como
+    omitidos.
+    """
+    vencidas = Q(cuotas__estado__in=ESTADOS_CUOTA_ABIERTA, cuotas__fecha_vencimiento__lt=timezone.localdate())
+    prestamo = (
+        Prestamo.objects.filter(estado='aprobado').select_related('cliente__user')
+        .annotate(cuotas_vencidas=Count('cuotas', filter=vencidas), numero_cuotas=Count('cuotas'))
+        .order_by('-cuotas_vencidas', '-numero_cuotas', 'pk').first()
+    )
+    pagos = []
+    if prestamo is not None:
+        pagos = list(
+            Pago.objects.filter(cuota__prestamo=prestamo, recibo=None).order_by('pk').values_list('pk', flat=True)[:3]
+        )
+    return {
+        'prestamo': prestamo,
+        'cliente': prestamo.cliente if prestamo else None,
+        'pagos': pagos,
+        'recibo': ReciboPago.objects.order_by('pk').values_list('pk', flat=True).first(),
+        'solicitud': Prestamo.objects.filter(estado='pendiente').order_by('pk').values_list('pk', flat=True).first(),
+        'tipo': TipoPrestamo.objects.order_by('pk').values_list('pk', flat=True).first(),
+    }
+
+
+def _casos(datos):
+    """
+    Devuelve {nombre de URL: [(medición, usuario, método, url, datos del formulario)]}.
+    `usuario` es 'staff', 'cliente' o None (anónimo). Un caso sin los datos
+    que necesita se devuelve como texto con el motivo.
+    """
+    prestamo, cliente = datos['prestamo'], datos['cliente']
+    sin_prestamo = 'No hay préstamos aprobados.'
+
+    def get(nombre, usuario='staff', args=(), query=''):
+        return [(nombre, usuario, 'get', reverse(nombre, args=args) + query, None)]
+
+    casos = {
+        nombre: get(nombre)
+        for nombre in [
+            'panel_informativo', 'profile', 'client_list', 'client_add', 'loan_add', 'loan_list',
+            'loan_application_list', 'paid_loan_list', 'payment_import', 'cobros_list',
+            'financial_details', 'antiguedad_mora', 'antiguedad_mora_api', 'metrics',
+        ]
+    }
+    casos['search_clients'] = get('search_clients', query='?term=a')
+    casos['export_list'] = [
+        (f'export_list[{lista}]', 'staff', 'get', reverse('export_list', args=[lista]), None)
+        for lista in ['clientes', 'prestamos', 'prestamos-pagados', 'solicitudes', 'cuotas', 'cobros']
+    ]
+    for nombre in ['client_login', 'client_password_reset', 'password_reset_done', 'password_reset_complete']:
+        casos[nombre] = get(nombre, usuario=None)
+
+    casos['get_tipo_prestamo_details'] = (
+        get('get_tipo_prestamo_details', args=[datos['tipo']]) if datos['tipo'] else 'No hay tipos de préstamo.'
+    )
+    casos['loan_application_detail'] = (
+        get('loan_application_detail', args=[datos['solicitud']]) if datos['solicitud'] else 'No hay solicitudes pendientes.'
+    )
+    casos['recibo_pago_print'] = (
+        get('recibo_pago_print', args=[datos['recibo']]) if datos['recibo'] else 'No hay recibos guardados.'
+    )
+    if datos['pagos']:
+        casos['payment_receipt_print'] = get('payment_receipt_print', query='?pids=' + ','.join(map(str, datos['pagos'])))
+    else:
+        casos['payment_receipt_print'] = 'No hay pagos sin recibo guardado.'
+
+    if prestamo is None:
+        for nombre in [
+            'client_edit', 'client_detail', 'loan_detail', 'loan_detail_print', 'payment_add', 'search_cuotas',
+            'calculate_amortization_api', 'portal_dashboard', 'portal_loan_detail', 'client_change_password',
+            'portal_request_loan', 'password_reset_confirm',
+        ]:
+            casos[nombre] = sin_prestamo
+        return casos
+
+    for nombre in ['client_edit', 'client_detail']:
+        casos[nombre] = get(nombre, args=[cliente.pk])
+    for nombre in ['loan_detail', 'loan_detail_print', 'payment_add']:
+        casos[nombre] = get(nombre, args=[prestamo.pk])
+    casos['search_cuotas'] = get('search_cuotas', query=f'?loan_id={prestamo.pk}')
+    casos['calculate_amortization_api'] = [(
+        'calculate_amortization_api', 'staff', 'post', reverse('calculate_amortization_api'),
+        {
+            'cliente': cliente.pk, 'tipo_prestamo': prestamo.tipo_prestamo_id or '', 'monto': prestamo.monto,
+            'tasa_interes': prestamo.tasa_interes, 'periodo_tasa': prestamo.periodo_tasa, 'plazo': prestamo.plazo,
+            'frecuencia_pago': prestamo.frecuencia_pago, 'tipo_amortizacion': prestamo.tipo_amortizacion,
+            'manejo_gastos': prestamo.manejo_gastos,
+            'fecha_desembolso': prestamo.fecha_desembolso, 'fecha_inicio_pago': prestamo.fecha_inicio_pago or '',
+        },
+    )]
+
+    if cliente.user is None:
+        for nombre in ['portal_dashboard', 'portal_loan_detail', 'client_change_password', 'portal_request_loan', 'password_reset_confirm']:
+            casos[nombre] = 'El cliente del préstamo no tiene usuario del portal.'
+        return casos
+    casos['portal_dashboard'] = get('portal_dashboard', usuario='cliente')
+    casos['portal_loan_detail'] = get('portal_loan_detail', usuario='cliente', args=[prestamo.pk])
+    casos['client_change_password'] = get('client_change_password', usuario='cliente')
+    casos['portal_request_loan'] = get('portal_request_loan', usuario='cliente')
+    casos['password_reset_confirm'] = get(
+        'password_reset_confirm', usuario=None,
+        args=[urlsafe_base64_encode(force_bytes(cliente.user.pk)), default_token_generator.make_token(cliente.user)],
+    )
+    return casos
+
+
+# --- Medición ---
+
+def _preparar(datos):
+    """
+    Deja la base lista para medir y devuelve un cliente de pruebas por tipo
+    de usuario, con la sesión ya iniciada.
+    """
+    # La configuración de impresión se crea en su primera lectura; no es parte de lo que se mide.
+    ConfiguracionImpresion.load()
+    staff, creado = User.objects.get_or_create(username=USUARIO_STAFF, defaults={'is_staff': True})
+    if creado:
+        staff.set_unusable_password()
+        staff.save(update_fields=['password'])
+    clientes = {None: Client(), 'staff': Client()}
+    clientes['staff'].force_login(staff)
+
+    cliente = datos['cliente']
+    if cliente is not None and cliente.user is not None:
+        # Con la bandera activa el portal redirige todo al cambio de contraseña.
+        if cliente.debe_cambiar_contrasena:
+            Cliente.objects.filter(pk=cliente.pk).update(debe_cambiar_contrasena=False)
+        clientes['cliente'] = Client()
+        clientes['cliente'].force_login(cliente.user)
+    return clientes
+
+
+def _medir(cliente_http, metodo, url, formulario, carpeta_documentos):
+    """Una petición en frío: devuelve (estado HTTP, consultas, milisegundos)."""
+    cache.clear()
+    shutil.rmtree(carpeta_documentos, ignore_errors=True)
+    with CaptureQueriesContext(connection) as consultas:
+        inicio = time.perf_counter()
+        respuesta = getattr(cliente_http, metodo)(url, formulario)
+        if respuesta.streaming:
+            # Las exportaciones y los documentos leen la base mientras se envían.
+            b''.join(respuesta.streaming_content)
+        milisegundos = (time.perf_counter() - inicio) * 1000
+    respuesta.close()
+    return respuesta.status_code, len(consultas.captured_queries), milisegundos
+
+
+def medir_vistas(repeticiones=3, validar_tiempos=True):
+    """
+    Mide cada URL de la app `repeticiones` veces sobre los datos actuales.
+
+    Returns:
+        dict: el informe, con una entrada por medición (consultas, mediana y
+        máximo de milisegundos, presupuesto y problemas), las URLs omitidas y
+        la lista de problemas. Sin `validar_tiempos` solo se comparan las consultas.
+    """
+    datos = _datos_de_muestra()
+    casos = _casos(datos)
+    vistas, omitidas, problemas = [], [], []
+
+    with tempfile.TemporaryDirectory() as carpeta, override_settings(
+        ALLOWED_HOSTS=['testserver'],
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'medicion-vistas'}},
+        DOCUMENTOS_CACHE_DIR=str(Path(carpeta) / 'documentos'),
+        BASIC_AUTH_ENABLED=False,
+    ):
+        clientes_http = _preparar(datos)
+        for nombre_url in nombres_de_urls():
+            if nombre_url in EXCLUIDAS:
+                omitidas.append({'url': nombre_url, 'motivo': EXCLUIDAS[nombre_url]})
+                continue
+            caso = casos.get(nombre_url)
+            if caso is None:
+                problemas.append(f'{nombre_url}: la URL no tiene caso de medición.')
+                continue
+            if isinstance(caso, str):
+                omitidas.append({'url': nombre_url, 'motivo': caso})
+                continue
+
+            for nombre, usuario, metodo, url, formulario in caso:
+                resultados = [
+                    _medir(clientes_http[usuario], metodo, url, formulario, Path(carpeta) / 'documentos')
+                    for _ in range(repeticiones)
+                ]
+                estado = resultados[-1][0]
+                numero_consultas = max(consultas for _, consultas, _ in resultados)
+                tiempos = [milisegundos for _, _, milisegundos in resultados]
+                vista = {
+                    'nombre': nombre, 'url': url, 'usuario': usuario or 'anonimo', 'estado': estado,
+                    'consultas': numero_consultas,
+                    'ms_mediana': round(statistics.median(tiempos), 1), 'ms_maximo': round(max(tiempos), 1),
+                    'presupuesto': None, 'problemas': [],
+                }
+                if estado >= 400:
+                    vista['problemas'].append(f'respondió {estado}')
+                presupuesto = PRESUPUESTOS.get(nombre)
+                if presupuesto is None:
+                    vista['problemas'].append('sin presupuesto declarado')
+                else:
+                    max_consultas, max_ms = presupuesto
+                    vista['presupuesto'] = {'consultas': max_consultas, 'ms': max_ms}
+                    if numero_consultas > max_consultas:
+                        vista['problemas'].append(f'{numero_consultas} consultas (presupuesto {max_consultas})')
+                    if validar_tiempos and vista['ms_mediana'] > max_ms:
+                        vista['problemas'].append(f"{vista['ms_mediana']} ms (presupuesto {max_ms})")
+                problemas.extend(f'{nombre}: {problema}' for problema in vista['problemas'])
+                vistas.append(vista)
+
+    return {
+        'fecha': timezone.now().isoformat(timespec='seconds'),
+        'entorno': {
+            'base_de_datos': connection.vendor, 'django': django.get_version(), 'python': platform.python_version(),
+        },
+        'datos': {
+            'clientes': Cliente.objects.count(), 'prestamos': Prestamo.objects.count(), 'cuotas': Cuota.objects.count(),
+        },
+        'repeticiones': repeticiones,
+        'validar_tiempos': validar_tiempos,
+        'vistas': vistas,
+        'omitidas': omitidas,
+        'problemas': problemas,
+    }
+
+
+def escribir_informe(informe, destino):
+    """Escribe el informe como JSON estable (claves ordenadas) para compararlo con `diff`."""
+    json.dump(informe, destino, ensure_ascii=False, indent=2, sort_keys=True, default=str)
+    destino.write('\n')
@@ -0,0 +1,415 @@
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+from gestion_prestamos import telemetria
+from gestion_prestamos.models import ESTADOS_CUOTA_ABIERTA, ESTADOS_PRESTAMO_EN_COBRO, Capital, Cliente, Cuota, Pago, PortfolioSnapshot, Prestamo
+
+# Cuotas abiertas que todavía no se marcaron como vencidas (el subconjunto de
+# ESTADOS_CUOTA_ABIERTA que usan la ganancia potencial y los préstamos en atraso).
+ESTADOS_CUOTA_NO_VENCIDA = ['pendiente', 'pagada_parcialmente']
+
+# Estados de préstamo que corresponden a dinero efectivamente prestado.
+ESTADOS_PRESTAMO_DESEMBOLSADO = ['aprobado', 'pagado', 'vencido']
+
+# Campos de PortfolioSnapshot que se rellenan desde las métricas.
+CAMPOS_FOTO_CARTERA = [
+    'capital_inicial', 'total_desembolsado', 'total_recibido', 'dinero_en_caja',
+    'dinero_en_la_calle', 'ganancia_realizada', 'num_prestamos_activos',
+    'num_prestamos_en_atraso', 'total_penalidades', 'reconstruida',
+]
+
+# Clave de la foto de métricas en la caché por defecto.
+CLAVE_CACHE_METRICAS = 'dashboard:metricas_financieras'
+
+
+def _suma(campo, filtro=None):
+    """SUM condicional que devuelve 0.00 en lugar de NULL."""
+    return Coalesce(Sum(campo, filter=filtro), Value(Decimal('0.00')), output_field=DecimalField())
+
+
+def obtener_metricas_financieras():
+    """
+    Calcula las cifras principales del negocio con una consulta de agregación
+    condicional por tabla (Capital, Prestamo, Pago, Cuota y Cliente).
+
+    La usan `panel_informativo` y `financial_details`.
+
+    Returns:
+        dict: Métricas financieras y conteos de préstamos y clientes.
+    """
+    hoy = timezone.localdate()
+
+    capital_obj = Capital.objects.first()
+    capital_inicial = capital_obj.monto_inicial if capital_obj else Decimal('0.00')
+
+    prestamos = Prestamo.objects.aggregate(
+        total_desembolsado=_suma('monto'),
+        total_prestamos=Count('id'),
+        num_prestamos_activos=Count('id', filter=Q(estado='aprobado')),
+        num_prestamos_pagados=Count('id', filter=Q(estado='pagado')),
+    )
+
+    total_recibido = Pago.objects.aggregate(total=_suma('monto_pagado'))['total']
+
+    cuotas = Cuota.objects.aggregate(
+        ganancia_realizada=_suma('interes', Q(estado='pagada')),
+        capital_devuelto=_suma('capital', Q(estado='pagada')),
+        ganancia_potencial=_suma(
+            'interes',
+            Q(prestamo__estado='aprobado', estado__in=ESTADOS_CUOTA_NO_VENCIDA)
+        ),
+        total_penalidades=_suma(
+            'monto_penalidad_acumulada',
+            Q(estado__in=ESTADOS_CUOTA_ABIERTA)
+        ),
+        num_prestamos_en_atraso=Count(
+            'prestamo',
+            distinct=True,
+            filter=Q(prestamo__estado='aprobado', fecha_vencimiento__lt=hoy, estado__in=ESTADOS_CUOTA_NO_VENCIDA)
+        ),
+    )
+
+    total_desembolsado = prestamos['total_desembolsado']
+    dinero_en_caja = capital_inicial - total_desembolsado + total_recibido
+    dinero_en_la_calle = total_desembolsado - cuotas['capital_devuelto']
+    total_prestamos = prestamos['total_prestamos']
+
+    return {
+        'capital_inicial': capital_inicial,
+        'capital_configurado': capital_obj is not None,
+        'total_desembolsado': total_desembolsado,
+        'total_recibido': total_recibido,
+        'dinero_en_caja': dinero_en_caja,
+        'dinero_en_la_calle': dinero_en_la_calle,
+        'patrimonio_total': dinero_en_caja + dinero_en_la_calle,
+        'ganancia_realizada': cuotas['ganancia_realizada'],
+        'capital_devuelto': cuotas['capital_devuelto'],
+        'ganancia_potencial': cuotas['ganancia_potencial'],
+        'total_penalidades': cuotas['total_penalidades'],
+        'num_prestamos_activos': prestamos['num_prestamos_activos'],
+        'num_prestamos_pagados': prestamos['num_prestamos_pagados'],
+        'num_prestamos_en_atraso': cuotas['num_prestamos_en_atraso'],
+        'total_prestamos': total_prestamos,
+        'monto_promedio': total_desembolsado / total_prestamos if total_prestamos > 0 else Decimal('0.00'),
+        'total_clientes': Cliente.objects.count(),
+    }
+
+
+def obtener_metricas_cacheadas():
+    """
+    Devuelve la última foto de `obtener_metricas_financieras` guardada en la
+    caché, calculándola si no existe. La foto incluye `calculado_en`, la hora
+    en que se generó, para que el panel muestre su antigüedad.
+
+    Las señales de `dashboard.signals` la borran cuando cambian pagos,
+    préstamos, cuotas, capital o clientes; `DASHBOARD_METRICAS_TTL` limita
+    cuánto puede vivir aunque no haya cambios.
+    """
+    metricas = cache.get(CLAVE_CACHE_METRICAS)
+    telemetria.registrar_lectura_cache('metricas_panel', metricas is not None)
+    if metricas is None:
+        metricas = obtener_metricas_financieras()
+        metricas['calculado_en'] = timezone.now()
+        cache.set(CLAVE_CACHE_METRICAS, metricas, settings.DASHBOARD_METRICAS_TTL)
+    return metricas
+
+
+def invalidar_metricas_cacheadas():
+    """Descarta la foto de métricas; la próxima visita al panel la recalcula."""
+    cache.delete(CLAVE_CACHE_METRICAS)
+
+
+# ==================================================
+# === FOTOS DIARIAS DE LA CARTERA ===
+# ==================================================
+
+def guardar_foto_cartera(fecha=None):
+    """
+    Guarda (o reemplaza) la foto de la cartera del día con las mismas cifras
+    que muestra el panel. Pensada para ejecutarse cada noche.
+
+    Returns:
+        PortfolioSnapshot: La fila guardada.
+    """
+    fecha = fecha or timezone.localdate()
+    metricas = obtener_metricas_financieras()
+    valores = {campo: metricas[campo] for campo in CAMPOS_FOTO_CARTERA if campo in metricas}
+    valores['reconstruida'] = False
+    foto, _ = PortfolioSnapshot.objects.update_or_create(fecha=fecha, defaults=valores)
+    return foto
+
+
+def _valor_acumulado(fechas, acumulados, dia):
+    """Suma de los eventos con fecha <= `dia`, sobre listas ya ordenadas y acumuladas."""
+    posicion = bisect_right(fechas, dia)
+    return acumulados[posicion - 1] if posicion else 0
+
+
+def _serie_acumulada(eventos):
+    """Ordena pares (fecha, valor) y devuelve (fechas, sumas acumuladas)."""
+    eventos = sorted(eventos, key=lambda evento: evento[0])
+    return [fecha for fecha, _ in eventos], list(accumulate(valor for _, valor in eventos))
+
+
+def _contar_por_dia(intervalos, desde, hasta):
+    """
+    Cuenta, para cada día entre `desde` y `hasta`, cuántos intervalos
+    [inicio, fin] lo contienen (`fin=None` significa abierto).
+    """
+    cambios = defaultdict(int)
+    for inicio, fin in intervalos:
+        if fin is not None and fin < max(inicio, desde):
+            continue
+        cambios[max(inicio, desde)] += 1
+        if fin is not None:
+            cambios[fin + timedelta(days=1)] -= 1
+    # Los intervalos que empezaron antes de `desde` se acumularon en `desde`.
+    conteos, actual, dia = {}, 0, desde
+    while dia <= hasta:
+        actual += cambios.get(dia, 0)
+        conteos[dia] = actual
+        dia += timedelta(days=1)
+    return conteos
+
+
+def _unir_intervalos(intervalos):
+    """Fusiona intervalos de días solapados o contiguos de un mismo préstamo."""
+    unidos = []
+    for inicio, fin in sorted(intervalos, key=lambda intervalo: intervalo[0]):
+        if unidos and (unidos[-1][1] is None or inicio <= unidos[-1][1] + timedelta(days=1)):
+            ultimo_fin = unidos[-1][1]
+            unidos[-1][1] = None if ultimo_fin is None or fin is None else max(ultimo_fin, fin)
+        else:
+            unidos.append([inicio, fin])
+    return unidos
+
+
+def reconstruir_fotos_cartera(desde, hasta):
+    """
+    Reconstruye las fotos de la cartera de los días entre `desde` y `hasta`
+    a partir del historial: `Prestamo.fecha_desembolso`, `Pago.fecha_pago`
+    y, para cada cuota pagada, la fecha de su último pago.
+
+    Lee préstamos, pagos (agrupados por día) y cuotas una sola vez y calcula
+    todos los días en memoria, en lugar de repetir las agregaciones por día.
+    Las penalidades no se pueden reconstruir y quedan vacías. Los días que
+    ya tienen foto se sobrescriben.
+
+    Returns:
+        int: Número de días guardados.
+    """
+    if desde > hasta:
+        return 0
+
+    capital_obj = Capital.objects.first()
+    capital_inicial = capital_obj.monto_inicial if capital_obj else Decimal('0.00')
+
+    prestamos = list(Prestamo.objects.values_list('id', 'fecha_desembolso', 'monto', 'estado'))
+    desembolsos = _serie_acumulada((fecha, monto) for _, fecha, monto, _ in prestamos)
+
+    pagos_por_dia = (
+        Pago.objects.annotate(dia=TruncDate('fecha_pago'))
+        .values('dia')
+        .annotate(total=Sum('monto_pagado'))
+        .values_list('dia', 'total')
+    )
+    cobros = _serie_acumulada(pagos_por_dia)
+
+    # Una cuota pagada quedó saldada el día de su último pago; si no tiene
+    # pagos (marcada a mano) se toma su fecha de vencimiento.
+    # El id va en el GROUP BY: sin él, dos cuotas del mismo préstamo con los
+    # mismos valores saldrían en una sola fila y se contarían una vez.
+    cuotas = Cuota.objects.values_list(
+        'id', 'prestamo_id', 'fecha_vencimiento', 'capital', 'interes', 'estado'
+    ).annotate(ultimo_pago=Max('pagos__fecha_pago'))
+
+    capital_devuelto, intereses_cobrados = [], []
+    atrasos_por_prestamo = defaultdict(list)
+    fin_por_prestamo = {}
+    for _, prestamo_id, vencimiento, capital, interes, estado, ultimo_pago in cuotas:
+        saldada = None
+        if estado == 'pagada':
+            saldada = timezone.localdate(ultimo_pago) if ultimo_pago else vencimiento
+            capital_devuelto.append((saldada, capital))
+            intereses_cobrados.append((saldada, interes))
+            fin_por_prestamo[prestamo_id] = max(fin_por_prestamo.get(prestamo_id, saldada), saldada)
+        # En atraso desde el día siguiente al vencimiento hasta el día antes de saldarse.
+        fin_atraso = None if saldada is None else saldada - timedelta(days=1)
+        if fin_atraso is None or fin_atraso > vencimiento:
+            atrasos_por_prestamo[prestamo_id].append((vencimiento + timedelta(days=1), fin_atraso))
+
+    devoluciones = _serie_acumulada(capital_devuelto)
+    ganancias = _serie_acumulada(intereses_cobrados)
+
+    desembolsados = set()
+    periodos_activos = []
+    for pk, fecha, _, estado in prestamos:
+        if estado not in ESTADOS_PRESTAMO_DESEMBOLSADO:
+            continue
+        desembolsados.add(pk)
+        # Un préstamo pagado deja de estar activo el día en que salda su última cuota.
+        fin = None
+        if estado == 'pagado' and pk in fin_por_prestamo:
+            fin = fin_por_prestamo[pk] - timedelta(days=1)
+        periodos_activos.append((fecha, fin))
+    activos = _contar_por_dia(periodos_activos, desde, hasta)
+
+    periodos_en_atraso = []
+    for pk, intervalos in atrasos_por_prestamo.items():
+        if pk in desembolsados:
+            periodos_en_atraso.extend(tuple(intervalo) for intervalo in _unir_intervalos(intervalos))
+    en_atraso = _contar_por_dia(periodos_en_atraso, desde, hasta)
+
+    fotos = []
+    dia = desde
+    while dia <= hasta:
+        total_desembolsado = _valor_acumulado(*desembolsos, dia)
+        total_recibido = _valor_acumulado(*cobros, dia)
+        fotos.append(PortfolioSnapshot(
+            fecha=dia,
+            capital_inicial=capital_inicial,
+            total_desembolsado=total_desembolsado,
+            total_recibido=total_recibido,
+            dinero_en_caja=capital_inicial - total_desembolsado + total_recibido,
+            dinero_en_la_calle=total_desembolsado - _valor_acumulado(*devoluciones, dia),
+            ganancia_realizada=_valor_acumulado(*ganancias, dia),
+            num_prestamos_activos=activos[dia],
+            num_prestamos_en_atraso=en_atraso[dia],
+            total_penalidades=None,
+            reconstruida=True,
+        ))
+        dia += timedelta(days=1)
+
+    PortfolioSnapshot.objects.bulk_create(
+        fotos,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['fecha'],
+        update_fields=CAMPOS_FOTO_CARTERA + ['fecha_generacion'],
+    )
+    return len(fotos)
+
+
+def obtener_serie_cartera(dias=365):
+    """Fotos de los últimos `dias` días, en orden cronológico, listas para graficar."""
+    desde = timezone.localdate() - timedelta(days=dias)
+    return list(
+        PortfolioSnapshot.objects.filter(fecha__gte=desde)
+        .order_by('fecha')
+        .values('fecha', 'dinero_en_la_calle', 'dinero_en_caja', 'ganancia_realizada', 'num_prestamos_en_atraso')
+    )
+
+
+# ==================================================
+# === ANTIGÜEDAD DE LA MORA ===
+# ==================================================
+# Reparte lo vencido y no cobrado por días de atraso. Es una sola consulta
+# GROUP BY tipo de préstamo con una suma condicional por tramo: los tramos se
+# expresan como rangos de `fecha_vencimiento` (no como una resta por fila),
+# así la consulta recorre el índice parcial de cuotas impagas
+# (`cuota_impaga_vencimiento_idx`) solo en la parte ya vencida.
+#
+# Lo pagado de cada cuota se imputa primero a la penalidad, luego al interés
+# y por último al capital, de modo que los tres montos pendientes suman el
+# saldo de la cuota.
+
+# (clave, título, días mínimos, días máximos o None)
+TRAMOS_MORA = [
+    ('1_30', '1 a 30 días', 1, 30),
+    ('31_60', '31 a 60 días', 31, 60),
+    ('61_90', '61 a 90 días', 61, 90),
+    ('90_mas', 'Más de 90 días', 91, None),
+]
+
+CONCEPTOS_MORA = ['capital', 'interes', 'penalidad']
+
+
+def _pendientes_por_concepto():
+    """Expresiones con la penalidad, el interés y el capital aún impagos de cada cuota."""
+    cero = Value(Decimal('0.00'))
+    pagado = F('monto_pagado_acumulado')
+    resto_tras_penalidad = Greatest(pagado - F('monto_penalidad_acumulada'), cero)
+    resto_tras_interes = Greatest(resto_tras_penalidad - F('interes'), cero)
+    return {
+        'penalidad': Greatest(F('monto_penalidad_acumulada') - pagado, cero),
+        'interes': Greatest(F('interes') - resto_tras_penalidad, cero),
+        'capital': Greatest(F('capital') - resto_tras_interes, cero),
+    }
+
+
+def _filtro_tramo(hoy, minimo, maximo):
+    filtro = Q(fecha_vencimiento__lte=hoy - timedelta(days=minimo))
+    if maximo is not None:
+        filtro &= Q(fecha_vencimiento__gte=hoy - timedelta(days=maximo))
+    return filtro
+
+
+def _tramos_vacios():
+    return {
+        clave: {'titulo': titulo, 'cuotas': 0, **{concepto: Decimal('0.00') for concepto in CONCEPTOS_MORA}, 'total': Decimal('0.00')}
+        for clave, titulo, _, _ in TRAMOS_MORA
+    }
+
+
+def obtener_antiguedad_mora(hoy=None):
+    """
+    Lo vencido y no cobrado de los préstamos en cobro, por tramo de días de
+    atraso, en total y por tipo de préstamo.
+
+    Returns:
+        dict: `tramos` (totales por tramo), `tipos` (lista con `id`, `nombre`
+        y sus `tramos`), `total` y `fecha`. Cada tramo trae `cuotas`,
+        `capital`, `interes`, `penalidad` y `total`.
+    """
+    hoy = hoy or timezone.localdate()
+    pendientes = _pendientes_por_concepto()
+
+    agregados = {}
+    for clave, _, minimo, maximo in TRAMOS_MORA:
+        filtro = _filtro_tramo(hoy, minimo, maximo)
+        agregados[f'{clave}__cuotas'] = Count('id', filter=filtro)
+        for concepto, expresion in pendientes.items():
+            agregados[f'{clave}__{concepto}'] = _suma(expresion, filtro)
+
+    filas = (
+        Cuota.objects.filter(
+            estado__in=ESTADOS_CUOTA_ABIERTA,
+            fecha_vencimiento__lt=hoy,
+            prestamo__estado__in=ESTADOS_PRESTAMO_EN_COBRO,
+        )
+        .values('prestamo__tipo_prestamo_id', 'prestamo__tipo_prestamo__nombre')
+        .annotate(**agregados)
+        .order_by('prestamo__tipo_prestamo__nombre')
+    )
+
+    totales = _tramos_vacios()
+    tipos = []
+    for fila in filas:
+        tramos = _tramos_vacios()
+        for clave, tramo in tramos.items():
+            tramo['cuotas'] = fila[f'{clave}__cuotas']
+            for concepto in CONCEPTOS_MORA:
+                tramo[concepto] = fila[f'{clave}__{concepto}']
+            tramo['total'] = sum(tramo[concepto] for concepto in CONCEPTOS_MORA)
+            for campo in ['cuotas', 'total', *CONCEPTOS_MORA]:
+                totales[clave][campo] += tramo[campo]
+        tipos.append({
+            'id': fila['prestamo__tipo_prestamo_id'],
+            'nombre': fila['prestamo__tipo_prestamo__nombre'] or 'Sin tipo',
+            'tramos': tramos,
+            'total': sum(tramo['total'] for tramo in tramos.values()),
+        })
+
+    return {
+        'fecha': hoy,
+        'tramos': totales,
+        'tipos': tipos,
+        'total': sum(tramo['total'] for tramo in totales.values()),
+    }
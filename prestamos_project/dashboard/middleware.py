@@ -1,34 +1,60 @@
 from django.shortcuts import redirect
 from django.urls import reverse
 import base64
+import cProfile
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.http import HttpResponse
 from django.conf import settings
+from gestion_prestamos import telemetria
+from . import perfilado
+
+logger_peticiones = logging.getLogger('dashboard.peticiones')
+logger_lentas = logging.getLogger('dashboard.peticiones_lentas')
+
+# Clave de sesión donde se guarda si el cliente debe cambiar su contraseña.
+# Restablecer la contraseña cierra las sesiones abiertas (cambia el hash de
+# autenticación), así que el valor guardado no queda desactualizado.
+SESION_DEBE_CAMBIAR_CONTRASENA = 'debe_cambiar_contrasena'
 
 class ForcePasswordChangeMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        # Evitar bucles de redirección infinitos; las rutas se resuelven una sola vez
+        self.allowed_paths = frozenset([
+            reverse('client_change_password'),
+            reverse('client_logout')
+        ])
 
     def __call__(self, request):
-        response = self.get_response(request)
-        
+        # Se decide antes de la vista para no renderizar una página que se va a descartar.
         # Solo aplicamos la lógica para usuarios autenticados que no son staff
-        if request.user.is_authenticated and not request.user.is_staff:
-            # Evitar bucles de redirección infinitos
-            allowed_paths = [
-                reverse('client_change_password'), 
-                reverse('client_logout')
-            ]
-            if request.path not in allowed_paths:
-                try:
-                    cliente = request.user.cliente_profile
-                    if cliente.debe_cambiar_contrasena:
-                        # Si la bandera está activa, redirigir a la página de cambio de contraseña
-                        return redirect('client_change_password')
-                except AttributeError:
-                    # El perfil del cliente no existe o no tiene el campo, no hacer nada.
-                    pass
+        if (request.user.is_authenticated and not request.user.is_staff
+                and request.path not in self.allowed_paths
+                and self._debe_cambiar_contrasena(request)):
+            # Si la bandera está activa, redirigir a la página de cambio de contraseña
+            return redirect('client_change_password')
 
-        return response
+        return self.get_response(request)
+
+    @staticmethod
+    def _debe_cambiar_contrasena(request):
+        """Lee la bandera de la sesión y solo consulta el perfil la primera vez."""
+        debe_cambiar = request.session.get(SESION_DEBE_CAMBIAR_CONTRASENA)
+        if debe_cambiar is None:
+            try:
+                debe_cambiar = request.user.cliente_profile.debe_cambiar_contrasena
+            except AttributeError:
+                # El perfil del cliente no existe o no tiene el campo, no hacer nada.
+                debe_cambiar = False
+            request.session[SESION_DEBE_CAMBIAR_CONTRASENA] = debe_cambiar
+        return debe_cambiar
 
 class BasicAuthMiddleware:
     def __init__(self, get_response):
@@ -62,3 +88,123 @@ class BasicAuthMiddleware:
         response = HttpResponse("Acceso no autorizado. Se requiere una llave maestra.", status=401)
         response['WWW-Authenticate'] = 'Basic realm="Acceso Restringido al Sistema de Préstamos"'
         return response
+
+
+class _ContadorConsultas:
+    """
+    `execute_wrapper` que suma las consultas de una petición y su tiempo, y
+    guarda las cinco más lentas para el log de peticiones lentas.
+    """
+
+    def __init__(self, umbral_lenta_ms):
+        self.cantidad = 0
+        self.segundos = 0.0
+        self.umbral_lenta = umbral_lenta_ms / 1000
+        self.hay_lenta = False
+        self.mas_lentas = []  # montículo de (duración, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.cantidad += 1
+            self.segundos += duracion
+            self.hay_lenta = self.hay_lenta or duracion >= self.umbral_lenta
+            if len(self.mas_lentas) < 5:
+                heapq.heappush(self.mas_lentas, (duracion, sql))
+            elif duracion > self.mas_lentas[0][0]:
+                heapq.heapreplace(self.mas_lentas, (duracion, sql))
+
+
+class MedicionPeticionesMiddleware:
+    """
+    Mide cada petición: consultas SQL y su tiempo (con `execute_wrapper` en
+    todas las conexiones), tiempo fuera de la base (vista, plantillas y
+    middleware) y tiempo total. Lo anota en el log 'dashboard.peticiones' y en
+    la telemetría de /metrics, lo envía en la cabecera Server-Timing y manda
+    las peticiones lentas, con sus consultas más lentas, al log
+    'dashboard.peticiones_lentas'.
+
+    En las respuestas en streaming (exportaciones, documentos) el contenido se
+    genera después de este punto, así que lo que se lee al enviarlo no se cuenta.
+    """
+
+    def __init__(self, get_response):
+        if not settings.MEDICION_PETICIONES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        contador = _ContadorConsultas(settings.CONSULTA_LENTA_MS)
+        inicio = time.perf_counter()
+        with ExitStack() as pila:
+            for conexion in connections.all():
+                pila.enter_context(conexion.execute_wrapper(contador))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - inicio) * 1000
+        db_ms = contador.segundos * 1000
+        app_ms = max(total_ms - db_ms, 0)
+
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={db_ms:.1f};desc="{contador.cantidad} consultas", '
+                f'app;dur={app_ms:.1f}, total;dur={total_ms:.1f}'
+            )
+
+        vista = getattr(request.resolver_match, 'view_name', None) or '-'
+        argumentos = (
+            request.method, request.path, vista, response.status_code, contador.cantidad, db_ms, app_ms, total_ms
+        )
+        formato = '%s %s vista=%s estado=%s consultas=%d db=%.1fms app=%.1fms total=%.1fms'
+        logger_peticiones.info(formato, *argumentos)
+        telemetria.incrementar('prestamos_peticiones_total', vista=vista, metodo=request.method, estado=str(response.status_code))
+        telemetria.observar('prestamos_peticion_segundos', total_ms / 1000, vista=vista)
+
+        if (total_ms >= settings.PETICION_LENTA_MS or contador.cantidad >= settings.PETICION_LENTA_CONSULTAS
+                or contador.hay_lenta):
+            # SQL recortado para que el log siga siendo legible.
+            detalle = ''.join(
+                f'\n  {duracion * 1000:.1f}ms {sql[:500]}' for duracion, sql in sorted(contador.mas_lentas, reverse=True)
+            )
+            logger_lentas.warning(formato + '%s', *argumentos, detalle)
+        return response
+
+
+class PerfiladoPeticionesMiddleware:
+    """
+    Ejecuta bajo cProfile las peticiones de un usuario staff que traen un
+    token de perfilado válido (ver dashboard.perfilado) y guarda el perfil.
+    De esas peticiones se perfila a lo sumo una de cada PERFILADO_MUESTREO
+    por proceso, y nunca dos a la vez. La respuesta perfilada lleva en la
+    cabecera X-Perfil el nombre de los archivos.
+    """
+
+    # cProfile no admite dos perfiles activos a la vez de forma fiable.
+    _bloqueo = threading.Lock()
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.candidatas = itertools.count()
+
+    def __call__(self, request):
+        token = perfilado.token_de_la_peticion(request)
+        if (not token or not perfilado.token_valido(token, request.user)
+                or next(self.candidatas) % max(settings.PERFILADO_MUESTREO, 1)):
+            return self.get_response(request)
+        if not self._bloqueo.acquire(blocking=False):
+            return self.get_response(request)
+
+        try:
+            perfil = cProfile.Profile()
+            inicio = time.perf_counter()
+            response = perfil.runcall(self.get_response, request)
+            segundos = time.perf_counter() - inicio
+        finally:
+            self._bloqueo.release()
+        try:
+            response['X-Perfil'] = perfilado.guardar_perfil(perfil, request, response, segundos)
+        except OSError:
+            logger_peticiones.exception('No se pudo guardar el perfil de %s', request.path)
+        return response
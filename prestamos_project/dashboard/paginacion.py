@@ -0,0 +1,178 @@
+import base64
+import json
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+# ==================================================
+# === PAGINACIÓN POR CURSOR (KEYSET) ===
+# ==================================================
+# En lugar de OFFSET, cada página pide "las filas que vienen después de la
+# última que se mostró", comparando las columnas del orden. La base de datos
+# salta directo al punto con el índice, así que ir a la página 500 cuesta lo
+# mismo que ir a la primera. El orden siempre debe terminar en una columna
+# única (normalmente 'id') para que el cursor sea estable.
+
+PARAMETRO_CURSOR = 'cursor'
+
+
+class CursorInvalido(ValueError):
+    """El cursor de la URL no se pudo interpretar (manipulado o de otro orden)."""
+
+
+class PaginaKeyset:
+    """Una página de resultados con los cursores para moverse a la siguiente o a la anterior."""
+
+    def __init__(self, objetos, cursor_siguiente, cursor_anterior):
+        self.object_list = objetos
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    @property
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+def _resolver_campo(modelo, ruta):
+    """Devuelve el campo del modelo al que apunta una ruta como 'prestamo__cliente__nombres'."""
+    *relaciones, nombre = ruta.split('__')
+    for relacion in relaciones:
+        modelo = modelo._meta.get_field(relacion).related_model
+    if nombre == 'pk':
+        return modelo._meta.pk
+    return modelo._meta.get_field(nombre)
+
+
+def _valor(objeto, ruta):
+    """Lee una ruta con '__' sobre un objeto ya cargado."""
+    for parte in ruta.split('__'):
+        objeto = getattr(objeto, parte)
+    return objeto
+
+
+def _codificar_cursor(valores, direccion):
+    datos = json.dumps({'v': valores, 'd': direccion}, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+
+def _decodificar_cursor(cursor, queryset, campos):
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        valores, direccion = datos['v'], datos['d']
+        if direccion not in ('s', 'a') or len(valores) != len(campos):
+            raise CursorInvalido(cursor)
+        convertidos = []
+        for campo, valor in zip(campos, valores):
+            try:
+                campo_modelo = _resolver_campo(queryset.model, campo)
+            except FieldDoesNotExist:
+                campo_modelo = queryset.query.annotations[campo].output_field
+            convertidos.append(campo_modelo.to_python(valor))
+        return convertidos, direccion
+    except CursorInvalido:
+        raise
+    except Exception as error:
+        raise CursorInvalido(cursor) from error
+
+
+def _filtro_despues_de(campos, valores, hacia_atras):
+    """
+    Construye (a > x) OR (a = x AND b > y) OR ... respetando el sentido de
+    cada columna; `hacia_atras` invierte todas las comparaciones.
+    """
+    condicion = Q()
+    for posicion, (campo, valor) in enumerate(zip(campos, valores)):
+        descendente = campo.startswith('-')
+        nombre = campo.lstrip('-')
+        operador = 'lt' if descendente != hacia_atras else 'gt'
+        tramo = Q(**{f'{nombre}__{operador}': valor})
+        for campo_previo, valor_previo in zip(campos[:posicion], valores[:posicion]):
+            tramo &= Q(**{campo_previo.lstrip('-'): valor_previo})
+        condicion |= tramo
+    return condicion
+
+
+def _invertir(campo):
+    return campo[1:] if campo.startswith('-') else f'-{campo}'
+
+
+def paginar_keyset(queryset, orden, cursor=None, por_pagina=25):
+    """
+    Devuelve una `PaginaKeyset` de `queryset` ordenado por `orden`.
+
+    Args:
+        queryset (QuerySet): Consulta ya filtrada.
+        orden (list): Campos del orden, con '-' para descendente; el último
+            debe ser único (p. ej. ['-fecha_creacion', '-id']).
+        cursor (str): Valor del parámetro `cursor` de la URL, o None para la
+            primera página.
+        por_pagina (int): Filas por página.
+
+    Raises:
+        CursorInvalido: Si el cursor no corresponde a este orden.
+    """
+    nombres = [campo.lstrip('-') for campo in orden]
+    hacia_atras = False
+    if cursor:
+        valores, direccion = _decodificar_cursor(cursor, queryset, nombres)
+        hacia_atras = direccion == 'a'
+        queryset = queryset.filter(_filtro_despues_de(orden, valores, hacia_atras))
+
+    orden_consulta = [_invertir(campo) for campo in orden] if hacia_atras else orden
+    filas = list(queryset.order_by(*orden_consulta)[:por_pagina + 1])
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    if hacia_atras:
+        filas.reverse()
+
+    def cursor_de(objeto, direccion):
+        return _codificar_cursor([_valor(objeto, nombre) for nombre in nombres], direccion)
+
+    # Hacia adelante: hay anterior si se llegó con cursor. Hacia atrás: hay
+    # siguiente siempre (se viene de ahí) y anterior solo si sobró una fila.
+    hay_siguiente = hay_mas if not hacia_atras else bool(cursor)
+    hay_anterior = bool(cursor) if not hacia_atras else hay_mas
+    return PaginaKeyset(
+        filas,
+        cursor_de(filas[-1], 's') if filas and hay_siguiente else None,
+        cursor_de(filas[0], 'a') if filas and hay_anterior else None,
+    )
+
+
+def paginar_request(request, queryset, orden, por_pagina=25):
+    """
+    Pagina con el cursor que venga en `request.GET`. Un cursor roto o de
+    otro orden vuelve a la primera página en lugar de fallar.
+    """
+    try:
+        return paginar_keyset(queryset, orden, request.GET.get(PARAMETRO_CURSOR), por_pagina)
+    except CursorInvalido:
+        return paginar_keyset(queryset, orden, None, por_pagina)
+
+
+class PaginacionKeysetMixin:
+    """
+    Sustituye la paginación por OFFSET de `ListView` por `paginar_keyset`.
+    La vista define `orden_keyset` y `paginate_by`; la plantilla recibe
+    `page_obj` (una `PaginaKeyset`) igual que antes.
+    """
+    orden_keyset = ['-id']
+
+    def paginate_queryset(self, queryset, page_size):
+        pagina = paginar_request(self.request, queryset, self.orden_keyset, page_size)
+        return None, pagina, pagina.object_list, pagina.has_other_pages
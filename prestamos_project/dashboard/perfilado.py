@@ -0,0 +1,77 @@
+import io
+import os
+import pstats
+import re
+from pathlib import Path
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+# ==================================================
+# === PERFILADO DE PETICIONES A PEDIDO ===
+# ==================================================
+# Para ver por qué una petición concreta es lenta en producción (por ejemplo
+# `loan_detail` de un préstamo en particular), un usuario staff la repite con
+# un token firmado en `?perfilar=<token>` o en la cabecera `X-Perfilar`. La
+# petición se ejecuta bajo cProfile (ver PerfiladoPeticionesMiddleware) y se
+# guardan en PERFILES_DIR el .prof, para abrirlo con pstats o snakeviz, y un
+# resumen en texto con las PERFILADO_TOP funciones de mayor tiempo acumulado.
+#
+# El token se genera con `manage.py token_perfilado <usuario>`, vale para ese
+# usuario y vence a los PERFILADO_VIGENCIA segundos. Las peticiones sin token
+# no pagan nada: el middleware solo mira si el parámetro o la cabecera existen.
+
+PARAMETRO_PERFILADO = 'perfilar'
+CABECERA_PERFILADO = 'HTTP_X_PERFILAR'
+_SAL = 'dashboard.perfilado'
+
+
+def firmar_token(usuario):
+    """Token de perfilado para `usuario`; vence según PERFILADO_VIGENCIA."""
+    return signing.TimestampSigner(salt=_SAL).sign(str(usuario.pk))
+
+
+def token_de_la_peticion(request):
+    """El token enviado en el parámetro o la cabecera, o None."""
+    return request.GET.get(PARAMETRO_PERFILADO) or request.META.get(CABECERA_PERFILADO)
+
+
+def token_valido(token, usuario):
+    """Indica si `token` fue firmado para `usuario`, sigue vigente y el usuario es staff."""
+    if not (usuario.is_authenticated and usuario.is_staff):
+        return False
+    try:
+        pk = signing.TimestampSigner(salt=_SAL).unsign(token, max_age=settings.PERFILADO_VIGENCIA)
+    except signing.BadSignature:
+        return False
+    return pk == str(usuario.pk)
+
+
+def guardar_perfil(perfil, request, response, segundos):
+    """
+    Escribe `perfil` (un cProfile.Profile ya detenido) como .prof y su
+    resumen en .txt. Devuelve el nombre base de los archivos.
+    """
+    carpeta = Path(settings.PERFILES_DIR)
+    carpeta.mkdir(parents=True, exist_ok=True)
+    vista = getattr(request.resolver_match, 'view_name', None) or request.path
+    nombre = f"{timezone.now():%Y%m%d-%H%M%S}-{re.sub(r'[^A-Za-z0-9_-]+', '_', vista).strip('_')}-{os.getpid()}"
+    # Dos perfiles de la misma vista en el mismo segundo no se pisan.
+    base, numero = nombre, 1
+    while (carpeta / f'{nombre}.prof').exists():
+        numero += 1
+        nombre = f'{base}-{numero}'
+
+    perfil.dump_stats(carpeta / f'{nombre}.prof')
+    # El token no se copia al resumen.
+    parametros = request.GET.copy()
+    parametros.pop(PARAMETRO_PERFILADO, None)
+    url = request.path + (f'?{parametros.urlencode()}' if parametros else '')
+    resumen = io.StringIO()
+    resumen.write(
+        f'{request.method} {url}\n'
+        f'vista={vista} estado={response.status_code} total={segundos * 1000:.1f}ms\n\n'
+    )
+    pstats.Stats(perfil, stream=resumen).strip_dirs().sort_stats('cumulative').print_stats(settings.PERFILADO_TOP)
+    (carpeta / f'{nombre}.txt').write_text(resumen.getvalue(), encoding='utf-8')
+    return nombre
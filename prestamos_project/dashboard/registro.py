@@ -0,0 +1,21 @@
+import os
+from logging.handlers import RotatingFileHandler
+
+# ==================================================
+# === HANDLERS DE LOG ===
+# ==================================================
+# Se cargan desde LOGGING al configurar Django, antes que las apps: este
+# módulo no debe importar nada de Django.
+
+
+class ArchivoRotativoHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler que crea la carpeta del archivo recién al abrirlo.
+    Con `delay=True` eso ocurre en el primer registro, así que importar la
+    configuración no escribe nada en disco (despliegues de solo lectura,
+    herramientas que solo leen los settings).
+    """
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
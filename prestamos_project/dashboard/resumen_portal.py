@@ -0,0 +1,80 @@
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import DecimalField, F, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from gestion_prestamos import telemetria
+from gestion_prestamos.models import Cuota, Prestamo
+
+# ==================================================
+# === RESUMEN DEL PORTAL DE CLIENTES ===
+# ==================================================
+# Lo que muestra `portal_dashboard` sale de una sola consulta anotada por
+# cliente y se guarda en la caché. `dashboard.signals` borra el resumen del
+# cliente cuando cambian sus préstamos, cuotas o pagos.
+
+ESTADOS_CUOTA_POR_PAGAR = ['pendiente', 'pagada_parcialmente', 'vencida']
+
+
+def clave_resumen_portal(cliente_id):
+    return f'portal:resumen:{cliente_id}'
+
+
+def _proxima_cuota(campo):
+    """Subconsulta con `campo` de la cuota por pagar que vence primero en cada préstamo."""
+    return Subquery(
+        Cuota.objects.filter(prestamo=OuterRef('pk'), estado__in=ESTADOS_CUOTA_POR_PAGAR)
+        .order_by('fecha_vencimiento', 'numero_cuota')
+        .values(campo)[:1]
+    )
+
+
+def calcular_resumen_portal(cliente_id):
+    """
+    Arma el resumen del portal de un cliente con una sola consulta.
+
+    Returns:
+        dict: `prestamos` (lista de diccionarios, del más reciente al más
+        antiguo, cada uno con su saldo y su próxima cuota) y `prestamo_activo`
+        (el primero en estado 'aprobado', o None).
+    """
+    prestamos = list(
+        Prestamo.objects.filter(cliente_id=cliente_id)
+        .annotate(
+            saldo_pendiente=Coalesce(
+                Sum(F('cuotas__monto_cuota') - F('cuotas__monto_pagado_acumulado')),
+                Value(Decimal('0.00')),
+                output_field=DecimalField()
+            ),
+            proxima_cuota_fecha=Min('cuotas__fecha_vencimiento', filter=Q(cuotas__estado__in=ESTADOS_CUOTA_POR_PAGAR)),
+            proxima_cuota_numero=_proxima_cuota('numero_cuota'),
+            proxima_cuota_monto=_proxima_cuota('monto_cuota'),
+        )
+        .order_by('-fecha_desembolso', '-id')
+        .values(
+            'id', 'monto', 'estado', 'fecha_creacion', 'fecha_aprobacion', 'saldo_pendiente',
+            'proxima_cuota_fecha', 'proxima_cuota_numero', 'proxima_cuota_monto',
+        )
+    )
+    etiquetas_estado = dict(Prestamo.ESTADO_CHOICES)
+    for prestamo in prestamos:
+        prestamo['estado_display'] = etiquetas_estado.get(prestamo['estado'], prestamo['estado'])
+
+    prestamo_activo = next((p for p in prestamos if p['estado'] == 'aprobado'), None)
+    return {'prestamos': prestamos, 'prestamo_activo': prestamo_activo}
+
+
+def obtener_resumen_portal(cliente_id):
+    """Devuelve el resumen del portal desde la caché, calculándolo si hace falta."""
+    clave = clave_resumen_portal(cliente_id)
+    resumen = cache.get(clave)
+    telemetria.registrar_lectura_cache('resumen_portal', resumen is not None)
+    if resumen is None:
+        resumen = calcular_resumen_portal(cliente_id)
+        cache.set(clave, resumen, settings.PORTAL_RESUMEN_TTL)
+    return resumen
+
+
+def invalidar_resumen_portal(cliente_ids):
+    """Borra el resumen en caché de los clientes indicados."""
+    cache.delete_many([clave_resumen_portal(cliente_id) for cliente_id in set(cliente_ids)])
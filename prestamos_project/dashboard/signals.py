@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from gestion_prestamos.models import Capital, Cliente, Cuota, Garante, Pago, Prestamo, cartera_modificada
+from .documentos import invalidar_documentos
+from .metricas import invalidar_metricas_cacheadas
+from .resumen_portal import invalidar_resumen_portal
+
+@receiver(post_save, sender=Pago)
+@receiver(post_delete, sender=Pago)
+@receiver(post_save, sender=Prestamo)
+@receiver(post_delete, sender=Prestamo)
+@receiver(post_save, sender=Cuota)
+@receiver(post_delete, sender=Cuota)
+@receiver(post_save, sender=Capital)
+@receiver(post_delete, sender=Capital)
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+@receiver(cartera_modificada)
+def invalidar_metricas_del_panel(sender, **kwargs):
+    """
+    Borra la foto de métricas del panel cuando cambia algún dato que la
+    alimenta. Se espera al commit para que otra petición no vuelva a
+    cachear los valores de antes del cambio.
+    """
+    transaction.on_commit(invalidar_metricas_cacheadas)
+
+
+def _invalidar_portal_al_confirmar(cliente_ids):
+    cliente_ids = [cliente_id for cliente_id in cliente_ids if cliente_id is not None]
+    if cliente_ids:
+        transaction.on_commit(lambda: invalidar_resumen_portal(cliente_ids))
+
+@receiver(post_save, sender=Prestamo)
+@receiver(post_delete, sender=Prestamo)
+def invalidar_portal_por_prestamo(sender, instance, **kwargs):
+    """Borra el resumen del portal del dueño del préstamo."""
+    _invalidar_portal_al_confirmar([instance.cliente_id])
+
+@receiver(post_save, sender=Cuota)
+@receiver(post_delete, sender=Cuota)
+def invalidar_portal_por_cuota(sender, instance, **kwargs):
+    """Borra el resumen del portal del cliente de la cuota."""
+    if Cuota.prestamo.is_cached(instance):
+        cliente_ids = [instance.prestamo.cliente_id]
+    else:
+        cliente_ids = Prestamo.objects.filter(pk=instance.prestamo_id).values_list('cliente_id', flat=True)
+    _invalidar_portal_al_confirmar(cliente_ids)
+
+@receiver(post_save, sender=Pago)
+@receiver(post_delete, sender=Pago)
+def invalidar_portal_por_pago(sender, instance, **kwargs):
+    """Borra el resumen del portal del cliente que hizo el pago."""
+    cliente_ids = Cuota.objects.filter(pk=instance.cuota_id).values_list('prestamo__cliente_id', flat=True)
+    _invalidar_portal_al_confirmar(cliente_ids)
+
+@receiver(cartera_modificada)
+def invalidar_portal_por_escritura_masiva(sender, prestamo_ids=(), **kwargs):
+    """
+    Igual que los anteriores, para los pagos y cuotas escritos con
+    bulk_create/bulk_update. Los clientes se buscan ya confirmada la
+    transacción para no sumar consultas a `registrar_pago` ni a `generar_cuotas`.
+    """
+    prestamo_ids = list(prestamo_ids)
+    if prestamo_ids:
+        transaction.on_commit(lambda: invalidar_resumen_portal(
+            Prestamo.objects.filter(pk__in=prestamo_ids).values_list('cliente_id', flat=True)
+        ))
+
+
+# --- Documentos imprimibles en caché (ver documentos.py) ---
+
+@receiver(post_save, sender=Prestamo)
+@receiver(post_delete, sender=Prestamo)
+def invalidar_documentos_por_prestamo(sender, instance, **kwargs):
+    invalidar_documentos('prestamo', [instance.pk])
+
+@receiver(post_save, sender=Cuota)
+@receiver(post_delete, sender=Cuota)
+def invalidar_documentos_por_cuota(sender, instance, **kwargs):
+    invalidar_documentos('prestamo', [instance.prestamo_id])
+
+@receiver(post_save, sender=Pago)
+@receiver(post_delete, sender=Pago)
+def invalidar_documentos_por_pago(sender, instance, **kwargs):
+    # La cuota del pago ya viene cargada cuando se registra desde registrar_pago.
+    if Pago.cuota.is_cached(instance):
+        invalidar_documentos('prestamo', [instance.cuota.prestamo_id])
+    else:
+        invalidar_documentos('prestamo', Cuota.objects.filter(pk=instance.cuota_id).values_list('prestamo_id', flat=True))
+
+@receiver(post_save, sender=Cliente)
+@receiver(post_delete, sender=Cliente)
+def invalidar_documentos_por_cliente(sender, instance, **kwargs):
+    invalidar_documentos('cliente', [instance.pk])
+
+@receiver(post_save, sender=Garante)
+@receiver(post_delete, sender=Garante)
+def invalidar_documentos_por_garante(sender, instance, **kwargs):
+    invalidar_documentos('garante', [instance.pk])
+
+@receiver(cartera_modificada)
+def invalidar_documentos_por_escritura_masiva(sender, prestamo_ids=(), **kwargs):
+    invalidar_documentos('prestamo', prestamo_ids)
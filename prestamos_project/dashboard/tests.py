@@ -1,3 +1,895 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+import zipfile
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from gestion_prestamos import referencias, telemetria
+from gestion_prestamos.models import Capital, Cliente, Cuota, Pago, PortfolioSnapshot, Prestamo, TipoPrestamo
+from gestion_prestamos.utils import generar_cuotas
+
+from . import checks, documentos, medicion_vistas
+from .metricas import (
+    CLAVE_CACHE_METRICAS,
+    obtener_antiguedad_mora,
+    obtener_metricas_cacheadas,
+    obtener_metricas_financieras,
+    reconstruir_fotos_cartera,
+)
+from .middleware import SESION_DEBE_CAMBIAR_CONTRASENA
+from .paginacion import CursorInvalido, paginar_keyset
+from .registro import ArchivoRotativoHandler
+from .resumen_portal import calcular_resumen_portal, clave_resumen_portal, obtener_resumen_portal
+from .views import POR_PAGINA
+
+
+class MetricasFinancierasTests(TestCase):
+
+    def setUp(self):
+        Capital.objects.create(monto_inicial=Decimal('100000.00'))
+        cliente = Cliente.objects.create(nombres='Rosa', apellidos='Peña', numero_documento='00177777777')
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente, monto=Decimal('12000.00'), tasa_interes=Decimal('12.00'), plazo=12,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2025, 1, 1), estado='aprobado',
+        )
+        generar_cuotas(self.prestamo)
+        Prestamo.objects.create(
+            cliente=cliente, monto=Decimal('3000.00'), tasa_interes=Decimal('10.00'), plazo=6,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2025, 1, 1), estado='pagado',
+        )
+
+    def test_cifras_coinciden_con_los_datos(self):
+        primera = self.prestamo.cuotas.get(numero_cuota=1)
+        self.prestamo.registrar_pago(primera.monto_cuota)
+
+        metricas = obtener_metricas_financieras()
+
+        self.assertEqual(metricas['total_desembolsado'], Decimal('15000.00'))
+        self.assertEqual(metricas['total_recibido'], primera.monto_cuota)
+        self.assertEqual(metricas['dinero_en_caja'], Decimal('85000.00') + primera.monto_cuota)
+        self.assertEqual(metricas['dinero_en_la_calle'], Decimal('15000.00') - primera.capital)
+        self.assertEqual(metricas['ganancia_realizada'], primera.interes)
+        self.assertEqual(metricas['num_prestamos_activos'], 1)
+        self.assertEqual(metricas['num_prestamos_pagados'], 1)
+        self.assertEqual(metricas['num_prestamos_en_atraso'], 1)
+        self.assertEqual(metricas['monto_promedio'], Decimal('7500.00'))
+        self.assertEqual(metricas['total_clientes'], 1)
+
+    def test_consultas_constantes(self):
+        with self.assertNumQueries(5):
+            obtener_metricas_financieras()
+
+    def test_vistas_del_panel(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        for nombre in ('panel_informativo', 'financial_details'):
+            self.assertEqual(self.client.get(reverse(nombre)).status_code, 200)
+
+
+class MetricasCacheadasTests(TestCase):
+
+    def setUp(self):
+        cache.delete(CLAVE_CACHE_METRICAS)
+        self.capital = Capital.objects.create(monto_inicial=Decimal('50000.00'))
+
+    def test_reutiliza_la_foto_hasta_que_cambian_los_datos(self):
+        primera = obtener_metricas_cacheadas()
+        with self.assertNumQueries(0):
+            self.assertEqual(obtener_metricas_cacheadas(), primera)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.capital.monto_inicial = Decimal('60000.00')
+            self.capital.save()
+
+        nueva = obtener_metricas_cacheadas()
+        self.assertEqual(nueva['capital_inicial'], Decimal('60000.00'))
+        self.assertGreaterEqual(nueva['calculado_en'], primera['calculado_en'])
+
+    def test_los_pagos_masivos_invalidan_la_foto(self):
+        cliente = Cliente.objects.create(nombres='Luis', apellidos='Díaz', numero_documento='00188888888')
+        prestamo = Prestamo.objects.create(
+            cliente=cliente, monto=Decimal('1000.00'), tasa_interes=Decimal('12.00'), plazo=4,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2025, 1, 1), estado='aprobado',
+        )
+        generar_cuotas(prestamo)
+        obtener_metricas_cacheadas()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            prestamo.registrar_pago(Decimal('100.00'))
+
+        self.assertIsNone(cache.get(CLAVE_CACHE_METRICAS))
+        self.assertEqual(obtener_metricas_cacheadas()['total_recibido'], Decimal('100.00'))
+
+
+class FotosCarteraTests(TestCase):
+
+    def setUp(self):
+        Capital.objects.create(monto_inicial=Decimal('5000.00'))
+        cliente = Cliente.objects.create(nombres='Ana', apellidos='Reyes', numero_documento='00199999999')
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente, monto=Decimal('1000.00'), tasa_interes=Decimal('12.00'), plazo=2,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2025, 1, 1), estado='aprobado',
+        )
+        generar_cuotas(self.prestamo)
+        self.cuota_1, self.cuota_2 = self.prestamo.cuotas.order_by('numero_cuota')
+        self.dia_pago = self.cuota_1.fecha_vencimiento + datetime.timedelta(days=4)
+        pagos = self.prestamo.registrar_pago(self.cuota_1.monto_cuota)
+        Pago.objects.filter(pk__in=[p.pk for p in pagos]).update(
+            fecha_pago=timezone.make_aware(datetime.datetime.combine(self.dia_pago, datetime.time(10)))
+        )
+
+    def test_reconstruye_el_historial_dia_a_dia(self):
+        desde = datetime.date(2024, 12, 31)
+        hasta = self.cuota_2.fecha_vencimiento + datetime.timedelta(days=2)
+        dias = reconstruir_fotos_cartera(desde, hasta)
+        self.assertEqual(dias, (hasta - desde).days + 1)
+
+        fotos = {f.fecha: f for f in PortfolioSnapshot.objects.all()}
+        antes = fotos[desde]
+        self.assertEqual((antes.total_desembolsado, antes.num_prestamos_activos), (Decimal('0.00'), 0))
+        self.assertEqual(antes.dinero_en_caja, Decimal('5000.00'))
+
+        un_dia = datetime.timedelta(days=1)
+        atrasos = [
+            fotos[self.cuota_1.fecha_vencimiento].num_prestamos_en_atraso,
+            fotos[self.cuota_1.fecha_vencimiento + un_dia].num_prestamos_en_atraso,
+            fotos[self.dia_pago].num_prestamos_en_atraso,
+            fotos[self.cuota_2.fecha_vencimiento + un_dia].num_prestamos_en_atraso,
+        ]
+        self.assertEqual(atrasos, [0, 1, 0, 1])
+
+        self.assertEqual(fotos[self.dia_pago - un_dia].ganancia_realizada, Decimal('0.00'))
+        pagado = fotos[self.dia_pago]
+        self.assertEqual(pagado.ganancia_realizada, self.cuota_1.interes)
+        self.assertEqual(pagado.dinero_en_la_calle, Decimal('1000.00') - self.cuota_1.capital)
+        self.assertEqual(pagado.dinero_en_caja, Decimal('4000.00') + self.cuota_1.monto_cuota)
+        self.assertEqual(pagado.num_prestamos_activos, 1)
+        self.assertTrue(pagado.reconstruida)
+        self.assertIsNone(pagado.total_penalidades)
+
+        # El último día reconstruido coincide con las cifras en vivo.
+        metricas = obtener_metricas_financieras()
+        ultima = fotos[hasta]
+        self.assertEqual(ultima.dinero_en_la_calle, metricas['dinero_en_la_calle'])
+        self.assertEqual(ultima.ganancia_realizada, metricas['ganancia_realizada'])
+        self.assertEqual(ultima.dinero_en_caja, metricas['dinero_en_caja'])
+
+    def test_cuotas_con_los_mismos_valores_se_cuentan_por_separado(self):
+        pago = self.cuota_1.pagos.get()
+        Pago.objects.create(cuota=self.cuota_2, monto_pagado=self.cuota_1.monto_cuota, fecha_pago=pago.fecha_pago)
+        Cuota.objects.filter(pk=self.cuota_2.pk).update(
+            fecha_vencimiento=self.cuota_1.fecha_vencimiento, capital=self.cuota_1.capital,
+            interes=self.cuota_1.interes, estado='pagada',
+        )
+
+        reconstruir_fotos_cartera(self.dia_pago, self.dia_pago)
+
+        foto = PortfolioSnapshot.objects.get(fecha=self.dia_pago)
+        self.assertEqual(foto.ganancia_realizada, 2 * self.cuota_1.interes)
+        self.assertEqual(foto.dinero_en_la_calle, Decimal('1000.00') - 2 * self.cuota_1.capital)
+
+    def test_comando_nocturno_guarda_la_foto_del_dia(self):
+        call_command('tomar_foto_cartera', stdout=StringIO())
+        call_command('tomar_foto_cartera', stdout=StringIO())
+
+        foto = PortfolioSnapshot.objects.get()
+        self.assertEqual(foto.fecha, timezone.localdate())
+        self.assertFalse(foto.reconstruida)
+        self.assertEqual(foto.dinero_en_la_calle, obtener_metricas_financieras()['dinero_en_la_calle'])
+
+
+class AntiguedadMoraTests(TestCase):
+
+    def setUp(self):
+        self.hoy = datetime.date(2025, 6, 30)
+        tipo = TipoPrestamo.objects.create(nombre='Tipo de prueba M', tasa_interes_predeterminada=Decimal('12.00'), monto_maximo=Decimal('50000.00'), plazo_maximo_meses=12)
+        con_tipo = self._prestamo('00255500000', tipo_prestamo=tipo)
+        sin_tipo = self._prestamo('00255500001')
+        saldado = self._prestamo('00255500002', estado='pagado')
+        # (préstamo, días de atraso, estado, penalidad, pagado)
+        for numero, (prestamo, dias, estado, penalidad, pagado) in enumerate([
+            (con_tipo, 10, 'pagada_parcialmente', '5.00', '15.00'),  # cubre la penalidad y 10 de interés
+            (con_tipo, 30, 'pendiente', '0.00', '0.00'),
+            (con_tipo, 31, 'vencida', '0.00', '0.00'),
+            (con_tipo, 200, 'pagada_parcialmente', '30.00', '140.00'),  # cubre penalidad, interés y 90 de capital
+            (con_tipo, 5, 'pagada', '0.00', '120.00'),
+            (con_tipo, 0, 'pendiente', '0.00', '0.00'),
+            (sin_tipo, 61, 'vencida', '2.00', '0.00'),
+            (sin_tipo, 91, 'pendiente', '0.00', '0.00'),
+            (saldado, 40, 'pendiente', '0.00', '0.00'),
+        ], start=1):
+            Cuota.objects.create(
+                prestamo=prestamo, numero_cuota=numero, fecha_vencimiento=self.hoy - datetime.timedelta(days=dias),
+                monto_cuota=Decimal('120.00'), capital=Decimal('100.00'), interes=Decimal('20.00'),
+                saldo_pendiente=Decimal('0.00'), estado=estado, monto_penalidad_acumulada=Decimal(penalidad),
+                monto_pagado_acumulado=Decimal(pagado),
+            )
+
+    def _prestamo(self, documento, **kwargs):
+        cliente = Cliente.objects.create(nombres='Mora', apellidos='Prueba', numero_documento=documento)
+        datos = dict(
+            cliente=cliente, monto=Decimal('1000.00'), tasa_interes=Decimal('12.00'), plazo=12,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2024, 1, 1), estado='aprobado',
+        )
+        datos.update(kwargs)
+        return Prestamo.objects.create(**datos)
+
+    def test_tramos_y_conceptos(self):
+        with self.assertNumQueries(1):
+            informe = obtener_antiguedad_mora(self.hoy)
+
+        def resumen(tramos):
+            return {
+                clave: (tramo['cuotas'], tramo['capital'], tramo['interes'], tramo['penalidad'])
+                for clave, tramo in tramos.items()
+            }
+
+        self.assertEqual(resumen(informe['tramos']), {
+            '1_30': (2, Decimal('200.00'), Decimal('30.00'), Decimal('0.00')),
+            '31_60': (1, Decimal('100.00'), Decimal('20.00'), Decimal('0.00')),
+            '61_90': (1, Decimal('100.00'), Decimal('20.00'), Decimal('2.00')),
+            '90_mas': (2, Decimal('110.00'), Decimal('20.00'), Decimal('0.00')),
+        })
+        self.assertEqual(informe['total'], Decimal('602.00'))
+        self.assertEqual([tipo['nombre'] for tipo in informe['tipos']], ['Sin tipo', 'Tipo de prueba M'])
+        self.assertEqual(informe['tipos'][1]['total'], Decimal('360.00'))
+        self.assertEqual(informe['tipos'][0]['tramos']['61_90']['total'], Decimal('122.00'))
+
+    def test_vista_y_json(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        self.assertEqual(self.client.get(reverse('antiguedad_mora')).status_code, 200)
+        datos = self.client.get(reverse('antiguedad_mora_api')).json()
+        self.assertEqual(list(datos['tramos']), ['1_30', '31_60', '61_90', '90_mas'])
+        self.assertIn('capital', datos['tipos'][0]['tramos']['90_mas'])
+
+
+class BusquedaEnListadosTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        self.cliente = Cliente.objects.create(nombres='Marta', apellidos='Jiménez', numero_documento='00133333333')
+
+    def test_listados_aceptan_busqueda(self):
+        for nombre in ('client_list', 'loan_list', 'paid_loan_list', 'loan_application_list', 'cobros_list'):
+            for texto in ('jimén', '00133333333', 'xx'):
+                respuesta = self.client.get(reverse(nombre), {'q': texto})
+                self.assertEqual(respuesta.status_code, 200, f'{nombre}?q={texto}')
+
+    def test_prestamos_por_saldo_y_atraso(self):
+        hoy = timezone.localdate()
+        prestamos = []
+        for i, (monto, desembolso) in enumerate(((Decimal('1000.00'), hoy - datetime.timedelta(days=60)), (Decimal('3000.00'), hoy), (Decimal('2000.00'), hoy))):
+            cliente = Cliente.objects.create(nombres=f'Saldo {i}', apellidos='Prueba', numero_documento=f'0024400000{i}')
+            prestamo = Prestamo.objects.create(
+                cliente=cliente, monto=monto, tasa_interes=Decimal('12.00'), plazo=6,
+                frecuencia_pago='mensual', fecha_desembolso=desembolso, estado='aprobado',
+            )
+            generar_cuotas(prestamo)
+            prestamos.append(prestamo)
+
+        respuesta = self.client.get(reverse('loan_list'), {'sort': 'saldo'})
+        self.assertEqual([p.pk for p in respuesta.context['prestamos']], [prestamos[1].pk, prestamos[2].pk, prestamos[0].pk])
+
+        respuesta = self.client.get(reverse('loan_list'), {'sort': 'atraso', 'atraso': '1'})
+        self.assertEqual([p.pk for p in respuesta.context['prestamos']], [prestamos[0].pk])
+        self.assertGreater(respuesta.context['prestamos'][0].situacion.dias_atraso(), 0)
+
+    def test_autocompletado_de_clientes(self):
+        respuesta = self.client.get(reverse('search_clients'), {'term': 'marta jim'})
+        self.assertEqual([r['id'] for r in respuesta.json()['results']], [self.cliente.pk])
+
+
+class PaginacionKeysetTests(TestCase):
+
+    def setUp(self):
+        for numero in range(7):
+            Cliente.objects.create(nombres=f'Cliente {numero}', apellidos='Prueba', numero_documento=f'0020000000{numero}')
+        # Empates en la primera columna: el id debe desempatar sin saltar ni repetir filas.
+        Cliente.objects.filter(pk__in=Cliente.objects.order_by('id').values('id')[:4]).update(
+            fecha_registro=timezone.make_aware(datetime.datetime(2025, 1, 1))
+        )
+        self.orden = ['-fecha_registro', '-id']
+        self.esperado = list(Cliente.objects.order_by(*self.orden))
+
+    def test_recorre_todas_las_paginas_en_ambos_sentidos(self):
+        paginas = [paginar_keyset(Cliente.objects.all(), self.orden, None, 3)]
+        while paginas[-1].has_next:
+            paginas.append(paginar_keyset(Cliente.objects.all(), self.orden, paginas[-1].cursor_siguiente, 3))
+
+        self.assertEqual([len(p) for p in paginas], [3, 3, 1])
+        self.assertEqual([c for p in paginas for c in p], self.esperado)
+        self.assertFalse(paginas[0].has_previous)
+
+        anterior = paginar_keyset(Cliente.objects.all(), self.orden, paginas[-1].cursor_anterior, 3)
+        self.assertEqual(list(anterior), list(paginas[1]))
+        primera = paginar_keyset(Cliente.objects.all(), self.orden, anterior.cursor_anterior, 3)
+        self.assertEqual(list(primera), list(paginas[0]))
+        self.assertFalse(primera.has_previous)
+        self.assertTrue(primera.has_next)
+
+    def test_cursor_invalido(self):
+        with self.assertRaises(CursorInvalido):
+            paginar_keyset(Cliente.objects.all(), self.orden, 'no-es-un-cursor', 3)
+
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        respuesta = self.client.get(reverse('client_list'), {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(list(respuesta.context['clientes']), self.esperado[:10])
+
+    def test_cobros_paginados_por_dias_de_atraso(self):
+        prestamo = Prestamo.objects.create(
+            cliente=self.esperado[0], monto=Decimal('3000.00'), tasa_interes=Decimal('12.00'), plazo=30,
+            frecuencia_pago='semanal', fecha_desembolso=datetime.date(2024, 1, 1), estado='aprobado',
+        )
+        generar_cuotas(prestamo)
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+
+        vistas, parametros = [], {}
+        while True:
+            pagina = self.client.get(reverse('cobros_list'), parametros).context['cuotas_vencidas']
+            vistas.extend(c.numero_cuota for c in pagina)
+            if not pagina.has_next:
+                break
+            parametros = {'cursor': pagina.cursor_siguiente}
+
+        vencidas = prestamo.cuotas.filter(fecha_vencimiento__lt=timezone.localdate()).count()
+        self.assertGreater(vencidas, POR_PAGINA)
+        self.assertEqual(vistas, list(range(1, vencidas + 1)))
+
+
+class ResumenCobrosTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        for documento, nombre in (('00144444444', 'Carla'), ('00145555555', 'Pablo')):
+            cliente = Cliente.objects.create(nombres=nombre, apellidos='Cobros', numero_documento=documento)
+            prestamo = Prestamo.objects.create(
+                cliente=cliente, monto=Decimal('2000.00'), tasa_interes=Decimal('12.00'), plazo=12,
+                frecuencia_pago='semanal', fecha_desembolso=datetime.date(2024, 1, 1), estado='aprobado',
+            )
+            generar_cuotas(prestamo)
+        Cuota.objects.update(monto_penalidad_acumulada=Decimal('1.50'))
+
+    def _esperado(self, cuotas):
+        cuotas = list(cuotas.filter(fecha_vencimiento__lt=timezone.localdate()))
+        return {
+            'total_cuotas': len(cuotas),
+            'total_penalidad': sum(c.monto_penalidad_acumulada for c in cuotas),
+            'total_vencido': sum(c.monto_total_a_pagar for c in cuotas),
+        }
+
+    def test_totales_de_todas_las_paginas(self):
+        respuesta = self.client.get(reverse('cobros_list'))
+        resumen = respuesta.context['resumen_cobros']
+        self.assertEqual(resumen, self._esperado(Cuota.objects.all()))
+        self.assertGreater(resumen['total_cuotas'], len(respuesta.context['cuotas_vencidas']))
+
+    def test_totales_respetan_la_busqueda(self):
+        resumen = self.client.get(reverse('cobros_list'), {'q': 'carla'}).context['resumen_cobros']
+        self.assertEqual(resumen, self._esperado(Cuota.objects.filter(prestamo__cliente__nombres='Carla')))
+
+
+class ExportacionTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        for numero, nombre in enumerate(('Ñoño', 'Beatriz', 'Carlos')):
+            cliente = Cliente.objects.create(nombres=nombre, apellidos='Export', numero_documento=f'0030000000{numero}')
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente, monto=Decimal('1200.00'), tasa_interes=Decimal('12.00'), plazo=6,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2024, 1, 1), estado='aprobado',
+        )
+        generar_cuotas(self.prestamo)
+
+    def _descargar(self, lista, **parametros):
+        respuesta = self.client.get(reverse('export_list', args=[lista]), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        return b''.join(respuesta.streaming_content)
+
+    def test_csv_respeta_busqueda_y_orden(self):
+        filas = list(csv.reader(io.StringIO(self._descargar('clientes', q='export').decode('utf-8-sig'))))
+        self.assertEqual(filas[0][:3], ['ID', 'Nombres', 'Apellidos'])
+        self.assertEqual([fila[1] for fila in filas[1:]], ['Carlos', 'Beatriz', 'Ñoño'])
+
+        filas = list(csv.reader(io.StringIO(self._descargar('clientes', q='beatriz').decode('utf-8-sig'))))
+        self.assertEqual(len(filas), 2)
+
+    def test_cobros_y_cuotas(self):
+        cobros = list(csv.reader(io.StringIO(self._descargar('cobros', sort='numero_cuota').decode('utf-8-sig'))))
+        self.assertEqual([int(fila[3]) for fila in cobros[1:]], list(range(1, 7)))
+
+        cuotas = list(csv.reader(io.StringIO(self._descargar('cuotas', prestamo=self.prestamo.pk).decode('utf-8-sig'))))
+        self.assertEqual(len(cuotas), 7)
+
+    def test_xlsx_es_un_libro_valido(self):
+        contenido = self._descargar('prestamos', formato='xlsx')
+        with zipfile.ZipFile(io.BytesIO(contenido)) as libro:
+            self.assertIsNone(libro.testzip())
+            hoja = ElementTree.fromstring(libro.read('xl/worksheets/sheet1.xml'))
+        filas = hoja.findall('.//{http://schemas.openxmlformats.org/spreadsheetml/2006/main}row')
+        self.assertEqual(len(filas), 2)
+
+    def test_textos_que_parecen_formulas_no_se_evaluan(self):
+        Cliente.objects.create(nombres='=HYPERLINK("http://x")', apellidos='@SUMA(1)', numero_documento='00300000009')
+
+        filas = list(csv.reader(io.StringIO(self._descargar('clientes').decode('utf-8-sig'))))
+        fila = next(fila for fila in filas if fila[1].endswith('HYPERLINK("http://x")'))
+        self.assertEqual(fila[1:3], ['\'=HYPERLINK("http://x")', "'@SUMA(1)"])
+
+        # Las columnas 'Cliente' de préstamos y cobros reciben el objeto, no un texto.
+        self.prestamo.cliente.nombres = '=HYPERLINK("http://y")'
+        self.prestamo.cliente.save()
+        for lista in ('prestamos', 'cobros'):
+            filas = list(csv.reader(io.StringIO(self._descargar(lista).decode('utf-8-sig'))))
+            columna = filas[0].index('Cliente')
+            self.assertGreater(len(filas), 1, lista)
+            self.assertTrue(all(fila[columna].startswith('\'=HYPERLINK("http://y")') for fila in filas[1:]), lista)
+
+        ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        with zipfile.ZipFile(io.BytesIO(self._descargar('clientes', formato='xlsx'))) as libro:
+            hoja = ElementTree.fromstring(libro.read('xl/worksheets/sheet1.xml'))
+        self.assertEqual(hoja.findall(f'.//{ns}f'), [])
+        celda = next(c for c in hoja.iter(f'{ns}c') if c.findtext(f'{ns}is/{ns}t') == '=HYPERLINK("http://x")')
+        self.assertEqual(celda.get('t'), 'inlineStr')
+
+    def test_listado_desconocido_y_usuario_no_staff(self):
+        self.assertEqual(self.client.get(reverse('export_list', args=['pagos'])).status_code, 404)
+        self.client.force_login(User.objects.create_user('cliente', password='x'))
+        self.assertEqual(self.client.get(reverse('export_list', args=['clientes'])).status_code, 302)
+
+
+class ResumenPortalTests(TestCase):
+
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nombres='Iris', apellidos='Portal', numero_documento='00166600000')
+        self.cliente.refresh_from_db()
+        Cliente.objects.filter(pk=self.cliente.pk).update(debe_cambiar_contrasena=False)
+        Prestamo.objects.create(
+            cliente=self.cliente, monto=Decimal('300.00'), tasa_interes=Decimal('10.00'), plazo=3,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2023, 1, 1), estado='pagado',
+        )
+        self.prestamo = Prestamo.objects.create(
+            cliente=self.cliente, monto=Decimal('1200.00'), tasa_interes=Decimal('12.00'), plazo=12,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2024, 6, 1), estado='aprobado',
+        )
+        generar_cuotas(self.prestamo)
+        cache.delete(clave_resumen_portal(self.cliente.pk))
+        self.client.force_login(self.cliente.user)
+
+    def test_una_consulta_por_cliente_y_luego_cache(self):
+        resumen = calcular_resumen_portal(self.cliente.pk)
+        cuotas = list(self.prestamo.cuotas.order_by('numero_cuota'))
+        activo = resumen['prestamo_activo']
+        self.assertEqual([p['id'] for p in resumen['prestamos']], [self.prestamo.pk, self.prestamo.pk - 1])
+        self.assertEqual(activo['saldo_pendiente'], sum(c.monto_cuota for c in cuotas))
+        self.assertEqual(
+            (activo['proxima_cuota_numero'], activo['proxima_cuota_fecha'], activo['proxima_cuota_monto']),
+            (1, cuotas[0].fecha_vencimiento, cuotas[0].monto_cuota)
+        )
+
+        with self.assertNumQueries(1):
+            obtener_resumen_portal(self.cliente.pk)
+        with self.assertNumQueries(0):
+            obtener_resumen_portal(self.cliente.pk)
+
+    def test_vista_marca_la_cuota_vencida(self):
+        respuesta = self.client.get(reverse('portal_dashboard'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.context['proxima_cuota']['en_atraso'])
+        self.assertIn('está vencida', respuesta.context['proximo_pago_mensaje'])
+
+    def test_un_pago_invalida_el_resumen_del_cliente(self):
+        primera = self.prestamo.cuotas.get(numero_cuota=1)
+        obtener_resumen_portal(self.cliente.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.prestamo.registrar_pago(primera.monto_cuota)
+
+        activo = obtener_resumen_portal(self.cliente.pk)['prestamo_activo']
+        self.assertEqual(activo['proxima_cuota_numero'], 2)
+
+
+class CambioContrasenaObligatorioTests(TestCase):
+
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nombres='Nilo', apellidos='Clave', numero_documento='00177700000')
+        self.cliente.refresh_from_db()
+        self.cliente.user.set_password('00177700000')
+        self.cliente.user.save()
+        self.client.force_login(self.cliente.user)
+
+    def test_redirige_antes_de_la_vista_y_recuerda_la_bandera_en_la_sesion(self):
+        Cliente.objects.filter(pk=self.cliente.pk).update(debe_cambiar_contrasena=True)
+        respuesta = self.client.get(reverse('portal_dashboard'))
+        self.assertRedirects(respuesta, reverse('client_change_password'))
+        self.assertTrue(self.client.session[SESION_DEBE_CAMBIAR_CONTRASENA])
+
+        # Ya en la sesión: ni se consulta el perfil ni se ejecuta la vista.
+        with self.assertNumQueries(2):  # sesión y usuario
+            respuesta = self.client.get(reverse('portal_dashboard'))
+        self.assertRedirects(respuesta, reverse('client_change_password'))
+
+    def test_cambiar_la_contrasena_libera_el_portal(self):
+        Cliente.objects.filter(pk=self.cliente.pk).update(debe_cambiar_contrasena=True)
+        self.client.get(reverse('portal_dashboard'))
+
+        respuesta = self.client.post(reverse('client_change_password'), {
+            'old_password': '00177700000',
+            'new_password1': 'UnaClaveNueva#2024',
+            'new_password2': 'UnaClaveNueva#2024',
+        })
+        self.assertRedirects(respuesta, reverse('portal_dashboard'))
+        self.assertFalse(self.client.session[SESION_DEBE_CAMBIAR_CONTRASENA])
+        self.cliente.refresh_from_db()
+        self.assertFalse(self.cliente.debe_cambiar_contrasena)
+        self.assertEqual(self.client.get(reverse('portal_dashboard')).status_code, 200)
+
+
+class TipoPrestamoApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        referencias._copias_locales.clear()
+        self.tipo = TipoPrestamo.objects.create(nombre='Comercial', monto_maximo=Decimal('50000.00'), tasa_interes_predeterminada=Decimal('16.00'), plazo_maximo_meses=24)
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        self.url = reverse('get_tipo_prestamo_details', args=[self.tipo.pk])
+
+    def test_etag_permite_revalidar_sin_volver_a_enviar(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['tasa_interes_predeterminada'], '16.00')
+        self.assertIn('private', respuesta['Cache-Control'])
+
+        respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_tipo_inexistente(self):
+        self.assertEqual(self.client.get(reverse('get_tipo_prestamo_details', args=[self.tipo.pk + 100])).status_code, 404)
+
+
+class DocumentosImprimiblesTests(TestCase):
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        self.carpeta = Path(carpeta.name)
+        # El disco solo se usa si las versiones viven en una caché que comparten todos los procesos.
+        ajustes = override_settings(
+            DOCUMENTOS_CACHE_DIR=str(self.carpeta / 'documentos'),
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': str(self.carpeta / 'cache'),
+            }},
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        cache.clear()
+
+        cliente = Cliente.objects.create(nombres='Rita', apellidos='Recibo', numero_documento='00199900000')
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente, monto=Decimal('600.00'), tasa_interes=Decimal('12.00'), plazo=6,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2024, 1, 1), estado='aprobado',
+        )
+        generar_cuotas(self.prestamo)
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+
+    def _pagar(self, monto):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.prestamo.registrar_pago(Decimal(monto))
+
+    def test_la_reimpresion_sale_del_disco_sin_escribir(self):
+        url = reverse('recibo_pago_print', args=[self._pagar('150.00')[0].recibo_id])
+        primera = b''.join(self.client.get(url).streaming_content)
+
+        # Sesión, usuario y la lectura del recibo; nada más.
+        with self.assertNumQueries(3):
+            segunda = b''.join(self.client.get(url).streaming_content)
+        self.assertEqual(primera, segunda)
+
+    def test_el_recibo_no_cambia_con_pagos_posteriores(self):
+        pagos = self._pagar('150.00')
+        url = reverse('recibo_pago_print', args=[pagos[0].recibo_id])
+        antes = b''.join(self.client.get(url).streaming_content)
+
+        self._pagar('150.00')
+        self.assertEqual(antes, b''.join(self.client.get(url).streaming_content))
+
+        # Los enlaces viejos por ids de pago llevan al recibo guardado.
+        enlace_viejo = reverse('payment_receipt_print') + '?pids=' + ','.join(str(pago.pk) for pago in pagos)
+        self.assertRedirects(self.client.get(enlace_viejo), url, fetch_redirect_response=False)
+
+    def test_un_pago_nuevo_genera_otro_estado_de_cuenta(self):
+        url = reverse('loan_detail_print', args=[self.prestamo.pk])
+        antes = b''.join(self.client.get(url).streaming_content)
+        self.assertEqual(antes, b''.join(self.client.get(url).streaming_content))
+
+        self._pagar('150.00')
+        self.assertNotEqual(antes, b''.join(self.client.get(url).streaming_content))
+
+    def test_sin_cache_compartida_no_se_guarda_en_disco(self):
+        url = reverse('loan_detail_print', args=[self.prestamo.pk])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            antes = b''.join(self.client.get(url).streaming_content)
+            self._pagar('150.00')
+            despues = b''.join(self.client.get(url).streaming_content)
+
+        self.assertNotEqual(antes, despues)
+        self.assertFalse((self.carpeta / 'documentos').exists())
+
+    def test_limpiar_documentos_borra_solo_los_viejos(self):
+        url = reverse('loan_detail_print', args=[self.prestamo.pk])
+        b''.join(self.client.get(url).streaming_content)
+        [viejo] = (self.carpeta / 'documentos').glob('*/*')
+        self._pagar('150.00')
+        b''.join(self.client.get(url).streaming_content)
+        [nuevo] = set((self.carpeta / 'documentos').glob('*/*')) - {viejo}
+        hace_un_mes = time.time() - 30 * 86400
+        os.utime(viejo, (hace_un_mes, hace_un_mes))
+
+        salida = StringIO()
+        call_command('limpiar_documentos', '--dias', '7', stdout=salida)
+
+        self.assertIn('Se borraron 1 documento(s)', salida.getvalue())
+        self.assertFalse(viejo.exists())
+        self.assertTrue(nuevo.exists())
+
+
+    @skipUnless(documentos.HTML is not None, 'WeasyPrint no está instalado.')
+    def test_genera_el_pdf_una_vez_y_lo_reimprime_del_disco(self):
+        url = reverse('recibo_pago_print', args=[self._pagar('150.00')[0].recibo_id])
+        respuesta = self.client.get(url)
+        primera = b''.join(respuesta.streaming_content)
+
+        self.assertEqual(respuesta['Content-Type'], 'application/pdf')
+        self.assertTrue(primera.startswith(b'%PDF'))
+        [archivo] = (self.carpeta / 'documentos').glob('*/*.pdf')
+        with mock.patch.object(documentos.HTML, 'write_pdf') as write_pdf:
+            self.assertEqual(b''.join(self.client.get(url).streaming_content), primera)
+        write_pdf.assert_not_called()
+        self.assertEqual(archivo.read_bytes(), primera)
+
+    def test_check_deploy_avisa_sin_pdf_o_sin_cache_en_disco(self):
+        self.assertNotIn('dashboard.W002', [aviso.id for aviso in checks.revisar_documentos_imprimibles(None)])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertIn('dashboard.W002', [aviso.id for aviso in checks.revisar_documentos_imprimibles(None)])
+        with mock.patch.object(documentos, 'HTML', None):
+            self.assertIn('dashboard.W001', [aviso.id for aviso in checks.revisar_documentos_imprimibles(None)])
+
+
+class ImportarPagosVistaTests(TestCase):
+
+    def test_sube_el_archivo_y_muestra_los_rechazos(self):
+        cliente = Cliente.objects.create(nombres='Sara', apellidos='Subida', numero_documento='00233300000')
+        prestamo = Prestamo.objects.create(
+            cliente=cliente, monto=Decimal('500.00'), tasa_interes=Decimal('12.00'), plazo=5,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2024, 1, 1), estado='aprobado',
+        )
+        generar_cuotas(prestamo)
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+
+        archivo = SimpleUploadedFile('cobros.csv', 'documento,monto\n00233300000,50.00\n00000000000,5.00\n'.encode('utf-8'))
+        respuesta = self.client.post(reverse('payment_import'), {'archivo': archivo, 'delimitador': ','})
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['resumen']['aplicadas'], 1)
+        self.assertEqual(respuesta.context['errores'], [(3, 'No hay un préstamo en cobro para el documento 00000000000.')])
+        self.assertEqual(Pago.objects.filter(cuota__prestamo=prestamo).count(), 1)
+
+    def test_un_archivo_cortado_muestra_lo_aplicado_y_la_linea(self):
+        cliente = Cliente.objects.create(nombres='Sara', apellidos='Subida', numero_documento='00233300000')
+        prestamo = Prestamo.objects.create(
+            cliente=cliente, monto=Decimal('500.00'), tasa_interes=Decimal('12.00'), plazo=5,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2024, 1, 1), estado='aprobado',
+        )
+        generar_cuotas(prestamo)
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+
+        # La tercera línea supera el tamaño máximo de campo del lector de CSV.
+        contenido = f'prestamo,monto\n{prestamo.pk},50.00\n' + 'x' * (csv.field_size_limit() + 1) + f'\n{prestamo.pk},5.00\n'
+        archivo = SimpleUploadedFile('cobros.csv', contenido.encode('utf-8'))
+        respuesta = self.client.post(reverse('payment_import'), {'archivo': archivo, 'delimitador': ','})
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context['resumen']['aplicadas'], 1)
+        self.assertEqual(respuesta.context['resumen']['linea_interrumpida'], 3)
+        self.assertContains(respuesta, 'se interrumpió en la línea 3')
+        self.assertEqual(Pago.objects.filter(cuota__prestamo=prestamo).count(), 1)
+
+
+class PresupuestosVistasTests(TestCase):
+
+    def setUp(self):
+        call_command('populate_data', clients=12, seed=5, stdout=StringIO())
+        # populate_data no crea recibos guardados ni solicitudes; se agrega uno de cada uno.
+        prestamo = Prestamo.objects.filter(estado='aprobado').order_by('pk').first()
+        with self.captureOnCommitCallbacks(execute=True):
+            prestamo.registrar_pago(Decimal('25.00'))
+        Prestamo.objects.create(
+            cliente=prestamo.cliente, tipo_prestamo=prestamo.tipo_prestamo, monto=Decimal('1000.00'),
+            tasa_interes=Decimal('12.00'), plazo=6, frecuencia_pago='mensual',
+            fecha_desembolso=timezone.localdate(), estado='pendiente',
+        )
+
+    def test_ninguna_vista_excede_su_presupuesto_de_consultas(self):
+        informe = medicion_vistas.medir_vistas(repeticiones=1, validar_tiempos=False)
+
+        self.assertEqual(informe['problemas'], [])
+        # Solo se omiten las URLs excluidas a propósito: todas las demás tienen datos.
+        self.assertEqual({omitida['url'] for omitida in informe['omitidas']}, set(medicion_vistas.EXCLUIDAS))
+        self.assertEqual(len(informe['vistas']), len(medicion_vistas.PRESUPUESTOS))
+
+    def test_informa_las_vistas_sin_presupuesto_y_las_que_se_pasan(self):
+        presupuestos = {**medicion_vistas.PRESUPUESTOS, 'loan_detail': (1, 300)}
+        del presupuestos['profile']
+        with mock.patch.dict(medicion_vistas.PRESUPUESTOS, presupuestos, clear=True):
+            informe = medicion_vistas.medir_vistas(repeticiones=1, validar_tiempos=False)
+
+        self.assertIn('profile: sin presupuesto declarado', informe['problemas'])
+        self.assertTrue(any(problema.startswith('loan_detail: ') for problema in informe['problemas']))
+        salida = StringIO()
+        medicion_vistas.escribir_informe(informe, salida)
+        self.assertIn('"nombre": "loan_detail"', salida.getvalue())
+
+
+class MedicionPeticionesTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+
+    def test_server_timing_con_consultas_y_tiempos(self):
+        respuesta = self.client.get(reverse('profile'))
+
+        # Sesión y usuario.
+        self.assertRegex(
+            respuesta['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="2 consultas", app;dur=[\d.]+, total;dur=[\d.]+$'
+        )
+
+    @override_settings(PETICION_LENTA_CONSULTAS=2)
+    def test_las_peticiones_lentas_van_a_su_log(self):
+        with self.assertLogs('dashboard.peticiones_lentas', 'WARNING') as registro:
+            self.client.get(reverse('profile'))
+
+        self.assertEqual(len(registro.records), 1)
+        self.assertIn('GET /profile/ vista=profile estado=200 consultas=2', registro.output[0])
+        self.assertIn('django_session', registro.output[0])
+
+    def test_la_carpeta_del_log_se_crea_al_escribir(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        archivo = Path(carpeta.name) / 'logs' / 'lentas.log'
+        handler = ArchivoRotativoHandler(archivo, delay=True)
+        self.addCleanup(handler.close)
+        self.assertFalse(archivo.parent.exists())
+
+        handler.emit(logging.makeLogRecord({'msg': 'lenta'}))
+        self.assertEqual(archivo.read_text(encoding='utf-8'), 'lenta\n')
+
+    @override_settings(SERVER_TIMING=False)
+    def test_sin_server_timing(self):
+        with self.assertNoLogs('dashboard.peticiones_lentas', 'WARNING'):
+            respuesta = self.client.get(reverse('profile'))
+        self.assertNotIn('Server-Timing', respuesta)
+
+
+class PerfiladoPeticionesTests(TestCase):
+
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        ajustes = override_settings(PERFILES_DIR=carpeta.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.carpeta = Path(carpeta.name)
+        self.staff = User.objects.create_user('admin', password='x', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def _token(self, usuario):
+        salida = StringIO()
+        call_command('token_perfilado', usuario.username, stdout=salida, stderr=StringIO())
+        return salida.getvalue().strip()
+
+    def test_perfila_la_peticion_firmada(self):
+        respuesta = self.client.get(reverse('profile'), {'perfilar': self._token(self.staff), 'q': 'x'})
+
+        nombre = respuesta['X-Perfil']
+        self.assertTrue((self.carpeta / f'{nombre}.prof').exists())
+        resumen = (self.carpeta / f'{nombre}.txt').read_text(encoding='utf-8')
+        self.assertTrue(resumen.startswith('GET /profile/?q=x\nvista=profile estado=200'))
+        self.assertIn('function calls', resumen)
+
+    def test_ignora_tokens_ajenos_invalidos_o_sin_staff(self):
+        cliente = User.objects.create_user('cliente', password='x')
+        token_cliente = signing.TimestampSigner(salt='dashboard.perfilado').sign(str(cliente.pk))
+        self.client.get(reverse('profile'), HTTP_X_PERFILAR='basura')
+        self.client.get(reverse('profile'), HTTP_X_PERFILAR=token_cliente)
+        self.client.force_login(cliente)
+        self.client.get(reverse('profile'), HTTP_X_PERFILAR=token_cliente)
+
+        self.assertEqual(list(self.carpeta.iterdir()), [])
+
+    @override_settings(PERFILADO_MUESTREO=3)
+    def test_perfila_una_de_cada_n(self):
+        token = self._token(self.staff)
+        respuestas = [self.client.get(reverse('profile'), HTTP_X_PERFILAR=token) for _ in range(6)]
+
+        self.assertEqual([respuesta.has_header('X-Perfil') for respuesta in respuestas], [True, False, False] * 2)
+        self.assertEqual(len(list(self.carpeta.glob('*.prof'))), 2)
+
+
+class TelemetriaTests(TestCase):
+
+    def setUp(self):
+        # Cada test empieza con el registro del proceso vacío.
+        telemetria._estado['pid'] = None
+        cache.clear()
+
+    def test_metrics_solo_para_staff_o_ips_permitidas(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with override_settings(METRICAS_IPS_PERMITIDAS=['127.0.0.1']):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        respuesta = self.client.get(reverse('metrics'))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+    def test_expone_peticiones_pagos_cuotas_y_caches(self):
+        cliente = Cliente.objects.create(nombres='Tina', apellidos='Telemetría', numero_documento='00244400000')
+        prestamo = Prestamo.objects.create(
+            cliente=cliente, monto=Decimal('600.00'), tasa_interes=Decimal('12.00'), plazo=6,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2024, 1, 1), estado='aprobado',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            generar_cuotas(prestamo)
+        with self.captureOnCommitCallbacks(execute=True):
+            prestamo.registrar_pago(Decimal('150.00'))
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        self.client.get(reverse('panel_informativo'))
+        self.client.get(reverse('panel_informativo'))
+
+        texto = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('prestamos_cuotas_generadas_total 6.0\n', texto)
+        self.assertIn('prestamos_pagos_registrados_total 1.0\n', texto)
+        self.assertIn('prestamos_pagos_monto_total 150.0\n', texto)
+        self.assertIn('prestamos_peticiones_total{estado="200",metodo="GET",vista="panel_informativo"} 2.0\n', texto)
+        self.assertIn('prestamos_peticion_segundos_bucket{vista="panel_informativo",le="+Inf"} 2.0\n', texto)
+        self.assertIn('prestamos_peticion_segundos_count{vista="panel_informativo"} 2.0\n', texto)
+        self.assertIn('prestamos_cache_aciertos_ratio{cache="metricas_panel"} 0.5\n', texto)
+
+    def test_suma_los_archivos_de_todos_los_procesos(self):
+        carpeta = tempfile.TemporaryDirectory()
+        self.addCleanup(carpeta.cleanup)
+        otro_proceso = {
+            'contadores': [['prestamos_pagos_registrados_total', [], 3.0]],
+            'histogramas': [['prestamos_penalidades_segundos', [['alcance', 'cartera']], [1] + [0] * 11 + [0.005]]],
+        }
+        Path(carpeta.name, '999-otro.json').write_text(json.dumps(otro_proceso), encoding='utf-8')
+
+        with override_settings(METRICAS_DIR=carpeta.name):
+            telemetria.incrementar('prestamos_pagos_registrados_total')
+            telemetria.observar('prestamos_penalidades_segundos', 0.2, alcance='cartera')
+            texto = telemetria.exposicion()
+
+        self.assertIn('prestamos_pagos_registrados_total 4.0\n', texto)
+        self.assertIn('prestamos_penalidades_segundos_bucket{alcance="cartera",le="0.01"} 1.0\n', texto)
+        self.assertIn('prestamos_penalidades_segundos_bucket{alcance="cartera",le="0.25"} 2.0\n', texto)
+        self.assertIn('prestamos_penalidades_segundos_count{alcance="cartera"} 2.0\n', texto)
+        self.assertEqual(len(list(Path(carpeta.name).glob('*.json'))), 2)
@@ -57,11 +57,16 @@ urlpatterns = [
     # --- URLs para Pagos ---
     # Muestra el formulario para registrar un nuevo pago.
     path('pagos/nuevo/<int:loan_id>/', views.payment_add, name='payment_add'),
+    # Carga masiva de pagos desde un CSV.
+    path('pagos/importar/', views.payment_import, name='payment_import'),
     # Ruta para la versión imprimible de un recibo de pago.
     path('pagos/recibo/', views.payment_receipt_print, name='payment_receipt_print'),
+    # Recibo guardado al momento del pago, por número.
+    path('pagos/recibo/<int:pk>/', views.recibo_pago_print, name='recibo_pago_print'),
 
     # --- URLs para Cobros ---
     path('cobros/', views.cobros_list, name='cobros_list'),
+    path('exportar/<slug:lista>/', views.export_list, name='export_list'),
 
     # --- URLs para Select2 AJAX ---
     path('search/clients/', views.search_clients, name='search_clients'),
@@ -73,6 +78,11 @@ urlpatterns = [
 
     # --- URLs para Finanzas ---
     path('finanzas/', views.financial_details, name='financial_details'),
+    path('finanzas/antiguedad-mora/', views.antiguedad_mora, name='antiguedad_mora'),
+    path('api/antiguedad-mora/', views.antiguedad_mora_api, name='antiguedad_mora_api'),
+
+    # --- Telemetría (formato de Prometheus) ---
+    path('metrics', views.metrics, name='metrics'),
 
     # --- URLs del Portal de Clientes ---
     path('portal/', include(portal_patterns)),
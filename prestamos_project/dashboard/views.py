@@ -1,75 +1,76 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from decimal import Decimal
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db.models import Sum, Value, DecimalField, Count, F, Q
-from django.db.models.functions import Coalesce
-from gestion_prestamos.forms import ClienteForm, PrestamoForm, PagoForm, TipoPrestamoForm, GastoPrestamoForm, RequisitoForm, GaranteForm, LoanRequestForm
-from gestion_prestamos.models import Prestamo, Cliente, Pago, Cuota, TipoPrestamo, Capital, GastoPrestamo, TipoGasto, Requisito
+from django.db.models.functions import Coalesce, Greatest
+from gestion_prestamos.forms import ClienteForm, ImportarPagosForm, PrestamoForm, PagoForm, TipoPrestamoForm, GastoPrestamoForm, RequisitoForm, GaranteForm, LoanRequestForm
+from gestion_prestamos.models import Prestamo, Cliente, Pago, Cuota, ReciboPago, TipoPrestamo, GastoPrestamo, TipoGasto, Requisito
 from configuracion.models import ConfiguracionImpresion # Importa el modelo de configuración
+from .documentos import clave_documento, clave_estado_cuenta, respuesta_documento
+from .exportacion import Columna, TIPOS_CONTENIDO, respuesta_exportacion
+from .listados import consultar_clientes, consultar_cobros, consultar_cuotas, consultar_prestamos
+from .paginacion import paginar_request
+from .resumen_portal import obtener_resumen_portal
+from .middleware import SESION_DEBE_CAMBIAR_CONTRASENA
+from .metricas import TRAMOS_MORA, obtener_antiguedad_mora, obtener_metricas_cacheadas, obtener_metricas_financieras, obtener_serie_cartera
 from django.forms import modelformset_factory
-from gestion_prestamos.utils import calcular_tabla_amortizacion, calcular_penalidad_cuota
+from gestion_prestamos.busqueda import buscar_por_cliente
+from gestion_prestamos import telemetria
+from gestion_prestamos.importacion_pagos import importar_pagos, leer_csv
+from gestion_prestamos.referencias import REF_TIPOS_PRESTAMO, obtener_detalles_tipo_prestamo, version_referencia
+from gestion_prestamos.utils import aplicar_penalidades_en_lote, calcular_tabla_amortizacion, generar_cuotas
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.forms import AuthenticationForm, PasswordChangeForm
-from django.http import JsonResponse, HttpResponse
+from django.http import Http404, JsonResponse, HttpResponse
 from django.utils import timezone
 from datetime import date, timedelta
 from django.contrib.auth.views import PasswordChangeView
 from django.urls import reverse_lazy, reverse
 from django.utils.html import format_html
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.conf import settings
+import io
 import json
 
+# Filas por página de los listados paginados por cursor.
+POR_PAGINA = 25
+
 # --- Vistas del Dashboard ---
 
 @login_required
 def panel_informativo(request):
     """Muestra el panel principal con datos agregados y métricas financieras."""
-    hoy = timezone.now()
-    
-    # --- MÉTRICAS FINANCIERAS ---
-    capital_obj = Capital.objects.first()
-    capital_inicial = capital_obj.monto_inicial if capital_obj else Decimal('0.00')
-
-    total_desembolsado = Prestamo.objects.aggregate(total=Coalesce(Sum('monto'), Decimal('0.00')))['total']
-    total_recibido = Pago.objects.aggregate(total=Coalesce(Sum('monto_pagado'), Decimal('0.00')))['total']
-    
-    dinero_en_caja = capital_inicial - total_desembolsado + total_recibido
-
-    cuotas_pagadas = Cuota.objects.filter(estado='pagada')
-    ganancia_realizada = cuotas_pagadas.aggregate(total=Coalesce(Sum('interes'), Decimal('0.00')))['total']
-    capital_devuelto = cuotas_pagadas.aggregate(total=Coalesce(Sum('capital'), Decimal('0.00')))['total']
-
-    dinero_en_la_calle = total_desembolsado - capital_devuelto
-
-    patrimonio_total = dinero_en_caja + dinero_en_la_calle
-
-    # --- ESTADÍSTICAS GENERALES ---
-    total_clientes = Cliente.objects.count()
-    total_prestamos_activos = Prestamo.objects.filter(estado='aprobado').count()
+    # Las cifras salen de la foto en caché; la agenda siempre se consulta en vivo.
+    metricas = obtener_metricas_cacheadas()
     
     # --- AGENDA DE COBROS AMPLIADA ---
-    fecha_hoy = hoy.date()
+    # Una sola consulta para los próximos 7 días; se reparte en Python.
+    fecha_hoy = timezone.localdate()
     fecha_manana = fecha_hoy + timedelta(days=1)
     fecha_semana = fecha_hoy + timedelta(days=7)
 
-    cobros_hoy = Cuota.objects.filter(fecha_vencimiento=fecha_hoy, estado__in=['pendiente', 'pagada_parcialmente'])
-    cobros_manana = Cuota.objects.filter(fecha_vencimiento=fecha_manana, estado__in=['pendiente', 'pagada_parcialmente'])
-    cobros_proximos_7_dias = Cuota.objects.filter(
-        fecha_vencimiento__gt=fecha_manana, 
-        fecha_vencimiento__lte=fecha_semana, 
+    cobros_semana = Cuota.objects.filter(
+        fecha_vencimiento__gte=fecha_hoy,
+        fecha_vencimiento__lte=fecha_semana,
         estado__in=['pendiente', 'pagada_parcialmente']
-    ).order_by('fecha_vencimiento')
+    ).select_related('prestamo__cliente').order_by('fecha_vencimiento')
+
+    cobros_hoy = [c for c in cobros_semana if c.fecha_vencimiento == fecha_hoy]
+    cobros_manana = [c for c in cobros_semana if c.fecha_vencimiento == fecha_manana]
+    cobros_proximos_7_dias = [c for c in cobros_semana if c.fecha_vencimiento > fecha_manana]
 
     context = {
         # Métricas Financieras Reorganizadas
-        'patrimonio_total': patrimonio_total,
-        'dinero_en_caja': dinero_en_caja,
-        'dinero_en_la_calle': dinero_en_la_calle,
-        'ganancia_realizada': ganancia_realizada,
+        'patrimonio_total': metricas['patrimonio_total'],
+        'dinero_en_caja': metricas['dinero_en_caja'],
+        'dinero_en_la_calle': metricas['dinero_en_la_calle'],
+        'ganancia_realizada': metricas['ganancia_realizada'],
         
         # Estadísticas Generales
-        'total_clientes': total_clientes,
-        'total_prestamos_activos': total_prestamos_activos,
+        'total_clientes': metricas['total_clientes'],
+        'total_prestamos_activos': metricas['num_prestamos_activos'],
         
         # Agenda de Cobros Ampliada
         'cobros_hoy': cobros_hoy,
@@ -77,7 +78,8 @@ def panel_informativo(request):
         'cobros_proximos_7_dias': cobros_proximos_7_dias,
 
         # Valor para mostrar alerta si no se ha configurado el capital
-        'capital_no_configurado': capital_obj is None,
+        'capital_no_configurado': not metricas['capital_configurado'],
+        'metricas_calculadas_en': metricas['calculado_en'],
     }
     return render(request, 'dashboard/panel.html', context)
 
@@ -93,12 +95,7 @@ def client_list(request):
     """Muestra una lista de todos los clientes registrados con funcionalidad de búsqueda."""
     query = request.GET.get('q')
     if query:
-        clientes = Cliente.objects.filter(
-            Q(id__icontains=query) |
-            Q(nombres__icontains=query) |
-            Q(apellidos__icontains=query) |
-            Q(cedula__icontains=query)
-        ).order_by('-fecha_registro')
+        clientes = buscar_por_cliente(Cliente.objects.all(), query).order_by('-fecha_registro')
     else:
         clientes = Cliente.objects.all().order_by('-fecha_registro')
     
@@ -255,17 +252,7 @@ def loan_add(request):
                     requisito.prestamo = prestamo
                     requisito.save()
 
-            tabla_amortizacion = calcular_tabla_amortizacion(prestamo)
-            for item_cuota in tabla_amortizacion:
-                Cuota.objects.create(
-                    prestamo=prestamo,
-                    numero_cuota=item_cuota['numero_cuota'],
-                    fecha_vencimiento=item_cuota['fecha_vencimiento'],
-                    monto_cuota=item_cuota['cuota_fija'],
-                    capital=item_cuota['capital'],
-                    interes=item_cuota['interes'],
-                    saldo_pendiente=item_cuota['saldo_pendiente']
-                )
+            generar_cuotas(prestamo)
             
             messages.success(request, f'¡Éxito! Préstamo de ${prestamo.monto:,.2f} para {prestamo.cliente.nombres} {prestamo.cliente.apellidos} ha sido registrado correctamente.')
             return redirect('loan_list')
@@ -307,14 +294,16 @@ def loan_add(request):
 def loan_detail(request, pk):
     """Muestra los detalles de un préstamo específico y sus cuotas."""
     prestamo = get_object_or_404(Prestamo, pk=pk)
+    # Penalidades al día antes de leer las cuotas: un UPDATE para todo el
+    # préstamo en lugar de guardar cuota por cuota.
+    aplicar_penalidades_en_lote(prestamo_ids=[prestamo.pk])
     cuotas = prestamo.cuotas.all().order_by('numero_cuota')
     hoy = timezone.now().date()
 
-    # Bucle para calcular penalidades y estado de cada cuota ANTES de agregar
+    # Bucle para calcular el estado de cada cuota ANTES de agregar
     total_faltante = Decimal('0.00')
     for cuota in cuotas:
         cuota.is_overdue = cuota.fecha_vencimiento < hoy and cuota.estado in ['pendiente', 'pagada_parcialmente']
-        calcular_penalidad_cuota(cuota) # Esto actualiza el monto de penalidad en la BD
         if cuota.estado != 'pagada':
             total_faltante += (cuota.monto_total_a_pagar - cuota.total_pagado)
 
@@ -354,57 +343,64 @@ def loan_detail(request, pk):
 def loan_detail_print(request, pk):
     """
     Vista para generar una versión imprimible de los detalles de un préstamo,
-    utilizando la configuración de impresión global.
+    utilizando la configuración de impresión global. El documento se genera
+    una vez y se reimprime desde la caché en disco (ver dashboard.documentos).
     """
     prestamo = get_object_or_404(Prestamo, pk=pk)
-    configuracion = ConfiguracionImpresion.load() # Carga la configuración global
 
-    cuotas = prestamo.cuotas.all().order_by('numero_cuota')
-    hoy = timezone.now().date()
-
-    # Calcular penalidades y estado de cada cuota
-    total_faltante = Decimal('0.00')
-    for cuota in cuotas:
-        cuota.is_overdue = cuota.fecha_vencimiento < hoy and cuota.estado in ['pendiente', 'pagada_parcialmente']
-        # No llamamos calcular_penalidad_cuota aquí para no modificar la BD
-        # La penalidad mostrada será la última guardada.
-        if cuota.estado != 'pagada':
-            total_faltante += (cuota.monto_total_a_pagar - cuota.total_pagado)
+    def construir_contexto():
+        configuracion = ConfiguracionImpresion.load() # Carga la configuración global
+
+        cuotas = prestamo.cuotas.all().order_by('numero_cuota')
+        hoy = timezone.now().date()
+
+        # Calcular penalidades y estado de cada cuota
+        total_faltante = Decimal('0.00')
+        for cuota in cuotas:
+            cuota.is_overdue = cuota.fecha_vencimiento < hoy and cuota.estado in ['pendiente', 'pagada_parcialmente']
+            # No llamamos calcular_penalidad_cuota aquí para no modificar la BD
+            # La penalidad mostrada será la última guardada.
+            if cuota.estado != 'pagada':
+                total_faltante += (cuota.monto_total_a_pagar - cuota.total_pagado)
+
+        # Agregamos los totales
+        totales_amortizacion = cuotas.aggregate(
+            total_cuota=Coalesce(Sum('monto_cuota'), Value(0), output_field=DecimalField()),
+            total_capital=Coalesce(Sum('capital'), Value(0), output_field=DecimalField()),
+            total_interes=Coalesce(Sum('interes'), Value(0), output_field=DecimalField()),
+            total_penalidad=Coalesce(Sum('monto_penalidad_acumulada'), Value(0), output_field=DecimalField())
+        )
+        totales_amortizacion['total_a_pagar'] = totales_amortizacion['total_cuota'] + totales_amortizacion['total_penalidad']
+
+        ganancia_estimada = totales_amortizacion['total_interes']
+        total_penalidades_acumuladas = totales_amortizacion['total_penalidad']
+
+        # El total pagado no cambia
+        total_pagado = Pago.objects.filter(cuota__prestamo=prestamo).aggregate(
+            total=Coalesce(Sum('monto_pagado'), Value(0), output_field=DecimalField())
+        )['total']
+
+        # Verificar si hay un garante asociado al préstamo
+        garante = None
+        if hasattr(prestamo, 'garante') and prestamo.garante: # Asumiendo ForeignKey o OneToOne
+            garante = prestamo.garante
+
+        return {
+            'el_prestamo_actual': prestamo,
+            'cuotas_del_prestamo': cuotas,
+            'totales_amortizacion': totales_amortizacion,
+            'pago_total_realizado': total_pagado,
+            'ganancia_estimada': ganancia_estimada,
+            'total_faltante': total_faltante,
+            'total_penalidades_acumuladas': total_penalidades_acumuladas,
+            'configuracion': configuracion, # Pasa la configuración global
+            'garante': garante, # Pasa el objeto garante si existe
+        }
 
-    # Agregamos los totales
-    totales_amortizacion = cuotas.aggregate(
-        total_cuota=Coalesce(Sum('monto_cuota'), Value(0), output_field=DecimalField()),
-        total_capital=Coalesce(Sum('capital'), Value(0), output_field=DecimalField()),
-        total_interes=Coalesce(Sum('interes'), Value(0), output_field=DecimalField()),
-        total_penalidad=Coalesce(Sum('monto_penalidad_acumulada'), Value(0), output_field=DecimalField())
+    return respuesta_documento(
+        request, clave_estado_cuenta(prestamo), 'dashboard/loan_detail_print.html',
+        construir_contexto, f'estado_cuenta_prestamo_{prestamo.pk}'
     )
-    totales_amortizacion['total_a_pagar'] = totales_amortizacion['total_cuota'] + totales_amortizacion['total_penalidad']
-
-    ganancia_estimada = totales_amortizacion['total_interes']
-    total_penalidades_acumuladas = totales_amortizacion['total_penalidad']
-
-    # El total pagado no cambia
-    total_pagado = Pago.objects.filter(cuota__prestamo=prestamo).aggregate(
-        total=Coalesce(Sum('monto_pagado'), Value(0), output_field=DecimalField())
-    )['total']
-
-    # Verificar si hay un garante asociado al préstamo
-    garante = None
-    if hasattr(prestamo, 'garante') and prestamo.garante: # Asumiendo ForeignKey o OneToOne
-        garante = prestamo.garante
-
-    context = {
-        'el_prestamo_actual': prestamo,
-        'cuotas_del_prestamo': cuotas,
-        'totales_amortizacion': totales_amortizacion,
-        'pago_total_realizado': total_pagado,
-        'ganancia_estimada': ganancia_estimada,
-        'total_faltante': total_faltante,
-        'total_penalidades_acumuladas': total_penalidades_acumuladas,
-        'configuracion': configuracion, # Pasa la configuración global
-        'garante': garante, # Pasa el objeto garante si existe
-    }
-    return render(request, 'dashboard/loan_detail_print.html', context)
 
 
 @login_required
@@ -413,12 +409,7 @@ def loan_list(request):
     query = request.GET.get('q')
     prestamos = Prestamo.objects.filter(estado='aprobado').select_related('cliente').order_by('-fecha_creacion')
     if query:
-        prestamos = prestamos.filter(
-            Q(id__icontains=query) |
-            Q(cliente__nombres__icontains=query) |
-            Q(cliente__apellidos__icontains=query) |
-            Q(cliente__cedula__icontains=query)
-        )
+        prestamos = buscar_por_cliente(prestamos, query, ruta_cliente='cliente__')
     context = {
         'prestamos': prestamos,
         'query': query
@@ -429,18 +420,14 @@ def loan_list(request):
 def paid_loan_list(request):
     """Muestra una lista de todos los préstamos pagados con funcionalidad de búsqueda."""
     query = request.GET.get('q')
-    prestamos = Prestamo.objects.filter(estado='pagado').select_related('cliente').order_by('-fecha_creacion')
-    if query:
-        prestamos = prestamos.filter(
-            Q(id__icontains=query) |
-            Q(cliente__nombres__icontains=query) |
-            Q(cliente__apellidos__icontains=query) |
-            Q(cliente__cedula__icontains=query)
-        )
+    prestamos, orden = consultar_prestamos(request.GET, 'pagado')
+    pagina = paginar_request(request, prestamos, orden, POR_PAGINA)
     context = {
-        'prestamos': prestamos,
+        'prestamos': pagina,
+        'page_obj': pagina,
         'query': query,
-        'page_title': 'Préstamos Pagados'
+        'page_title': 'Préstamos Pagados',
+        'lista_exportacion': 'prestamos-pagados',
     }
     return render(request, 'dashboard/loan_list.html', context)
 
@@ -464,8 +451,7 @@ def payment_add(request, loan_id):
             
             # Crear el enlace para el recibo si se crearon pagos
             if pagos_creados:
-                pids = ",".join(str(p.id) for p in pagos_creados)
-                receipt_url = reverse('payment_receipt_print') + f'?pids={pids}'
+                receipt_url = reverse('recibo_pago_print', args=[pagos_creados[0].recibo_id])
                 messages.success(request, format_html(
                     'Pago de ${} registrado exitosamente. <a href="{}" target="_blank" class="alert-link">Imprimir Recibo</a>',
                     monto_pagado,
@@ -487,6 +473,43 @@ def payment_add(request, loan_id):
     return render(request, 'dashboard/payment_form.html', context)
 
 
+# Filas rechazadas que se listan en la página; el resto se resume.
+MAX_ERRORES_IMPORTACION = 500
+
+@login_required
+@user_passes_test(lambda user: user.is_staff)
+def payment_import(request):
+    """Carga masiva de pagos desde un CSV de cobradores o del banco."""
+    resumen = None
+    if request.method == 'POST':
+        form = ImportarPagosForm(request.POST, request.FILES)
+        if form.is_valid():
+            # Se lee el archivo subido en streaming, sin cargarlo entero en memoria.
+            archivo = io.TextIOWrapper(form.cleaned_data['archivo'].file, encoding='utf-8-sig', newline='')
+            # Los lotes ya aplicados quedan confirmados aunque la lectura se corte,
+            # así que el resumen se muestra siempre.
+            resumen = importar_pagos(leer_csv(archivo, form.cleaned_data['delimitador']))
+            messages.success(request, f"Se aplicaron {resumen['aplicadas']} de {resumen['filas']} filas (${resumen['monto']:,.2f}).")
+            if resumen['linea_interrumpida']:
+                messages.error(
+                    request,
+                    f"La lectura del archivo se interrumpió en la línea {resumen['linea_interrumpida']}. Las filas anteriores "
+                    "ya se procesaron: corrija el archivo y vuelva a subir solo desde esa línea para no duplicar pagos."
+                )
+            if resumen['errores']:
+                messages.warning(request, f"{len(resumen['errores'])} filas fueron rechazadas; revise el detalle abajo.")
+    else:
+        form = ImportarPagosForm()
+
+    context = {
+        'form': form,
+        'resumen': resumen,
+        'errores': resumen['errores'][:MAX_ERRORES_IMPORTACION] if resumen else [],
+        'errores_ocultos': max(len(resumen['errores']) - MAX_ERRORES_IMPORTACION, 0) if resumen else 0,
+    }
+    return render(request, 'dashboard/payment_import.html', context)
+
+
 @login_required
 def payment_receipt_print(request):
     """
@@ -501,51 +524,95 @@ def payment_receipt_print(request):
     except (ValueError, TypeError):
         return HttpResponse("Error: IDs de pago inválidos.", status=400)
 
-    pagos = Pago.objects.filter(id__in=pid_list).order_by('fecha_pago').select_related('cuota__prestamo__cliente')
-
-    if not pagos.exists():
+    # Una sola lectura para armar la clave; si el recibo ya existe se sirve del disco.
+    # Asumimos que todos los pagos en una transacción son del mismo préstamo
+    origen = Pago.objects.filter(id__in=pid_list).values_list('recibo_id', 'cuota__prestamo_id', 'cuota__prestamo__cliente_id').first()
+    if origen is None:
         return HttpResponse("Error: Pagos no encontrados.", status=404)
+    recibo_id, prestamo_id, cliente_id = origen
+    if recibo_id is not None:
+        # Los pagos con recibo guardado se muestran tal como quedó al cobrarse.
+        return redirect('recibo_pago_print', pk=recibo_id)
+    pid_list = sorted(set(pid_list))
+    clave = clave_documento(
+        f"recibo:{','.join(map(str, pid_list))}", ('prestamo', prestamo_id), ('cliente', cliente_id)
+    )
 
-    # Asumimos que todos los pagos en una transacción son del mismo préstamo
-    prestamo = pagos.first().cuota.prestamo
-    configuracion = ConfiguracionImpresion.load()
-    total_pagado_transaccion = pagos.aggregate(total=Sum('monto_pagado'))['total'] or Decimal('0.00')
-    
-    # --- CÁLCULO DE DATOS ADICIONALES ---
-    # 1. Número de recibo
-    numero_recibo = "-".join(str(pid) for pid in pid_list)
-
-    # 2. Saldo restante del préstamo
-    todas_las_cuotas = prestamo.cuotas.all()
-    saldo_restante_prestamo = Decimal('0.00')
-    for c in todas_las_cuotas:
-        # Se recalcula el estado de cada cuota para asegurar que el total_pagado sea el más reciente
-        # sin llamar a save() para no modificar la base de datos en una vista de solo lectura (GET)
-        c.actualizar_estado() 
-        if c.estado != 'pagada':
-            saldo_restante_prestamo += (c.monto_total_a_pagar - c.total_pagado)
-    
-    # 3. Saldo anterior (antes de esta transacción)
-    saldo_anterior = saldo_restante_prestamo + total_pagado_transaccion
+    def construir_contexto():
+        pagos = Pago.objects.filter(id__in=pid_list).order_by('fecha_pago').select_related('cuota__prestamo__cliente')
+        prestamo = pagos[0].cuota.prestamo
+        configuracion = ConfiguracionImpresion.load()
+        total_pagado_transaccion = pagos.aggregate(total=Sum('monto_pagado'))['total'] or Decimal('0.00')
+
+        # --- CÁLCULO DE DATOS ADICIONALES ---
+        # 1. Número de recibo
+        numero_recibo = "-".join(str(pid) for pid in pid_list)
+
+        # 2. Saldo restante del préstamo: lo que falta de cada cuota (cuota +
+        # penalidad - pagado), sin guardar nada en una vista de solo lectura.
+        saldo_restante_prestamo = prestamo.cuotas.aggregate(
+            saldo=Coalesce(
+                Sum(Greatest(F('monto_cuota') + F('monto_penalidad_acumulada') - F('monto_pagado_acumulado'), Value(Decimal('0.00')))),
+                Value(Decimal('0.00')),
+                output_field=DecimalField()
+            )
+        )['saldo']
+
+        # 3. Saldo anterior (antes de esta transacción)
+        saldo_anterior = saldo_restante_prestamo + total_pagado_transaccion
+
+        # 4. Fecha del próximo pago
+        proxima_cuota_pendiente = prestamo.cuotas.filter(estado__in=['pendiente', 'pagada_parcialmente']).order_by('fecha_vencimiento').first()
+        fecha_proximo_pago = proxima_cuota_pendiente.fecha_vencimiento if proxima_cuota_pendiente else None
+
+        return {
+            'pagos': pagos,
+            'prestamo': prestamo,
+            'cliente': prestamo.cliente,
+            'configuracion': configuracion,
+            'total_pagado_transaccion': total_pagado_transaccion,
+            'fecha_transaccion': pagos[0].fecha_pago,
+            # --- NUEVOS DATOS PARA LA PLANTILLA ---
+            'numero_recibo': numero_recibo,
+            'saldo_restante_prestamo': saldo_restante_prestamo,
+            'saldo_anterior': saldo_anterior,
+            'fecha_proximo_pago': fecha_proximo_pago,
+            'cuotas_pagadas': [pago.cuota.numero_cuota for pago in pagos],
+        }
 
-    # 4. Fecha del próximo pago
-    proxima_cuota_pendiente = prestamo.cuotas.filter(estado__in=['pendiente', 'pagada_parcialmente']).order_by('fecha_vencimiento').first()
-    fecha_proximo_pago = proxima_cuota_pendiente.fecha_vencimiento if proxima_cuota_pendiente else None
+    return respuesta_documento(
+        request, clave, 'dashboard/payment_receipt_print.html', construir_contexto, f"recibo_{'-'.join(map(str, pid_list))}"
+    )
 
-    context = {
-        'pagos': pagos,
-        'prestamo': prestamo,
-        'cliente': prestamo.cliente,
-        'configuracion': configuracion,
-        'total_pagado_transaccion': total_pagado_transaccion,
-        'fecha_transaccion': pagos.first().fecha_pago,
-        # --- NUEVOS DATOS PARA LA PLANTILLA ---
-        'numero_recibo': numero_recibo,
-        'saldo_restante_prestamo': saldo_restante_prestamo,
-        'saldo_anterior': saldo_anterior,
-        'fecha_proximo_pago': fecha_proximo_pago,
-    }
-    return render(request, 'dashboard/payment_receipt_print.html', context)
+
+@login_required
+def recibo_pago_print(request, pk):
+    """
+    Recibo guardado al registrar el pago (`ReciboPago`): una sola consulta y
+    los saldos tal como estaban en ese momento.
+    """
+    recibo = get_object_or_404(ReciboPago.objects.select_related('prestamo__cliente'), pk=pk)
+    prestamo = recibo.prestamo
+
+    def construir_contexto():
+        return {
+            'prestamo': prestamo,
+            'cliente': prestamo.cliente,
+            'configuracion': ConfiguracionImpresion.load(),
+            'total_pagado_transaccion': recibo.monto_total,
+            'fecha_transaccion': recibo.fecha,
+            'numero_recibo': recibo.numero,
+            'saldo_restante_prestamo': recibo.saldo_restante,
+            'saldo_anterior': recibo.saldo_anterior,
+            'fecha_proximo_pago': recibo.fecha_proximo_pago,
+            'cuotas_pagadas': [linea['cuota'] for linea in recibo.detalle],
+        }
+
+    # El recibo no cambia; solo el cliente y la configuración pueden cambiar lo impreso.
+    clave = clave_documento(f'recibo_pago:{recibo.pk}', ('cliente', prestamo.cliente_id))
+    return respuesta_documento(
+        request, clave, 'dashboard/payment_receipt_print.html', construir_contexto, f'recibo_{recibo.numero}'
+    )
 
 
 @login_required
@@ -554,62 +621,137 @@ def cobros_list(request):
     Muestra una lista avanzada de todas las cuotas vencidas y no pagadas,
     con funcionalidades de búsqueda y ordenamiento.
     """
-    hoy = timezone.now().date()
-    
-    # 1. Filtro base para cuotas vencidas
-    cuotas_query = Cuota.objects.filter(
-        fecha_vencimiento__lt=hoy,
-        estado__in=['pendiente', 'pagada_parcialmente', 'vencida']
-    ).select_related('prestamo__cliente')
-
-    # 2. Búsqueda por cliente
+    # 1. Cuotas vencidas filtradas por la búsqueda, con días de atraso y orden
+    cuotas_query, sort_by, orden = consultar_cobros(request.GET)
     query = request.GET.get('q')
-    if query:
-        cuotas_query = cuotas_query.filter(
-            Q(prestamo__cliente__nombres__icontains=query) |
-            Q(prestamo__cliente__apellidos__icontains=query) |
-            Q(prestamo__cliente__numero_documento__icontains=query)
-        )
 
-    # 3. Anotar días de atraso
-    # Usamos F() para referenciar un campo de la base de datos directamente
-    cuotas_query = cuotas_query.annotate(
-        dias_vencido=hoy - F('fecha_vencimiento')
+    # 2. Totales de todas las cuotas que cumplen el filtro, calculados en la base de datos.
+    resumen_cobros = cuotas_query.aggregate(
+        total_cuotas=Count('id'),
+        total_penalidad=Coalesce(Sum('monto_penalidad_acumulada'), Value(Decimal('0.00')), output_field=DecimalField()),
+        total_vencido=Coalesce(
+            Sum(F('monto_cuota') + F('monto_penalidad_acumulada')),
+            Value(Decimal('0.00')),
+            output_field=DecimalField()
+        ),
     )
 
-    # 4. Ordenamiento
-    sort_by = request.GET.get('sort', '-dias_vencido') # Por defecto, más días de atraso primero
-    valid_sort_fields = [
-        'fecha_vencimiento', '-fecha_vencimiento', 
-        'dias_vencido', '-dias_vencido', 
-        'monto_cuota', '-monto_cuota',
-        'monto_penalidad_acumulada', '-monto_penalidad_acumulada',
-        'numero_cuota', '-numero_cuota',
-        'prestamo__cliente__nombres', '-prestamo__cliente__nombres'
-    ]
-    if sort_by not in valid_sort_fields:
-        sort_by = '-dias_vencido'
-    
-    cuotas_vencidas = cuotas_query.order_by(sort_by)
+    # 3. Solo se cargan las filas de la página actual
+    cuotas_vencidas = paginar_request(request, cuotas_query, orden, POR_PAGINA)
 
     context = {
         'cuotas_vencidas': cuotas_vencidas,
+        'page_obj': cuotas_vencidas,
+        'resumen_cobros': resumen_cobros,
         'query': query,
         'current_sort': sort_by,
     }
     return render(request, 'dashboard/cobros_list.html', context)
 
+# --- Vistas de Exportación ---
+
+def _dias_de_atraso(cuota):
+    return (timezone.localdate() - cuota.fecha_vencimiento).days
+
+def _consultar_cobros_para_exportar(parametros):
+    cuotas, _, orden = consultar_cobros(parametros)
+    return cuotas, orden
+
+_COLUMNAS_PRESTAMO = [
+    Columna('ID Préstamo', 'id'),
+    Columna('Cliente', 'cliente'),
+    Columna('Documento', 'cliente.numero_documento'),
+    Columna('Tipo de Préstamo', 'tipo_prestamo.nombre'),
+    Columna('Monto', 'monto'),
+    Columna('Tasa Interés (%)', 'tasa_interes'),
+    Columna('Plazo (meses)', 'plazo'),
+    Columna('Frecuencia', 'get_frecuencia_pago_display'),
+    Columna('Fecha Desembolso', 'fecha_desembolso'),
+    Columna('Fecha de Solicitud', 'fecha_creacion'),
+    Columna('Estado', 'get_estado_display'),
+    Columna('Saldo Pendiente', 'situacion.saldo_pendiente'),
+    Columna('Días de Atraso', 'situacion.dias_atraso'),
+]
+
+# Listados exportables: consulta (con los mismos filtros y orden que la
+# pantalla), columnas y nombre del archivo.
+EXPORTACIONES = {
+    'clientes': (
+        consultar_clientes,
+        [
+            Columna('ID', 'id'),
+            Columna('Nombres', 'nombres'),
+            Columna('Apellidos', 'apellidos'),
+            Columna('Tipo de Documento', 'get_tipo_documento_display'),
+            Columna('Número de Documento', 'numero_documento'),
+            Columna('Teléfono', 'telefono'),
+            Columna('Correo Electrónico', 'email'),
+            Columna('Fecha de Registro', 'fecha_registro'),
+        ],
+        'clientes',
+    ),
+    'prestamos': (lambda parametros: consultar_prestamos(parametros, 'aprobado'), _COLUMNAS_PRESTAMO, 'prestamos_activos'),
+    'prestamos-pagados': (lambda parametros: consultar_prestamos(parametros, 'pagado'), _COLUMNAS_PRESTAMO, 'prestamos_pagados'),
+    'solicitudes': (lambda parametros: consultar_prestamos(parametros, 'pendiente'), _COLUMNAS_PRESTAMO, 'solicitudes'),
+    'cuotas': (
+        consultar_cuotas,
+        [
+            Columna('ID Préstamo', 'prestamo_id'),
+            Columna('Cliente', 'prestamo.cliente'),
+            Columna('No. Cuota', 'numero_cuota'),
+            Columna('Fecha Vencimiento', 'fecha_vencimiento'),
+            Columna('Monto Cuota', 'monto_cuota'),
+            Columna('Capital', 'capital'),
+            Columna('Interés', 'interes'),
+            Columna('Penalidad', 'monto_penalidad_acumulada'),
+            Columna('Pagado', 'monto_pagado_acumulado'),
+            Columna('Saldo de Capital', 'saldo_pendiente'),
+            Columna('Estado', 'get_estado_display'),
+        ],
+        'cuotas',
+    ),
+    'cobros': (
+        _consultar_cobros_para_exportar,
+        [
+            Columna('Cliente', 'prestamo.cliente'),
+            Columna('Documento', 'prestamo.cliente.numero_documento'),
+            Columna('ID Préstamo', 'prestamo_id'),
+            Columna('No. Cuota', 'numero_cuota'),
+            Columna('Fecha Vencimiento', 'fecha_vencimiento'),
+            Columna('Días de Atraso', _dias_de_atraso),
+            Columna('Monto Cuota', 'monto_cuota'),
+            Columna('Penalidad', 'monto_penalidad_acumulada'),
+            Columna('Total a Pagar', 'monto_total_a_pagar'),
+        ],
+        'cobros',
+    ),
+}
+
+@login_required
+@user_passes_test(lambda user: user.is_staff)
+def export_list(request, lista):
+    """
+    Descarga un listado completo en CSV o XLSX (`?formato=xlsx`), respetando
+    la búsqueda y el orden de la pantalla. Las filas se envían a medida que
+    se leen de la base de datos.
+    """
+    if lista not in EXPORTACIONES:
+        raise Http404("Listado no exportable.")
+    consultar, columnas, nombre = EXPORTACIONES[lista]
+    formato = request.GET.get('formato', 'csv')
+    if formato not in TIPOS_CONTENIDO:
+        formato = 'csv'
+
+    consulta, orden = consultar(request.GET)
+    nombre_archivo = f"{nombre}_{timezone.localdate():%Y%m%d}"
+    return respuesta_exportacion(consulta.order_by(*orden), columnas, nombre_archivo, formato)
+
 # --- Vistas para Select2 AJAX ---
 
 @login_required
 def search_clients(request):
     term = request.GET.get('term', '')
-    clientes = Cliente.objects.filter(
-        Q(id__icontains=term) |
-        Q(nombres__icontains=term) |
-        Q(apellidos__icontains=term) |
-        Q(numero_documento__icontains=term)
-    )[:20]
+    clientes = buscar_por_cliente(Cliente.objects.all(), term)[:20]
     results = [
         {
             'id': cliente.id,
@@ -623,7 +765,7 @@ def search_clients(request):
 def search_cuotas(request):
     term = request.GET.get('term', '')
     loan_id = request.GET.get('loan_id')
-    cuotas = Cuota.objects.filter(estado='pendiente')
+    cuotas = Cuota.objects.filter(estado='pendiente').select_related('prestamo__cliente')
     if loan_id:
         cuotas = cuotas.filter(prestamo_id=loan_id)
     if term:
@@ -645,18 +787,21 @@ def search_cuotas(request):
 
 # --- API Views ---
 
+def _etag_tipo_prestamo(request, pk):
+    # Cambia cada vez que se modifica cualquier tipo de préstamo.
+    return f'{version_referencia(REF_TIPOS_PRESTAMO)}-{pk}'
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_etag_tipo_prestamo)
 def get_tipo_prestamo_details(request, pk):
-    """Devuelve los detalles de un tipo de préstamo en formato JSON."""
-    tipo_prestamo = get_object_or_404(TipoPrestamo, pk=pk)
-    data = {
-        'tasa_interes_predeterminada': str(tipo_prestamo.tasa_interes_predeterminada),
-        'monto_minimo': str(tipo_prestamo.monto_minimo),
-        'monto_maximo': str(tipo_prestamo.monto_maximo),
-        'plazo_minimo_meses': tipo_prestamo.plazo_minimo_meses,
-        'plazo_maximo_meses': tipo_prestamo.plazo_maximo_meses,
-        'requiere_garantia': tipo_prestamo.requiere_garantia,
-    }
+    """
+    Devuelve los detalles de un tipo de préstamo en formato JSON.
+    El navegador revalida con el ETag y recibe un 304 mientras los tipos no cambien.
+    """
+    data = obtener_detalles_tipo_prestamo(pk)
+    if data is None:
+        raise Http404("Tipo de préstamo no encontrado.")
     return JsonResponse(data)
 
 
@@ -687,48 +832,65 @@ def calculate_amortization_api(request):
 @login_required
 def financial_details(request):
     """Muestra una página con un desglose detallado de las métricas financieras."""
-    capital_obj = Capital.objects.first()
-    capital_inicial = capital_obj.monto_inicial if capital_obj else Decimal('0.00')
-    total_desembolsado = Prestamo.objects.aggregate(total=Coalesce(Sum('monto'), Decimal('0.00')))['total']
-    total_recibido_pagos = Pago.objects.aggregate(total=Coalesce(Sum('monto_pagado'), Decimal('0.00')))['total']
-    dinero_en_caja = capital_inicial - total_desembolsado + total_recibido_pagos
-    cuotas_pagadas = Cuota.objects.filter(estado='pagada')
-    capital_devuelto = cuotas_pagadas.aggregate(total=Coalesce(Sum('capital'), Decimal('0.00')))['total']
-    ganancia_realizada = cuotas_pagadas.aggregate(total=Coalesce(Sum('interes'), Decimal('0.00')))['total']
-    cartera_activa = total_desembolsado - capital_devuelto
-    ganancia_potencial = Cuota.objects.filter(
-        prestamo__estado='aprobado', 
-        estado__in=['pendiente', 'pagada_parcialmente']
-    ).aggregate(total=Coalesce(Sum('interes'), Decimal('0.00')))['total']
-    num_prestamos_activos = Prestamo.objects.filter(estado='aprobado').count()
-    num_prestamos_pagados = Prestamo.objects.filter(estado='pagado').count()
-    hoy = timezone.now()
-    prestamos_en_atraso = Prestamo.objects.filter(
-        estado='aprobado',
-        cuotas__fecha_vencimiento__lt=hoy,
-        cuotas__estado__in=['pendiente', 'pagada_parcialmente']
-    ).distinct().count()
-    total_prestamos = Prestamo.objects.count()
-    monto_promedio = total_desembolsado / total_prestamos if total_prestamos > 0 else Decimal('0.00')
-    pagos_recientes = Pago.objects.order_by('-fecha_pago')[:10]
-    prestamos_recientes = Prestamo.objects.order_by('-fecha_desembolso')[:5]
+    metricas = obtener_metricas_financieras()
+    pagos_recientes = Pago.objects.select_related('cuota__prestamo__cliente').order_by('-fecha_pago')[:10]
+    prestamos_recientes = Prestamo.objects.select_related('cliente').order_by('-fecha_desembolso')[:5]
     context = {
-        'capital_inicial': capital_inicial,
-        'total_desembolsado': total_desembolsado,
-        'total_recibido_pagos': total_recibido_pagos,
-        'dinero_en_caja': dinero_en_caja,
-        'cartera_activa': cartera_activa,
-        'ganancia_realizada': ganancia_realizada,
-        'ganancia_potencial': ganancia_potencial,
-        'num_prestamos_activos': num_prestamos_activos,
-        'num_prestamos_pagados': num_prestamos_pagados,
-        'num_prestamos_en_atraso': prestamos_en_atraso,
-        'monto_promedio': monto_promedio,
+        'capital_inicial': metricas['capital_inicial'],
+        'total_desembolsado': metricas['total_desembolsado'],
+        'total_recibido_pagos': metricas['total_recibido'],
+        'dinero_en_caja': metricas['dinero_en_caja'],
+        'cartera_activa': metricas['dinero_en_la_calle'],
+        'ganancia_realizada': metricas['ganancia_realizada'],
+        'ganancia_potencial': metricas['ganancia_potencial'],
+        'num_prestamos_activos': metricas['num_prestamos_activos'],
+        'num_prestamos_pagados': metricas['num_prestamos_pagados'],
+        'num_prestamos_en_atraso': metricas['num_prestamos_en_atraso'],
+        'monto_promedio': metricas['monto_promedio'],
         'pagos_recientes': pagos_recientes,
         'prestamos_recientes': prestamos_recientes,
+        # Evolución diaria desde las fotos guardadas por `tomar_foto_cartera`.
+        'serie_cartera': [
+            {
+                'fecha': foto['fecha'].isoformat(),
+                'dinero_en_la_calle': float(foto['dinero_en_la_calle']),
+                'dinero_en_caja': float(foto['dinero_en_caja']),
+                'ganancia_realizada': float(foto['ganancia_realizada']),
+                'num_prestamos_en_atraso': foto['num_prestamos_en_atraso'],
+            }
+            for foto in obtener_serie_cartera()
+        ],
     }
     return render(request, 'dashboard/financial_details.html', context)
 
+@login_required
+def antiguedad_mora(request):
+    """Informe de lo vencido y no cobrado por tramos de días de atraso y por tipo de préstamo."""
+    informe = obtener_antiguedad_mora()
+    context = {
+        'informe': informe,
+        'tramos': [(clave, titulo) for clave, titulo, _, _ in TRAMOS_MORA],
+    }
+    return render(request, 'dashboard/antiguedad_mora.html', context)
+
+@login_required
+def antiguedad_mora_api(request):
+    """El mismo informe de antigüedad de la mora en formato JSON."""
+    return JsonResponse(obtener_antiguedad_mora())
+
+# --- Telemetría ---
+
+def metrics(request):
+    """
+    Contadores e histogramas de gestion_prestamos.telemetria en el formato de
+    texto de Prometheus. Lo pueden leer los usuarios staff y, sin sesión, las
+    IPs de METRICAS_IPS_PERMITIDAS (un scraper local).
+    """
+    # La IP se mira primero para que el scraper no cargue sesión ni usuario.
+    if request.META.get('REMOTE_ADDR') not in settings.METRICAS_IPS_PERMITIDAS and not request.user.is_staff:
+        return HttpResponse('No autorizado.', status=403)
+    return HttpResponse(telemetria.exposicion(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # --- Vistas del Portal de Clientes ---
 
 def client_login(request):
@@ -774,11 +936,10 @@ def portal_dashboard(request):
         messages.info(request, 'Por tu seguridad, es necesario que cambies tu contraseña antes de continuar.')
         return redirect('client_change_password')
 
-    # Obtener todos los préstamos del cliente
-    prestamos = Prestamo.objects.filter(cliente=cliente).order_by('-fecha_desembolso')
-    
-    # Encontrar el préstamo activo y su información relevante
-    prestamo_activo = prestamos.filter(estado='aprobado').first()
+    # Préstamos, saldo y próxima cuota salen de una consulta cacheada por cliente
+    resumen = obtener_resumen_portal(cliente.pk)
+    prestamos = resumen['prestamos']
+    prestamo_activo = resumen['prestamo_activo']
     proxima_cuota = None
     saldo_pendiente_total = Decimal('0.00')
     proximo_pago_mensaje = None
@@ -786,23 +947,24 @@ def portal_dashboard(request):
 
     if prestamo_activo:
         # Mensaje de aprobación reciente
-        if prestamo_activo.fecha_aprobacion and (timezone.now() - prestamo_activo.fecha_aprobacion).days < 1:
+        if prestamo_activo['fecha_aprobacion'] and (timezone.now() - prestamo_activo['fecha_aprobacion']).days < 1:
             mensaje_aprobacion = "¡Tu préstamo ha sido aprobado! Será desembolsado en las próximas 24 horas."
 
-        # Usamos todas las cuotas para el saldo, pero solo las pendientes para la próxima cuota
-        todas_las_cuotas = prestamo_activo.cuotas.all()
-        cuotas_pendientes = todas_las_cuotas.filter(estado__in=['pendiente', 'pagada_parcialmente']).order_by('fecha_vencimiento')
-        proxima_cuota = cuotas_pendientes.first()
-        
-        if proxima_cuota:
-            dias_para_vencimiento = (proxima_cuota.fecha_vencimiento - timezone.now().date()).days
+        saldo_pendiente_total = prestamo_activo['saldo_pendiente']
+
+        if prestamo_activo['proxima_cuota_fecha']:
+            proxima_cuota = {
+                'numero_cuota': prestamo_activo['proxima_cuota_numero'],
+                'monto_cuota': prestamo_activo['proxima_cuota_monto'],
+                'fecha_vencimiento': prestamo_activo['proxima_cuota_fecha'],
+            }
+            # Los días se calculan al mostrar, así el resumen en caché no envejece.
+            dias_para_vencimiento = (proxima_cuota['fecha_vencimiento'] - timezone.now().date()).days
+            proxima_cuota['en_atraso'] = dias_para_vencimiento < 0
             if 0 <= dias_para_vencimiento <= 7:
-                proximo_pago_mensaje = f"Recordatorio: Su próxima cuota de ${proxima_cuota.monto_cuota:,.2f} vence en {dias_para_vencimiento} día(s) (el {proxima_cuota.fecha_vencimiento.strftime('%d/%m/%Y')})."
+                proximo_pago_mensaje = f"Recordatorio: Su próxima cuota de ${proxima_cuota['monto_cuota']:,.2f} vence en {dias_para_vencimiento} día(s) (el {proxima_cuota['fecha_vencimiento'].strftime('%d/%m/%Y')})."
             elif dias_para_vencimiento < 0:
-                proximo_pago_mensaje = f"¡Atención! Su cuota de ${proxima_cuota.monto_cuota:,.2f} está vencida desde el {proxima_cuota.fecha_vencimiento.strftime('%d/%m/%Y')}."
-
-        for cuota in todas_las_cuotas:
-            saldo_pendiente_total += (cuota.monto_cuota - cuota.total_pagado)
+                proximo_pago_mensaje = f"¡Atención! Su cuota de ${proxima_cuota['monto_cuota']:,.2f} está vencida desde el {proxima_cuota['fecha_vencimiento'].strftime('%d/%m/%Y')}."
 
     context = {
         'cliente': cliente,
@@ -834,6 +996,8 @@ class ClientPasswordChangeView(PasswordChangeView):
                 messages.success(self.request, 'Tu contraseña ha sido cambiada exitosamente. Ya puedes navegar por el portal.')
         except AttributeError:
             pass
+        # El middleware deja de redirigir en cuanto la sesión lo sabe
+        self.request.session[SESION_DEBE_CAMBIAR_CONTRASENA] = False
         return response
 
 client_change_password = ClientPasswordChangeView.as_view()
@@ -915,16 +1079,11 @@ def request_loan(request):
 def loan_application_list(request):
     """Muestra una lista de todas las solicitudes de préstamo pendientes."""
     query = request.GET.get('q')
-    prestamos = Prestamo.objects.filter(estado='pendiente').select_related('cliente').order_by('-fecha_creacion')
-    if query:
-        prestamos = prestamos.filter(
-            Q(id__icontains=query) |
-            Q(cliente__nombres__icontains=query) |
-            Q(cliente__apellidos__icontains=query) |
-            Q(cliente__numero_documento__icontains=query)
-        )
+    prestamos, orden = consultar_prestamos(request.GET, 'pendiente')
+    pagina = paginar_request(request, prestamos, orden, POR_PAGINA)
     context = {
-        'prestamos': prestamos,
+        'prestamos': pagina,
+        'page_obj': pagina,
         'query': query,
         'page_title': 'Solicitudes de Préstamo'
     }
@@ -958,17 +1117,7 @@ def loan_application_approve(request, pk):
         # Generar tabla de amortización solo si no existe
         if not prestamo.cuotas.exists():
             try:
-                tabla_amortizacion = calcular_tabla_amortizacion(prestamo)
-                for item_cuota in tabla_amortizacion:
-                    Cuota.objects.create(
-                        prestamo=prestamo,
-                        numero_cuota=item_cuota['numero_cuota'],
-                        fecha_vencimiento=item_cuota['fecha_vencimiento'],
-                        monto_cuota=item_cuota['cuota_fija'],
-                        capital=item_cuota['capital'],
-                        interes=item_cuota['interes'],
-                        saldo_pendiente=item_cuota['saldo_pendiente']
-                    )
+                generar_cuotas(prestamo)
                 messages.success(request, f"La solicitud de préstamo #{prestamo.id} ha sido aprobada y movida a préstamos activos.")
             except Exception as e:
                 messages.error(request, f"Error al generar la tabla de amortización para el préstamo #{prestamo.id}: {e}")
@@ -3,28 +3,22 @@ from django.views.generic.edit import CreateView, UpdateView
 from django.urls import reverse_lazy
 from gestion_prestamos.models import Cliente, Prestamo
 from gestion_prestamos.forms import ClienteForm
-from django.db.models import Q
+from .listados import ORDEN_CLIENTES, ORDEN_PRESTAMOS, consultar_clientes, consultar_prestamos
+from .paginacion import PaginacionKeysetMixin
 
 from django.contrib.auth.models import User
 from django.contrib import messages
 
 
-class ClientListView(ListView):
+class ClientListView(PaginacionKeysetMixin, ListView):
     model = Cliente
     template_name = 'dashboard/client_list.html'
     context_object_name = 'clientes'
     paginate_by = 10
+    orden_keyset = ORDEN_CLIENTES
 
     def get_queryset(self):
-        queryset = super().get_queryset().order_by('-fecha_registro')
-        query = self.request.GET.get('q')
-        if query:
-            queryset = queryset.filter(
-                Q(id__icontains=query) |
-                Q(nombres__icontains=query) |
-                Q(apellidos__icontains=query) |
-                Q(numero_documento__icontains=query)
-            )
+        queryset, _ = consultar_clientes(self.request.GET)
         return queryset
 
     def get_context_data(self, **kwargs):
@@ -83,26 +77,23 @@ class ClientUpdateView(UpdateView):
         context['page_title'] = 'Editar Cliente'
         return context
 
-class LoanListView(ListView):
+class LoanListView(PaginacionKeysetMixin, ListView):
     model = Prestamo
     template_name = 'dashboard/loan_list.html'
     context_object_name = 'prestamos'
     paginate_by = 10
+    orden_keyset = ORDEN_PRESTAMOS
 
     def get_queryset(self):
-        queryset = super().get_queryset().filter(estado='aprobado').select_related('cliente').order_by('-fecha_creacion')
-        query = self.request.GET.get('q')
-        if query:
-            queryset = queryset.filter(
-                Q(id__icontains=query) |
-                Q(cliente__nombres__icontains=query) |
-                Q(cliente__apellidos__icontains=query) |
-                Q(cliente__numero_documento__icontains=query)
-            )
+        queryset, self.orden_keyset = consultar_prestamos(self.request.GET, 'aprobado')
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['query'] = self.request.GET.get('q', '')
         context['page_title'] = 'Préstamos Activos'
+        context['lista_exportacion'] = 'prestamos'
+        context['current_sort'] = self.request.GET.get('sort', '')
+        context['solo_atraso'] = bool(self.request.GET.get('atraso'))
+        context['ordenar_por_situacion'] = True
         return context
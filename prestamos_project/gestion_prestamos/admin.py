@@ -1,5 +1,5 @@
 from django.contrib import admin, messages
-from .models import Cliente, Prestamo, Cuota, Pago, TipoPrestamo, Capital, TipoGasto, GastoPrestamo
+from .models import Cliente, Prestamo, Cuota, Pago, TipoPrestamo, Capital, TipoGasto, GastoPrestamo, PortfolioSnapshot, ReciboPago, SituacionPrestamo
 from django.contrib.auth.models import User
 import secrets
 import string
@@ -45,7 +45,7 @@ class GastoPrestamoInline(admin.TabularInline):
 class CuotaInline(admin.TabularInline):
     model = Cuota
     extra = 0
-    readonly_fields = ('numero_cuota', 'fecha_vencimiento', 'monto_cuota', 'capital', 'interes', 'saldo_pendiente', 'estado', 'monto_penalidad_acumulada')
+    readonly_fields = ('numero_cuota', 'fecha_vencimiento', 'monto_cuota', 'capital', 'interes', 'saldo_pendiente', 'estado', 'monto_penalidad_acumulada', 'monto_pagado_acumulado')
     can_delete = False
     classes = ['collapse']
 
@@ -122,6 +122,45 @@ class CapitalAdmin(admin.ModelAdmin):
         # Permitir añadir solo si no existe ningún registro de capital
         return not Capital.objects.exists()
 
+@admin.register(PortfolioSnapshot)
+class PortfolioSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'dinero_en_caja', 'dinero_en_la_calle', 'ganancia_realizada', 'num_prestamos_en_atraso', 'reconstruida')
+    list_filter = ('reconstruida',)
+    date_hierarchy = 'fecha'
+
+    def has_add_permission(self, request):
+        # Las fotos solo las genera el comando `tomar_foto_cartera`.
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ReciboPago)
+class ReciboPagoAdmin(admin.ModelAdmin):
+    list_display = ('numero', 'prestamo', 'fecha', 'monto_total', 'saldo_anterior', 'saldo_restante')
+    date_hierarchy = 'fecha'
+    raw_id_fields = ('prestamo',)
+
+    def has_add_permission(self, request):
+        # Los recibos solo se emiten al registrar un pago.
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(SituacionPrestamo)
+class SituacionPrestamoAdmin(admin.ModelAdmin):
+    list_display = ('prestamo', 'saldo_pendiente', 'total_pagado', 'total_penalidades', 'cuotas_pendientes', 'proximo_vencimiento', 'fecha_actualizacion')
+    list_filter = ('proximo_vencimiento',)
+    raw_id_fields = ('prestamo',)
+
+    def has_add_permission(self, request):
+        # Se mantiene sola; para rehacerla, `reconstruir_situacion_prestamos`.
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(TipoGasto)
 class TipoGastoAdmin(admin.ModelAdmin):
     list_display = ('nombre', 'descripcion')
@@ -1,8 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _restaurar_indice_busqueda(sender, using, **kwargs):
+    from .busqueda import restaurar_triggers_fts
+    restaurar_triggers_fts(using)
+
 
 class PrestamosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gestion_prestamos'
 
     def ready(self):
-        import gestion_prestamos.signals
\ No newline at end of file
+        import gestion_prestamos.signals
+        # Los triggers FTS de SQLite se pierden cuando una migración reconstruye la tabla de clientes.
+        post_migrate.connect(_restaurar_indice_busqueda, sender=self)
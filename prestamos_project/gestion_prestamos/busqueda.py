@@ -0,0 +1,156 @@
+import logging
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+# ==================================================
+# === BÚSQUEDA DE CLIENTES ===
+# ==================================================
+# Búsqueda por nombre, apellido o documento respaldada por un índice:
+#   - PostgreSQL: índices GIN con `gin_trgm_ops` (extensión pg_trgm) sobre
+#     `UPPER(campo::text)`, que es exactamente la expresión en la que Django
+#     compila `icontains`; un índice sobre la columna sola no se usaría.
+#     Se crean en las migraciones 0029 y 0035.
+#   - SQLite: tabla virtual FTS5 `prestamos_cliente_fts` con tokenizador
+#     trigram, sincronizada con `prestamos_cliente` mediante triggers
+#     (migración 0029). Cuando una migración cambia un campo de Cliente,
+#     Django reconstruye la tabla en SQLite y sus triggers se pierden;
+#     `restaurar_triggers_fts` los vuelve a crear al final de cada `migrate`.
+# En otros motores se usa `icontains`.
+
+TABLA_FTS_CLIENTES = 'prestamos_cliente_fts'
+CAMPOS_BUSQUEDA_CLIENTE = ('nombres', 'apellidos', 'numero_documento')
+
+# Los índices de trigramas no pueden usar términos de menos de 3 caracteres.
+LONGITUD_MINIMA_TRIGRAMA = 3
+
+_fts_disponible = {}
+
+# Triggers que mantienen la tabla FTS al día; los mismos de la migración 0029.
+TRIGGERS_FTS_CLIENTES = {
+    'prestamos_cliente_fts_ai': """
+        CREATE TRIGGER IF NOT EXISTS prestamos_cliente_fts_ai AFTER INSERT ON prestamos_cliente BEGIN
+            INSERT INTO prestamos_cliente_fts(rowid, nombres, apellidos, numero_documento)
+            VALUES (new.id, new.nombres, new.apellidos, new.numero_documento);
+        END
+    """,
+    'prestamos_cliente_fts_ad': """
+        CREATE TRIGGER IF NOT EXISTS prestamos_cliente_fts_ad AFTER DELETE ON prestamos_cliente BEGIN
+            INSERT INTO prestamos_cliente_fts(prestamos_cliente_fts, rowid, nombres, apellidos, numero_documento)
+            VALUES ('delete', old.id, old.nombres, old.apellidos, old.numero_documento);
+        END
+    """,
+    'prestamos_cliente_fts_au': """
+        CREATE TRIGGER IF NOT EXISTS prestamos_cliente_fts_au AFTER UPDATE ON prestamos_cliente BEGIN
+            INSERT INTO prestamos_cliente_fts(prestamos_cliente_fts, rowid, nombres, apellidos, numero_documento)
+            VALUES ('delete', old.id, old.nombres, old.apellidos, old.numero_documento);
+            INSERT INTO prestamos_cliente_fts(rowid, nombres, apellidos, numero_documento)
+            VALUES (new.id, new.nombres, new.apellidos, new.numero_documento);
+        END
+    """,
+}
+
+
+def _usa_fts_sqlite():
+    """Indica si la base de datos actual es SQLite y tiene la tabla FTS5 creada."""
+    if connection.vendor != 'sqlite':
+        return False
+    nombre_bd = connection.settings_dict['NAME']
+    if nombre_bd not in _fts_disponible:
+        _fts_disponible[nombre_bd] = TABLA_FTS_CLIENTES in connection.introspection.table_names()
+    return _fts_disponible[nombre_bd]
+
+
+def restaurar_triggers_fts(using=DEFAULT_DB_ALIAS):
+    """
+    Vuelve a crear los triggers de la tabla FTS de clientes que falten (SQLite
+    los borra al reconstruir `prestamos_cliente` en un AlterField) y, si faltaba
+    alguno, reconstruye el índice con los datos actuales. Devuelve los nombres
+    de los triggers recreados.
+    """
+    conexion = connections[using]
+    if conexion.vendor != 'sqlite' or TABLA_FTS_CLIENTES not in conexion.introspection.table_names():
+        return []
+    with conexion.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'prestamos_cliente'"
+        )
+        existentes = {nombre for nombre, in cursor.fetchall()}
+        faltantes = [nombre for nombre in TRIGGERS_FTS_CLIENTES if nombre not in existentes]
+        if not faltantes:
+            return []
+        for nombre in faltantes:
+            cursor.execute(TRIGGERS_FTS_CLIENTES[nombre])
+        cursor.execute(f"INSERT INTO {TABLA_FTS_CLIENTES}({TABLA_FTS_CLIENTES}) VALUES ('rebuild')")
+    logger.warning('Se recrearon los triggers de búsqueda de clientes: %s', ', '.join(faltantes))
+    return faltantes
+
+
+def _q_icontains(termino, ruta_cliente):
+    """OR de `icontains` sobre los campos de búsqueda del cliente."""
+    condicion = Q()
+    for campo in CAMPOS_BUSQUEDA_CLIENTE:
+        condicion |= Q(**{f'{ruta_cliente}{campo}__icontains': termino})
+    return condicion
+
+
+def _expresion_match(terminos):
+    """Convierte los términos en una consulta FTS5: cada uno como frase literal, todos obligatorios."""
+    return ' '.join('"{}"'.format(termino.replace('"', '""')) for termino in terminos)
+
+
+def buscar_por_cliente(queryset, texto, ruta_cliente='', campo_id='pk'):
+    """
+    Filtra `queryset` por los datos del cliente relacionado.
+
+    Primero prueba la vía rápida: coincidencia exacta del número de documento
+    (índice único). Si no la hay, cada palabra del texto debe aparecer en el
+    nombre, el apellido o el documento del cliente, usando el índice de
+    búsqueda de la base de datos; si el texto es numérico, también entran los
+    registros cuyo `campo_id` sea ese número. El ID nunca excluye a los
+    clientes cuyo documento contiene los dígitos escritos.
+
+    Args:
+        queryset (QuerySet): Consulta a filtrar (clientes, préstamos, cuotas...).
+        texto (str): Lo que escribió el usuario.
+        ruta_cliente (str): Camino hasta el cliente desde el modelo de la
+            consulta, terminado en '__' (p. ej. 'cliente__'), o '' si la
+            consulta es de clientes.
+        campo_id (str): Campo que se compara con el texto cuando es un número
+            (el ID del cliente, del préstamo...). `None` desactiva esa comparación.
+
+    Returns:
+        QuerySet: La consulta filtrada.
+    """
+    texto = (texto or '').strip()
+    if not texto:
+        return queryset
+
+    # --- Vía rápida: documento exacto ---
+    coincidencias_exactas = queryset.filter(**{f'{ruta_cliente}numero_documento': texto})
+    if coincidencias_exactas.exists():
+        return coincidencias_exactas
+
+    # --- Búsqueda por palabras ---
+    terminos = texto.split()
+    largos = [t for t in terminos if len(t) >= LONGITUD_MINIMA_TRIGRAMA]
+    cortos = [t for t in terminos if len(t) < LONGITUD_MINIMA_TRIGRAMA]
+
+    condicion = Q()
+    if largos and _usa_fts_sqlite():
+        ids_clientes = RawSQL(
+            f'SELECT rowid FROM {TABLA_FTS_CLIENTES} WHERE {TABLA_FTS_CLIENTES} MATCH %s',
+            [_expresion_match(largos)]
+        )
+        condicion &= Q(**{f'{ruta_cliente}id__in': ids_clientes})
+    else:
+        cortos = terminos
+
+    for termino in cortos:
+        condicion &= _q_icontains(termino, ruta_cliente)
+
+    if campo_id and texto.isdigit():
+        condicion |= Q(**{campo_id: int(texto)})
+    return queryset.filter(condicion)
@@ -1,5 +1,6 @@
 from django import forms
 from .models import Cliente, Prestamo, Pago, Cuota, TipoPrestamo, GastoPrestamo, TipoGasto, Requisito, Garante
+from .referencias import obtener_opciones_tipo_gasto
 from django_select2.forms import Select2Widget
 from datetime import date
 import re
@@ -207,6 +208,9 @@ class GastoPrestamoForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['tipo_gasto'].required = False
+        # Las opciones salen de la caché de referencias: el formset de gastos
+        # ya no consulta la tabla una vez por formulario.
+        self.fields['tipo_gasto'].choices = [('', self.fields['tipo_gasto'].empty_label)] + obtener_opciones_tipo_gasto()
         self.fields['monto'].required = False
         self.fields['descripcion'].required = False
 
@@ -247,6 +251,18 @@ class PagoForm(forms.Form):
         widget=forms.NumberInput(attrs={'class': 'form-control'})
     )
 
+class ImportarPagosForm(forms.Form):
+    archivo = forms.FileField(
+        label='Archivo CSV',
+        help_text="Columnas: 'prestamo' o 'documento', 'monto' y opcionalmente 'fecha' (AAAA-MM-DD o DD/MM/AAAA).",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,text/csv'})
+    )
+    delimitador = forms.ChoiceField(
+        label='Separador',
+        choices=[(',', 'Coma (,)'), (';', 'Punto y coma (;)')],
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+
 class RequisitoForm(forms.ModelForm):
     class Meta:
         model = Requisito
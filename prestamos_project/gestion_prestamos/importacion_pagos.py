@@ -0,0 +1,279 @@
+import csv
+import datetime
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from . import telemetria
+from .models import ESTADOS_CUOTA_ABIERTA, ESTADOS_PRESTAMO_EN_COBRO, Cuota, Pago, Prestamo, ReciboPago, cartera_modificada
+
+logger = logging.getLogger(__name__)
+
+# ==================================================
+# === IMPORTACIÓN MASIVA DE PAGOS ===
+# ==================================================
+# Carga los cobros que traen los cobradores o el banco en un CSV con una fila
+# por pago: préstamo (id) o documento del cliente, monto y fecha. El archivo
+# se lee en streaming y se procesa por lotes: cada lote resuelve sus
+# préstamos con dos consultas, bloquea préstamos y cuotas abiertas, reparte
+# los pagos en memoria con `Prestamo.distribuir_pago` (la misma lógica que
+# `registrar_pago`) y guarda todo con bulk_create/bulk_update en una sola
+# transacción. Una fila con problemas no detiene el resto; se informa con su
+# número de línea.
+#
+# Como cada lote se confirma por separado, un archivo que no se puede seguir
+# leyendo (codificación o CSV mal formado) no anula la importación: se
+# aplican las filas anteriores, se informa la línea donde se cortó y el
+# resumen sigue diciendo qué se registró, para volver a subir solo el resto.
+
+TAMANO_LOTE = 500
+
+# Nombres aceptados para cada columna del encabezado.
+ALIAS_COLUMNAS = {
+    'prestamo': 'prestamo', 'prestamo_id': 'prestamo', 'id_prestamo': 'prestamo',
+    'documento': 'documento', 'numero_documento': 'documento', 'cedula': 'documento',
+    'monto': 'monto', 'monto_pagado': 'monto',
+    'fecha': 'fecha', 'fecha_pago': 'fecha',
+}
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y')
+
+
+class ErrorFila(ValueError):
+    """Una fila del archivo que no se puede aplicar; el mensaje va al informe."""
+
+
+class ErrorLectura(ValueError):
+    """El archivo no se puede seguir leyendo a partir de la línea `linea`."""
+
+    def __init__(self, linea, mensaje):
+        super().__init__(mensaje)
+        self.linea = linea
+
+
+def leer_csv(archivo, delimitador=','):
+    """
+    Recorre un CSV de texto y devuelve (número de línea, fila) con las
+    columnas normalizadas a 'prestamo', 'documento', 'monto' y 'fecha'.
+
+    Raises:
+        ErrorLectura: Si el encabezado no tiene monto ni una forma de identificar
+            el préstamo, o si una línea no se puede decodificar o no es CSV válido.
+    """
+    lector = csv.reader(archivo, delimiter=delimitador)
+    try:
+        encabezado = next(lector, None)
+        if encabezado is None:
+            return
+        columnas = [ALIAS_COLUMNAS.get(nombre.strip().lstrip('\ufeff').lower()) for nombre in encabezado]
+        if 'monto' not in columnas or not {'prestamo', 'documento'} & set(columnas):
+            raise ErrorLectura(1, "El archivo debe tener la columna 'monto' y una columna 'prestamo' o 'documento'.")
+
+        for valores in lector:
+            if not any(valor.strip() for valor in valores):
+                continue
+            fila = {columna: valor.strip() for columna, valor in zip(columnas, valores) if columna}
+            yield lector.line_num, fila
+    except csv.Error as error:
+        raise ErrorLectura(lector.line_num, f'CSV mal formado: {error}.') from error
+    except UnicodeDecodeError as error:
+        # El texto se decodifica por bloques: la línea es la primera que no se llegó a leer.
+        raise ErrorLectura(lector.line_num + 1, f'El archivo no está en UTF-8: {error}.') from error
+
+
+def _interpretar_monto(texto):
+    texto = texto.replace(' ', '').replace('$', '')
+    if ',' in texto and '.' not in texto:
+        texto = texto.replace(',', '.')
+    else:
+        texto = texto.replace(',', '')
+    try:
+        monto = Decimal(texto).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ErrorFila(f"Monto inválido: '{texto}'.")
+    if monto <= 0:
+        raise ErrorFila('El monto debe ser mayor que cero.')
+    return monto
+
+
+def _interpretar_fecha(texto, hoy):
+    if not texto:
+        return hoy
+    for formato in FORMATOS_FECHA:
+        try:
+            fecha = datetime.datetime.strptime(texto, formato).date()
+            break
+        except ValueError:
+            continue
+    else:
+        raise ErrorFila(f"Fecha inválida: '{texto}' (use AAAA-MM-DD o DD/MM/AAAA).")
+    if fecha > hoy:
+        raise ErrorFila('La fecha del pago no puede ser futura.')
+    return fecha
+
+
+def _interpretar_fila(fila, hoy):
+    """Devuelve (referencia, monto, fecha); la referencia es ('prestamo', id) o ('documento', texto)."""
+    if fila.get('prestamo'):
+        if not fila['prestamo'].isdigit():
+            raise ErrorFila(f"ID de préstamo inválido: '{fila['prestamo']}'.")
+        referencia = ('prestamo', int(fila['prestamo']))
+    elif fila.get('documento'):
+        referencia = ('documento', fila['documento'])
+    else:
+        raise ErrorFila('Falta el préstamo o el documento del cliente.')
+    return referencia, _interpretar_monto(fila.get('monto', '')), _interpretar_fecha(fila.get('fecha', ''), hoy)
+
+
+def _resolver_prestamos(referencias):
+    """Traduce las referencias de un lote a ids de préstamo con una consulta por tipo."""
+    ids = {valor for tipo, valor in referencias if tipo == 'prestamo'}
+    documentos = {valor for tipo, valor in referencias if tipo == 'documento'}
+    resueltos = {}
+    if ids:
+        for pk in Prestamo.objects.filter(pk__in=ids).values_list('pk', flat=True):
+            resueltos[('prestamo', pk)] = pk
+    if documentos:
+        # Un cliente solo puede tener un préstamo en cobro a la vez.
+        activos = Prestamo.objects.filter(cliente__numero_documento__in=documentos, estado__in=ESTADOS_PRESTAMO_EN_COBRO)
+        for pk, documento in activos.values_list('pk', 'cliente__numero_documento'):
+            resueltos[('documento', documento)] = pk
+    return resueltos
+
+
+def _aplicar_lote(filas, hoy, resumen):
+    interpretadas = []
+    for linea, fila in filas:
+        try:
+            interpretadas.append((linea, *_interpretar_fila(fila, hoy)))
+        except ErrorFila as error:
+            resumen['errores'].append((linea, str(error)))
+
+    resueltos = _resolver_prestamos({referencia for _, referencia, _, _ in interpretadas})
+    pendientes = []
+    for linea, referencia, monto, fecha in interpretadas:
+        if referencia in resueltos:
+            pendientes.append((linea, resueltos[referencia], monto, fecha))
+        elif referencia[0] == 'prestamo':
+            resumen['errores'].append((linea, f'El préstamo #{referencia[1]} no existe.'))
+        else:
+            resumen['errores'].append((linea, f'No hay un préstamo en cobro para el documento {referencia[1]}.'))
+    if not pendientes:
+        return
+
+    prestamo_ids = {prestamo_id for _, prestamo_id, _, _ in pendientes}
+    try:
+        with transaction.atomic():
+            prestamos = Prestamo.objects.select_for_update().only('id', 'estado').in_bulk(prestamo_ids)
+            cuotas_por_prestamo = {}
+            cuotas_abiertas = (
+                Cuota.objects.select_for_update()
+                .filter(prestamo_id__in=prestamo_ids, estado__in=ESTADOS_CUOTA_ABIERTA)
+                .order_by('prestamo_id', 'numero_cuota')
+            )
+            for cuota in cuotas_abiertas:
+                cuotas_por_prestamo.setdefault(cuota.prestamo_id, []).append(cuota)
+
+            recibos, pagos_por_recibo, cuotas_modificadas, aplicadas, saldados = [], [], {}, [], []
+            for linea, prestamo_id, monto, fecha in pendientes:
+                prestamo = prestamos[prestamo_id]
+                cuotas = [cuota for cuota in cuotas_por_prestamo.get(prestamo_id, []) if cuota.estado != 'pagada']
+                saldo = sum((cuota.monto_total_a_pagar - cuota.monto_pagado_acumulado for cuota in cuotas), Decimal('0.00'))
+                if prestamo.estado not in ESTADOS_PRESTAMO_EN_COBRO:
+                    resumen['errores'].append((linea, f'El préstamo #{prestamo_id} está {prestamo.get_estado_display().lower()}.'))
+                    continue
+                if monto > saldo:
+                    resumen['errores'].append((linea, f'El monto ${monto:,.2f} supera el saldo del préstamo #{prestamo_id} (${saldo:,.2f}).'))
+                    continue
+
+                fecha_pago = timezone.make_aware(datetime.datetime.combine(fecha, datetime.time(12)))
+                pagos, modificadas, recibo = prestamo.distribuir_pago(cuotas, monto, fecha_pago)
+                recibos.append(recibo)
+                pagos_por_recibo.append(pagos)
+                cuotas_modificadas.update((cuota.pk, cuota) for cuota in modificadas)
+                aplicadas.append(monto)
+                if all(cuota.estado == 'pagada' for cuota in cuotas):
+                    prestamo.estado = 'pagado'
+                    saldados.append(prestamo_id)
+
+            ReciboPago.objects.bulk_create(recibos)
+            pagos = []
+            for recibo, pagos_del_recibo in zip(recibos, pagos_por_recibo):
+                for pago in pagos_del_recibo:
+                    pago.recibo = recibo
+                    pagos.append(pago)
+            Pago.objects.bulk_create(pagos)
+            Cuota.objects.bulk_update(cuotas_modificadas.values(), ['monto_pagado_acumulado', 'estado'], batch_size=TAMANO_LOTE)
+            Prestamo.objects.filter(pk__in=saldados).update(estado='pagado')
+
+            cartera_modificada.send(sender=Pago, prestamo_ids=list(prestamo_ids))
+            telemetria.incrementar_al_confirmar('prestamos_pagos_registrados_total', len(recibos))
+            telemetria.incrementar_al_confirmar('prestamos_pagos_monto_total', sum(aplicadas, Decimal('0.00')))
+    except DatabaseError as error:
+        logger.exception('Falló un lote de la importación de pagos')
+        resumen['errores'].extend((linea, f'Lote revertido por un error de la base de datos: {error}') for linea, *_ in pendientes)
+        return
+
+    resumen['aplicadas'] += len(aplicadas)
+    resumen['monto'] += sum(aplicadas, Decimal('0.00'))
+    resumen['pagos'] += len(pagos)
+    resumen['prestamos_saldados'] += len(saldados)
+
+
+def _lotes(filas, tamano_lote, resumen):
+    """
+    Agrupa `filas` en listas de `tamano_lote`. Si el archivo deja de poder
+    leerse, devuelve lo leído hasta ahí y anota la línea en el resumen.
+    """
+    lote, ultima_linea = [], 0
+    try:
+        for ultima_linea, fila in filas:
+            lote.append((ultima_linea, fila))
+            if len(lote) == tamano_lote:
+                yield lote
+                lote = []
+    except (ErrorLectura, csv.Error, UnicodeDecodeError) as error:
+        linea = getattr(error, 'linea', ultima_linea + 1)
+        resumen['linea_interrumpida'] = linea
+        resumen['errores'].append((linea, f'No se pudo leer el archivo desde esta línea: {error} Las filas siguientes no se procesaron.'))
+    if lote:
+        yield lote
+
+
+def importar_pagos(filas, tamano_lote=TAMANO_LOTE, hoy=None):
+    """
+    Aplica los pagos de `filas` (como las devuelve `leer_csv`) por lotes de
+    `tamano_lote` filas, cada lote en su propia transacción.
+
+    Un error de lectura no se propaga: las filas anteriores se aplican, el
+    error queda en `errores` con su línea y `linea_interrumpida` la indica.
+
+    Returns:
+        dict: filas leídas, filas aplicadas, monto total, pagos creados,
+        préstamos saldados, errores (lista de (línea, mensaje)), línea donde
+        se interrumpió la lectura (o None) y segundos.
+    """
+    inicio = time.perf_counter()
+    hoy = hoy or timezone.localdate()
+    resumen = {
+        'filas': 0, 'aplicadas': 0, 'monto': Decimal('0.00'), 'pagos': 0,
+        'prestamos_saldados': 0, 'errores': [], 'linea_interrumpida': None, 'segundos': 0.0,
+    }
+    for lote in _lotes(filas, tamano_lote, resumen):
+        resumen['filas'] += len(lote)
+        _aplicar_lote(lote, hoy, resumen)
+
+    resumen['errores'].sort()
+    resumen['segundos'] = time.perf_counter() - inicio
+    logger.info(
+        'Importación de pagos: %s de %s filas aplicadas (%s pagos) en %.2f s',
+        resumen['aplicadas'], resumen['filas'], resumen['pagos'], resumen['segundos']
+    )
+    return resumen
+
+
+def escribir_informe_errores(errores, destino):
+    """Escribe los errores de una importación como CSV (línea, error)."""
+    escritor = csv.writer(destino)
+    escritor.writerow(['linea', 'error'])
+    escritor.writerows(errores)
@@ -1,12 +1,19 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from gestion_prestamos.models import Cuota, Prestamo
-from gestion_prestamos.utils import calcular_penalidad_cuota
+from gestion_prestamos.utils import aplicar_penalidades_en_lote, calcular_penalidad_cuota, situacion_diferida
 from decimal import Decimal
 
 class Command(BaseCommand):
     help = 'Actualiza el estado y las penalidades de las cuotas vencidas.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--por-fila',
+            action='store_true',
+            help='Procesa cuota por cuota mostrando el detalle, en lugar de usar UPDATEs en lote.'
+        )
+
     def handle(self, *args, **kwargs):
         self.stdout.write(self.style.SUCCESS('--- Iniciando la actualización de cuotas vencidas ---'))
         
@@ -25,20 +32,30 @@ class Command(BaseCommand):
         cuotas_actualizadas_count = 0
         prestamos_afectados = set()
 
-        for cuota in cuotas_vencidas:
-            # 1. Actualizar el estado a 'vencida' si es 'pendiente'
-            if cuota.estado == 'pendiente':
-                cuota.estado = 'vencida'
-                cuota.save() # Guardar el cambio de estado
-            
-            # 2. Calcular la penalidad
-            # La función calcular_penalidad_cuota ya guarda la cuota si hay cambios.
-            calcular_penalidad_cuota(cuota)
+        if kwargs['por_fila']:
+            # La situación de cada préstamo se recalcula una vez al final, no por cuota.
+            with situacion_diferida():
+                for cuota in cuotas_vencidas:
+                    # 1. Actualizar el estado a 'vencida' si es 'pendiente'
+                    if cuota.estado == 'pendiente':
+                        cuota.estado = 'vencida'
+                        cuota.save(update_fields=['estado']) # Guardar el cambio de estado
+
+                    # 2. Calcular la penalidad
+                    # La función calcular_penalidad_cuota ya guarda la cuota si hay cambios.
+                    calcular_penalidad_cuota(cuota)
+
+                    cuotas_actualizadas_count += 1
+                    prestamos_afectados.add(cuota.prestamo.id)
 
-            cuotas_actualizadas_count += 1
-            prestamos_afectados.add(cuota.prestamo.id)
+                    self.stdout.write(f'  - Cuota #{cuota.numero_cuota} del Préstamo #{cuota.prestamo.id} actualizada. Penalidad acumulada: ${cuota.monto_penalidad_acumulada:,.2f}')
+        else:
+            prestamos_afectados = set(cuotas_vencidas.order_by().values_list('prestamo_id', flat=True).distinct())
+            cuotas_actualizadas_count = cuotas_vencidas.count()
 
-            self.stdout.write(f'  - Cuota #{cuota.numero_cuota} del Préstamo #{cuota.prestamo.id} actualizada. Penalidad acumulada: ${cuota.monto_penalidad_acumulada:,.2f}')
+            # Mismo orden que el proceso por fila: primero el estado, luego la penalidad.
+            cuotas_vencidas.filter(estado='pendiente').update(estado='vencida')
+            aplicar_penalidades_en_lote(hoy)
 
         # 3. (Opcional) Actualizar el estado de los préstamos que ahora están vencidos.
         # Un préstamo se considera vencido si tiene al menos una cuota vencida.
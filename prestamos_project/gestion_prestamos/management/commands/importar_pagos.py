@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from gestion_prestamos.importacion_pagos import TAMANO_LOTE, escribir_informe_errores, importar_pagos, leer_csv
+
+class Command(BaseCommand):
+    help = 'Aplica los pagos de un CSV (prestamo o documento, monto, fecha) por lotes, con un informe de las filas rechazadas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del CSV con encabezado.')
+        parser.add_argument('--delimitador', default=',', help='Separador de columnas (por defecto ",").')
+        parser.add_argument('--codificacion', default='utf-8-sig', help='Codificación del archivo.')
+        parser.add_argument('--tamano-lote', type=int, default=TAMANO_LOTE, help='Filas por transacción.')
+        parser.add_argument('--errores', help='Si se indica, guarda aquí las filas rechazadas como CSV.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('--- Iniciando la importación de pagos ---'))
+
+        try:
+            with open(options['archivo'], newline='', encoding=options['codificacion']) as archivo:
+                resumen = importar_pagos(leer_csv(archivo, options['delimitador']), tamano_lote=options['tamano_lote'])
+        except OSError as error:
+            raise CommandError(f'No se pudo abrir el archivo: {error}')
+
+        for linea, mensaje in resumen['errores']:
+            self.stdout.write(self.style.WARNING(f'Línea {linea}: {mensaje}'))
+        if options['errores'] and resumen['errores']:
+            with open(options['errores'], 'w', newline='', encoding='utf-8') as destino:
+                escribir_informe_errores(resumen['errores'], destino)
+            self.stdout.write(f'Informe de errores guardado en {options["errores"]}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Filas aplicadas: {resumen["aplicadas"]} de {resumen["filas"]} '
+            f'(${resumen["monto"]:,.2f} en {resumen["pagos"]} pagos, {resumen["prestamos_saldados"]} préstamos saldados) '
+            f'en {resumen["segundos"]:.2f} s'
+        ))
+        if resumen['errores']:
+            self.stdout.write(self.style.ERROR(f'Filas rechazadas: {len(resumen["errores"])}'))
+        if resumen['linea_interrumpida']:
+            # Los lotes anteriores ya están confirmados: se informa después del resumen.
+            raise CommandError(
+                f'La lectura se interrumpió en la línea {resumen["linea_interrumpida"]}; '
+                'las filas anteriores ya se procesaron. Reanude desde esa línea para no duplicar pagos.'
+            )
@@ -0,0 +1,20 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.documentos import limpiar_documentos
+
+class Command(BaseCommand):
+    help = (
+        'Borra de DOCUMENTOS_CACHE_DIR los estados de cuenta y recibos en caché que no se generaron en los '
+        'últimos días (ejecutar cada noche). Los que sigan vigentes se regeneran al pedirlos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=7, help='Antigüedad mínima, en días, de lo que se borra (por defecto 7).')
+
+    def handle(self, *args, **options):
+        if options['dias'] < 0:
+            raise CommandError('--dias no puede ser negativo.')
+        borrados, liberados = limpiar_documentos(timedelta(days=options['dias']))
+        self.stdout.write(self.style.SUCCESS(
+            f'Se borraron {borrados} documento(s) en caché ({liberados / 1024 / 1024:.1f} MB liberados).'
+        ))
@@ -0,0 +1,53 @@
+import datetime
+import sys
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.medicion_vistas import escribir_informe, medir_vistas
+
+class Command(BaseCommand):
+    help = (
+        'Mide consultas y milisegundos de cada URL del dashboard y del portal contra sus presupuestos '
+        '(dashboard/medicion_vistas.py) y guarda un informe JSON. Termina con error si alguna se pasa.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--generar', action='store_true',
+            help='Antes de medir, reemplaza los datos con populate_data. ¡Borra clientes, préstamos y pagos!'
+        )
+        parser.add_argument('--clients', type=int, default=300, help='Clientes a generar con --generar (por defecto 300).')
+        parser.add_argument('--seed', type=int, default=42, help='Semilla de populate_data (por defecto 42).')
+        parser.add_argument(
+            '--fecha-referencia', type=datetime.date.fromisoformat, default=None,
+            help='Fecha que populate_data toma como hoy (AAAA-MM-DD).'
+        )
+        parser.add_argument('--repeticiones', type=int, default=3, help='Peticiones por vista (por defecto 3).')
+        parser.add_argument('--solo-consultas', action='store_true', help='No compara los milisegundos con su presupuesto.')
+        parser.add_argument('--salida', help='Archivo donde guardar el informe JSON; por defecto, la salida estándar.')
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1:
+            raise CommandError('--repeticiones debe ser positivo.')
+        if options['generar']:
+            call_command(
+                'populate_data', clients=options['clients'], seed=options['seed'],
+                fecha_referencia=options['fecha_referencia'], stdout=self.stderr,
+            )
+
+        informe = medir_vistas(repeticiones=options['repeticiones'], validar_tiempos=not options['solo_consultas'])
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as destino:
+                escribir_informe(informe, destino)
+        else:
+            escribir_informe(informe, self.stdout)
+
+        # El resumen va a stderr para no mezclarse con el JSON cuando sale por stdout.
+        for vista in informe['vistas']:
+            linea = f"{vista['nombre']:<35} {vista['consultas']:>4} consultas {vista['ms_mediana']:>9.1f} ms"
+            self.stderr.write(self.style.ERROR(linea) if vista['problemas'] else linea, style_func=lambda texto: texto)
+        for omitida in informe['omitidas']:
+            self.stderr.write(self.style.WARNING(f"{omitida['url']}: omitida. {omitida['motivo']}"))
+        if informe['problemas']:
+            raise CommandError('Vistas fuera de presupuesto:\n' + '\n'.join(informe['problemas']))
+        self.stderr.write(self.style.SUCCESS(f"--- {len(informe['vistas'])} mediciones dentro del presupuesto ---"))
@@ -1,155 +1,243 @@
-
+import datetime
 import random
-from datetime import timedelta
+import time
 from decimal import Decimal
 
-from django.core.management.base import BaseCommand
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from django.utils import timezone
-from faker import Faker
 
-from gestion_prestamos.models import (Cliente, Cuota, Pago, Prestamo,
-                                      TipoPrestamo)
+from dashboard.metricas import invalidar_metricas_cacheadas
+from gestion_prestamos.models import (Cliente, Cuota, GastoPrestamo, Pago,
+                                      Prestamo, ReciboPago, Requisito,
+                                      SituacionPrestamo, TipoPrestamo)
+from gestion_prestamos.referencias import (REF_GRUPOS, invalidar_referencia,
+                                           obtener_id_grupo)
+from gestion_prestamos.utils import (actualizar_situacion_prestamos,
+                                     calcular_tablas_amortizacion_lote)
+
+# Todo sale de un único random.Random(seed) y de la fecha de referencia, así
+# que la misma combinación de opciones produce siempre la misma base de datos
+# y las mediciones de rendimiento se pueden comparar entre ejecuciones.
+
+NOMBRES = [
+    'Ana', 'Carlos', 'Carmen', 'Daniel', 'Elena', 'Fernando', 'Gabriela', 'Héctor',
+    'Isabel', 'Jorge', 'Laura', 'Luis', 'María', 'Miguel', 'Patricia', 'Pedro',
+    'Rosa', 'Santiago', 'Sofía', 'Víctor',
+]
+APELLIDOS = [
+    'Almonte', 'Batista', 'Castillo', 'Díaz', 'Espinal', 'Féliz', 'García', 'Guzmán',
+    'Hernández', 'Jiménez', 'López', 'Martínez', 'Mejía', 'Núñez', 'Peña', 'Pérez',
+    'Ramírez', 'Reyes', 'Rodríguez', 'Santana',
+]
+
+TIPOS_PRESTAMO = [
+    dict(
+        nombre="Préstamo Personal", tasa_interes_predeterminada=Decimal("22.5"), periodo_tasa='anual',
+        monto_minimo=Decimal("500"), monto_maximo=Decimal("15000"), plazo_minimo_meses=6, plazo_maximo_meses=48,
+        tasa_penalidad_diaria=Decimal("0.001"), dias_gracia=5,
+    ),
+    dict(
+        nombre="Préstamo de Vehículo", tasa_interes_predeterminada=Decimal("18.0"), periodo_tasa='anual',
+        monto_minimo=Decimal("5000"), monto_maximo=Decimal("40000"), plazo_minimo_meses=12, plazo_maximo_meses=72,
+        requiere_garantia=True, tasa_penalidad_diaria=Decimal("0.001"), dias_gracia=3,
+    ),
+]
+
+# Comportamiento de pago del préstamo vigente de cada cliente y su peso.
+PERFILES_PAGO = ['al_dia', 'atrasado', 'saldado']
+PESOS_PERFILES = [65, 25, 10]
 
 
 class Command(BaseCommand):
-    help = "Populate the database with realistic sample data spanning the last 2 years."
+    help = (
+        "Replace clients, loans, installments and payments with deterministic sample data. "
+        "Everything is written with bulk_create, so it can build benchmark databases with millions of rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50, help='Number of clients (default 50).')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data (default 42).')
+        parser.add_argument('--years', type=int, default=2, help='Loans are disbursed within the last N years (default 2).')
+        parser.add_argument(
+            '--fecha-referencia', type=datetime.date.fromisoformat, default=None,
+            help="Date treated as 'today' (YYYY-MM-DD). Fix it to compare runs made on different days."
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Clients generated per transaction (default 1000).')
 
     def handle(self, *args, **options):
-        self.stdout.write("Starting data population process...")
+        if options['clients'] < 1 or options['years'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--clients, --years and --batch-size must be positive.')
 
-        # Inicializar Faker
-        fake = Faker('es_ES')  # Usar localización en español
+        inicio = time.perf_counter()
+        self.rng = random.Random(options['seed'])
+        self.hoy = options['fecha_referencia'] or timezone.localdate()
+        self.desde = self.hoy - datetime.timedelta(days=365 * options['years'])
+        self.totales = {'clientes': 0, 'prestamos': 0, 'cuotas': 0, 'pagos': 0}
 
-        # --- 1. Limpiar datos existentes ---
         self.stdout.write("Cleaning old data...")
-        Pago.objects.all().delete()
-        Cuota.objects.all().delete()
-        Prestamo.objects.all().delete()
-        Cliente.objects.all().delete()
+        with transaction.atomic():
+            self._limpiar()
+            self.tipos = [TipoPrestamo.objects.create(**datos) for datos in TIPOS_PRESTAMO]
+        self.grupo_clientes = obtener_id_grupo('Clientes')
+
+        self.stdout.write(f"Creating {options['clients']} clients with their loans, installments and payments...")
+        for desde in range(0, options['clients'], options['batch_size']):
+            hasta = min(desde + options['batch_size'], options['clients'])
+            with transaction.atomic():
+                self._crear_lote(range(desde, hasta))
+            self.stdout.write(f"  {hasta} clients, {self.totales['cuotas']} installments")
+
+        self.stdout.write("Rebuilding loan situation...")
+        with transaction.atomic():
+            actualizar_situacion_prestamos()
+            invalidar_referencia(REF_GRUPOS)
+        invalidar_metricas_cacheadas()
+
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully populated the database: {self.totales['clientes']} clients, "
+            f"{self.totales['prestamos']} loans, {self.totales['cuotas']} installments and "
+            f"{self.totales['pagos']} payments in {segundos:.1f} s."
+        ))
+
+    # --- Limpieza ---
+
+    def _limpiar(self):
+        """
+        Borra los datos de ejemplo con DELETE directos: con miles de filas, el
+        borrado del ORM cargaría cada pago y ejecutaría sus señales una a una.
+        """
+        for modelo in (Pago, ReciboPago, SituacionPrestamo, Cuota, GastoPrestamo, Requisito, Prestamo):
+            modelo.objects.all()._raw_delete(modelo.objects.db)
+
+        usuarios = list(Cliente.objects.exclude(user=None).values_list('user_id', flat=True))
+        User.groups.through.objects.filter(user__cliente_profile__isnull=False)._raw_delete(User.objects.db)
+        Cliente.objects.all()._raw_delete(Cliente.objects.db)
+        for desde in range(0, len(usuarios), 500):
+            User.objects.filter(pk__in=usuarios[desde:desde + 500])._raw_delete(User.objects.db)
         TipoPrestamo.objects.all().delete()
 
-        # --- 2. Crear Tipos de Préstamo ---
-        self.stdout.write("Creating loan types...")
-        tipo_personal = TipoPrestamo.objects.create(
-            nombre="Préstamo Personal",
-            tasa_interes_predeterminada=Decimal("22.5"),
-            periodo_tasa='anual',
-            monto_minimo=Decimal("500"),
-            monto_maximo=Decimal("15000"),
-            plazo_minimo_meses=6,
-            plazo_maximo_meses=48,
-            tasa_penalidad_diaria=Decimal("0.001"), # 0.1% diario
-            dias_gracia=5
-        )
-
-        tipo_vehiculo = TipoPrestamo.objects.create(
-            nombre="Préstamo de Vehículo",
-            tasa_interes_predeterminada=Decimal("18.0"),
-            periodo_tasa='anual',
-            monto_minimo=Decimal("5000"),
-            monto_maximo=Decimal("40000"),
-            plazo_minimo_meses=12,
-            plazo_maximo_meses=72,
-            requiere_garantia=True,
-            tasa_penalidad_diaria=Decimal("0.001"),
-            dias_gracia=3
-        )
-
-        # --- 3. Crear Clientes ---
-        self.stdout.write("Creating clients...")
-        clientes = []
-        for _ in range(50):
-            cliente = Cliente.objects.create(
-                nombres=fake.first_name(),
-                apellidos=fake.last_name(),
+    # --- Generación ---
+
+    def _crear_lote(self, numeros):
+        rng = self.rng
+        usuarios, clientes = [], []
+        for numero in numeros:
+            nombre, apellido = rng.choice(NOMBRES), rng.choice(APELLIDOS)
+            cifras = f"{40200000000 + numero:011d}"
+            documento = f"{cifras[:3]}-{cifras[3:10]}-{cifras[10]}"
+            email = f"cliente{numero}@ejemplo.com"
+            usuarios.append(User(
+                username=documento, email=email,
+                # Contraseña no utilizable, igual que `create_client_user`.
+                password=f"{UNUSABLE_PASSWORD_PREFIX}{rng.getrandbits(128):032x}",
+            ))
+            clientes.append(Cliente(
+                nombres=nombre,
+                apellidos=f"{apellido} {rng.choice(APELLIDOS)}",
                 tipo_documento='cedula',
-                numero_documento=fake.unique.numerify(text='###-#######-#'),
-                direccion=fake.address(),
-                telefono=fake.phone_number(),
-                email=fake.unique.email(),
-                fecha_nacimiento=fake.date_of_birth(minimum_age=21, maximum_age=70),
-                ingresos_mensuales=Decimal(random.uniform(500, 4000))
-            )
-            clientes.append(cliente)
-
-        # --- 4. Crear Préstamos, Cuotas y Pagos ---
-        self.stdout.write("Creating loans, installments, and payments...")
-        today = timezone.now().date()
-
+                numero_documento=documento,
+                telefono=f"809-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+                email=email,
+                fecha_nacimiento=self.hoy - datetime.timedelta(days=rng.randint(21 * 365, 70 * 365)),
+                ingresos_mensuales=Decimal(rng.randrange(50000, 400000)) / 100,
+            ))
+
+        User.objects.bulk_create(usuarios)
+        for usuario, cliente in zip(usuarios, clientes):
+            cliente.user = usuario
+        if self.grupo_clientes is not None:
+            User.groups.through.objects.bulk_create([
+                User.groups.through(user_id=usuario.pk, group_id=self.grupo_clientes) for usuario in usuarios
+            ])
+        Cliente.objects.bulk_create(clientes)
+
+        prestamos, perfiles = [], []
+        dias_ventana = (self.hoy - self.desde).days
         for cliente in clientes:
-            # Crear entre 1 y 3 préstamos por cliente
-            num_prestamos = random.randint(1, 3)
-            for i in range(num_prestamos):
-                # El último préstamo puede estar activo, los anteriores estarán pagados
-                is_last_loan = (i == num_prestamos - 1)
-                
-                tipo_prestamo = random.choice([tipo_personal, tipo_vehiculo])
-                
-                # Fechas aleatorias en los últimos 2 años
-                dias_atras = random.randint(1, 365 * 2)
-                fecha_desembolso = today - timedelta(days=dias_atras)
-                
-                monto = Decimal(random.randrange(int(tipo_prestamo.monto_minimo), int(tipo_prestamo.monto_maximo), 100))
-                plazo = random.randint(tipo_prestamo.plazo_minimo_meses, tipo_prestamo.plazo_maximo_meses)
-
-                # Determinar estado
-                if not is_last_loan or random.random() < 0.8: # 80% de los préstamos antiguos/actuales están pagados
-                    estado_prestamo = 'pagado'
-                else:
-                    estado_prestamo = 'aprobado'
-
-                prestamo = Prestamo.objects.create(
+            cantidad = rng.choices([1, 2, 3], weights=[6, 3, 1])[0]
+            fechas = sorted(self.desde + datetime.timedelta(days=rng.randint(0, dias_ventana - 1)) for _ in range(cantidad))
+            for posicion, fecha in enumerate(fechas):
+                tipo = rng.choice(self.tipos)
+                # Solo el último préstamo de cada cliente puede seguir vigente.
+                perfil = rng.choices(PERFILES_PAGO, weights=PESOS_PERFILES)[0] if posicion == cantidad - 1 else 'saldado'
+                prestamos.append(Prestamo(
                     cliente=cliente,
-                    tipo_prestamo=tipo_prestamo,
-                    monto=monto,
-                    tasa_interes=tipo_prestamo.tasa_interes_predeterminada,
-                    periodo_tasa=tipo_prestamo.periodo_tasa,
-                    plazo=plazo,
-                    fecha_desembolso=fecha_desembolso,
-                    fecha_inicio_pago=fecha_desembolso + timedelta(days=30),
-                    estado=estado_prestamo,
-                    frecuencia_pago='mensual'
+                    tipo_prestamo=tipo,
+                    monto=Decimal(rng.randrange(int(tipo.monto_minimo), int(tipo.monto_maximo) + 1, 100)),
+                    tasa_interes=tipo.tasa_interes_predeterminada,
+                    periodo_tasa=tipo.periodo_tasa,
+                    plazo=rng.randint(tipo.plazo_minimo_meses, tipo.plazo_maximo_meses),
+                    fecha_desembolso=fecha,
+                    fecha_inicio_pago=fecha,
+                    frecuencia_pago='mensual',
+                    estado='pagado' if perfil == 'saldado' else 'aprobado',
+                    fecha_aprobacion=timezone.make_aware(datetime.datetime.combine(fecha, datetime.time(10))),
+                ))
+                perfiles.append(perfil)
+        Prestamo.objects.bulk_create(prestamos)
+
+        cuotas_por_prestamo = []
+        for prestamo, tabla in zip(prestamos, calcular_tablas_amortizacion_lote(prestamos)):
+            cuotas_por_prestamo.append([
+                Cuota(
+                    prestamo=prestamo,
+                    numero_cuota=fila['numero_cuota'],
+                    fecha_vencimiento=fila['fecha_vencimiento'],
+                    monto_cuota=fila['cuota_fija'],
+                    capital=fila['capital'],
+                    interes=fila['interes'],
+                    saldo_pendiente=fila['saldo_pendiente'],
                 )
-
-                # --- 5. Generar Cuotas (Amortización Francesa Simplificada) ---
-                tasa_mensual = (prestamo.tasa_interes / Decimal(100)) / Decimal(12)
-                if tasa_mensual > 0:
-                    monto_cuota = (monto * tasa_mensual) / (1 - (1 + tasa_mensual) ** -plazo)
-                else:
-                    monto_cuota = monto / plazo
-                
-                monto_cuota = monto_cuota.quantize(Decimal('0.01'))
-
-                saldo_pendiente = monto
-                for n in range(1, plazo + 1):
-                    interes = (saldo_pendiente * tasa_mensual).quantize(Decimal('0.01'))
-                    capital = (monto_cuota - interes).quantize(Decimal('0.01'))
-                    saldo_pendiente -= capital
-                    fecha_vencimiento = prestamo.fecha_inicio_pago + timedelta(days=(n-1)*30)
-
-                    estado_cuota = 'pendiente'
-                    if estado_prestamo == 'pagado':
-                        estado_cuota = 'pagada'
-                    elif fecha_vencimiento < today:
-                        estado_cuota = 'vencida'
-
-                    cuota = Cuota.objects.create(
-                        prestamo=prestamo,
-                        numero_cuota=n,
-                        fecha_vencimiento=fecha_vencimiento,
-                        monto_cuota=monto_cuota,
-                        capital=capital,
-                        interes=interes,
-                        saldo_pendiente=max(saldo_pendiente, Decimal(0)),
-                        estado=estado_cuota
-                    )
-
-                    # --- 6. Generar Pagos ---
-                    if cuota.estado == 'pagada':
-                        Pago.objects.create(
-                            cuota=cuota,
-                            monto_pagado=cuota.monto_cuota,
-                            # La fecha de pago se establece automáticamente
-                        )
-        
-        self.stdout.write(self.style.SUCCESS("Successfully populated the database."))
+                for fila in tabla
+            ])
+        pagos_por_cuota = [
+            self._simular_pagos(cuotas, perfil) for cuotas, perfil in zip(cuotas_por_prestamo, perfiles)
+        ]
+
+        cuotas = [cuota for lista in cuotas_por_prestamo for cuota in lista]
+        Cuota.objects.bulk_create(cuotas, batch_size=2000)
+        pagos = []
+        for cuotas_prestamo, pagos_prestamo in zip(cuotas_por_prestamo, pagos_por_cuota):
+            for cuota, (monto, fecha) in pagos_prestamo:
+                pagos.append(Pago(
+                    cuota=cuota, monto_pagado=monto,
+                    fecha_pago=timezone.make_aware(datetime.datetime.combine(fecha, datetime.time(12))),
+                ))
+        Pago.objects.bulk_create(pagos, batch_size=2000)
+
+        self.totales['clientes'] += len(clientes)
+        self.totales['prestamos'] += len(prestamos)
+        self.totales['cuotas'] += len(cuotas)
+        self.totales['pagos'] += len(pagos)
+
+    def _simular_pagos(self, cuotas, perfil):
+        """
+        Marca el estado y el acumulado pagado de `cuotas` según el perfil y
+        devuelve los pagos como [(cuota, (monto, fecha))], a lo sumo uno por cuota.
+        """
+        rng = self.rng
+        vencidas = sum(1 for cuota in cuotas if cuota.fecha_vencimiento < self.hoy)
+        if perfil == 'saldado':
+            pagadas, parcial = len(cuotas), False
+        elif perfil == 'al_dia':
+            pagadas, parcial = vencidas, False
+        else:
+            pagadas, parcial = rng.randint(0, max(vencidas - 1, 0)), True
+
+        pagos = []
+        for posicion, cuota in enumerate(cuotas):
+            fecha = min(cuota.fecha_vencimiento - datetime.timedelta(days=rng.randint(0, 5)), self.hoy)
+            if posicion < pagadas:
+                cuota.monto_pagado_acumulado, cuota.estado = cuota.monto_cuota, 'pagada'
+            elif posicion == pagadas and parcial and vencidas:
+                monto = (cuota.monto_cuota * Decimal(rng.randint(10, 90)) / 100).quantize(Decimal('0.01'))
+                cuota.monto_pagado_acumulado, cuota.estado = monto, 'pagada_parcialmente'
+            else:
+                cuota.estado = 'vencida' if cuota.fecha_vencimiento < self.hoy else 'pendiente'
+                continue
+            pagos.append((cuota, (cuota.monto_pagado_acumulado, fecha)))
+        return pagos
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from gestion_prestamos.models import Cuota, suma_pagos_cuota
+
+class Command(BaseCommand):
+    help = 'Verifica y reconstruye el monto pagado acumulado de las cuotas a partir de sus pagos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--solo-verificar',
+            action='store_true',
+            help='Solo informa las cuotas con diferencias, sin corregirlas.'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('--- Verificando el monto pagado acumulado de las cuotas ---'))
+
+        desfasadas = (
+            Cuota.objects.annotate(suma_real=suma_pagos_cuota())
+            .exclude(monto_pagado_acumulado=F('suma_real'))
+            .values_list('id', 'prestamo_id', 'numero_cuota', 'monto_pagado_acumulado', 'suma_real')
+        )
+        desfasadas = list(desfasadas)
+
+        if not desfasadas:
+            self.stdout.write(self.style.SUCCESS('Todas las cuotas coinciden con la suma de sus pagos.'))
+            return
+
+        self.stdout.write(self.style.ERROR(f'Se encontraron {len(desfasadas)} cuota(s) con diferencias:'))
+        for cuota_id, prestamo_id, numero_cuota, acumulado, suma_real in desfasadas:
+            self.stdout.write(
+                f'  - Cuota #{numero_cuota} del Préstamo #{prestamo_id} (ID {cuota_id}): '
+                f'guardado ${acumulado:,.2f}, real ${suma_real:,.2f}'
+            )
+
+        if options['solo_verificar']:
+            return
+
+        with transaction.atomic():
+            corregidas = Cuota.objects.filter(id__in=[fila[0] for fila in desfasadas]).update(
+                monto_pagado_acumulado=suma_pagos_cuota()
+            )
+        self.stdout.write(self.style.SUCCESS(f'--- Se corrigieron {corregidas} cuota(s). ---'))
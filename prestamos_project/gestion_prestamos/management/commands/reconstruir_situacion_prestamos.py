@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from gestion_prestamos.models import Prestamo
+from gestion_prestamos.utils import actualizar_situacion_prestamos
+
+class Command(BaseCommand):
+    help = 'Reconstruye la situación (saldo, pagado, atraso) de los préstamos a partir de sus cuotas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('prestamo_ids', nargs='*', type=int, help='IDs de los préstamos; por defecto, todos.')
+        parser.add_argument(
+            '--tamano-lote',
+            type=int,
+            default=1000,
+            help='Préstamos por consulta (por defecto 1000).'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('--- Reconstruyendo la situación de los préstamos ---'))
+        inicio = time.perf_counter()
+        prestamo_ids = None
+        if options['prestamo_ids']:
+            prestamo_ids = list(Prestamo.objects.filter(pk__in=options['prestamo_ids']).values_list('pk', flat=True))
+            faltantes = set(options['prestamo_ids']) - set(prestamo_ids)
+            if faltantes:
+                self.stdout.write(self.style.WARNING(f"No existen los préstamos: {', '.join(map(str, sorted(faltantes)))}"))
+        with transaction.atomic():
+            actualizados = actualizar_situacion_prestamos(prestamo_ids, tamano_lote=options['tamano_lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'--- Se actualizaron {actualizados} préstamo(s) en {time.perf_counter() - inicio:.2f} s. ---'
+        ))
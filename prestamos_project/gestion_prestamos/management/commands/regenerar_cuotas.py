@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from gestion_prestamos.models import Prestamo
+from gestion_prestamos.utils import regenerar_cuotas_lote
+
+class Command(BaseCommand):
+    help = 'Vuelve a generar las tablas de amortización de los préstamos indicados (o de todos los de un estado).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('prestamo_ids', nargs='*', type=int, help='IDs de los préstamos a regenerar.')
+        parser.add_argument('--estado', default='aprobado', help='Estado de los préstamos a regenerar si no se indican IDs.')
+        parser.add_argument('--tamano-lote', type=int, default=500, help='Préstamos por transacción.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('--- Iniciando la regeneración de tablas de amortización ---'))
+
+        prestamos = Prestamo.objects.all()
+        if options['prestamo_ids']:
+            prestamos = prestamos.filter(id__in=options['prestamo_ids'])
+        else:
+            prestamos = prestamos.filter(estado=options['estado'])
+
+        resumen = regenerar_cuotas_lote(prestamos, tamano_lote=options['tamano_lote'])
+
+        if resumen['omitidos']:
+            ids_omitidos = ", ".join(str(pk) for pk in resumen['omitidos'])
+            self.stdout.write(self.style.WARNING(f'Préstamos omitidos porque ya tienen pagos: {ids_omitidos}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Préstamos regenerados: {resumen["prestamos"]}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Cuotas escritas: {resumen["cuotas"]} en {resumen["segundos"]:.2f} s '
+            f'({resumen["cuotas_por_segundo"]:,.0f} cuotas/s)'
+        ))
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.perfilado import CABECERA_PERFILADO, PARAMETRO_PERFILADO, firmar_token
+
+class Command(BaseCommand):
+    help = 'Genera un token para perfilar con cProfile las peticiones de un usuario staff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usuario', help='Nombre de usuario (debe ser staff).')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = User.objects.get(username=options['usuario'])
+        except User.DoesNotExist:
+            raise CommandError(f"No existe el usuario '{options['usuario']}'.")
+        if not usuario.is_staff:
+            raise CommandError('Solo se pueden perfilar las peticiones de usuarios staff.')
+
+        token = firmar_token(usuario)
+        cabecera = CABECERA_PERFILADO.removeprefix('HTTP_').replace('_', '-').title()
+        # Solo el token va a stdout, para poder usarlo en un script.
+        self.stdout.write(token)
+        self.stderr.write(self.style.SUCCESS(
+            f'Agregue ?{PARAMETRO_PERFILADO}={token} a la URL o envíe la cabecera {cabecera}. '
+            f'Vence en {settings.PERFILADO_VIGENCIA} s; los perfiles se guardan en {settings.PERFILES_DIR}.'
+        ))
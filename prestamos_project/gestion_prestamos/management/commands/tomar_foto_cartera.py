@@ -0,0 +1,44 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from gestion_prestamos.models import Prestamo
+from dashboard.metricas import guardar_foto_cartera, reconstruir_fotos_cartera
+
+class Command(BaseCommand):
+    help = 'Guarda la foto diaria de la cartera (ejecutar cada noche) o reconstruye días pasados desde el historial.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reconstruir',
+            action='store_true',
+            help='Reconstruye las fotos de días pasados a partir de los desembolsos y pagos registrados.'
+        )
+        parser.add_argument('--desde', type=date.fromisoformat, help='Primer día a reconstruir (AAAA-MM-DD). Por defecto, el primer desembolso.')
+        parser.add_argument('--hasta', type=date.fromisoformat, help='Último día a reconstruir (AAAA-MM-DD). Por defecto, ayer.')
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+
+        if not options['reconstruir']:
+            foto = guardar_foto_cartera(hoy)
+            self.stdout.write(self.style.SUCCESS(
+                f'Foto del {foto.fecha:%d/%m/%Y} guardada: cartera activa ${foto.dinero_en_la_calle:,.2f}, '
+                f'{foto.num_prestamos_en_atraso} préstamo(s) en atraso.'
+            ))
+            return
+
+        desde = options['desde']
+        if desde is None:
+            primer_prestamo = Prestamo.objects.order_by('fecha_desembolso').values_list('fecha_desembolso', flat=True).first()
+            if primer_prestamo is None:
+                self.stdout.write(self.style.WARNING('No hay préstamos registrados; no hay nada que reconstruir.'))
+                return
+            desde = primer_prestamo
+        hasta = options['hasta'] or hoy - timedelta(days=1)
+
+        if desde > hasta:
+            raise CommandError('La fecha --desde no puede ser posterior a --hasta.')
+
+        self.stdout.write(self.style.SUCCESS(f'--- Reconstruyendo fotos del {desde:%d/%m/%Y} al {hasta:%d/%m/%Y} ---'))
+        dias = reconstruir_fotos_cartera(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(f'Se guardaron {dias} foto(s) reconstruida(s).'))
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-17 17:45
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def calcular_monto_pagado_acumulado(apps, schema_editor):
+    """
+    Llena el nuevo campo con la suma de los pagos ya registrados de cada cuota.
+    """
+    Cuota = apps.get_model('gestion_prestamos', 'Cuota')
+    Pago = apps.get_model('gestion_prestamos', 'Pago')
+
+    suma_pagos = Subquery(
+        Pago.objects.filter(cuota=OuterRef('pk'))
+        .order_by()
+        .values('cuota')
+        .annotate(total=Sum('monto_pagado'))
+        .values('total')
+    )
+    Cuota.objects.update(
+        monto_pagado_acumulado=Coalesce(suma_pagos, Decimal('0.00'), output_field=models.DecimalField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_prestamos', '0026_prestamo_fecha_aprobacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cuota',
+            name='monto_pagado_acumulado',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10, verbose_name='Monto Pagado Acumulado'),
+        ),
+        migrations.RunPython(calcular_monto_pagado_acumulado, migrations.RunPython.noop),
+    ]
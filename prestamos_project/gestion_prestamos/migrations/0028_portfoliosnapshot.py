@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-17 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_prestamos', '0027_cuota_monto_pagado_acumulado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True, verbose_name='Fecha')),
+                ('capital_inicial', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Capital Inicial')),
+                ('total_desembolsado', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Total Desembolsado')),
+                ('total_recibido', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Total Cobrado')),
+                ('dinero_en_caja', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Dinero en Caja')),
+                ('dinero_en_la_calle', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Cartera Activa')),
+                ('ganancia_realizada', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Ganancia Realizada')),
+                ('num_prestamos_activos', models.PositiveIntegerField(default=0, verbose_name='Préstamos Activos')),
+                ('num_prestamos_en_atraso', models.PositiveIntegerField(default=0, verbose_name='Préstamos en Atraso')),
+                ('total_penalidades', models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True, verbose_name='Penalidades Pendientes')),
+                ('reconstruida', models.BooleanField(default=False, help_text='Calculada a posteriori desde el historial de pagos.', verbose_name='Reconstruida')),
+                ('fecha_generacion', models.DateTimeField(auto_now=True, verbose_name='Fecha de Generación')),
+            ],
+            options={
+                'verbose_name': 'Foto Diaria de la Cartera',
+                'verbose_name_plural': 'Fotos Diarias de la Cartera',
+                'db_table': 'prestamos_portfolio_snapshot',
+                'ordering': ['fecha'],
+            },
+        ),
+    ]
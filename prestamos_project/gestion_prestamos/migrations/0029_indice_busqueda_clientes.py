@@ -0,0 +1,92 @@
+from django.db import migrations
+
+# Índice de búsqueda de clientes; ver gestion_prestamos/busqueda.py.
+# Solo se crea en PostgreSQL (pg_trgm) y SQLite (FTS5); en otros motores
+# la búsqueda sigue usando `icontains`.
+
+CAMPOS = ('nombres', 'apellidos', 'numero_documento')
+
+SQLITE_CREAR = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS prestamos_cliente_fts USING fts5(
+        nombres, apellidos, numero_documento,
+        content='prestamos_cliente', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS prestamos_cliente_fts_ai AFTER INSERT ON prestamos_cliente BEGIN
+        INSERT INTO prestamos_cliente_fts(rowid, nombres, apellidos, numero_documento)
+        VALUES (new.id, new.nombres, new.apellidos, new.numero_documento);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS prestamos_cliente_fts_ad AFTER DELETE ON prestamos_cliente BEGIN
+        INSERT INTO prestamos_cliente_fts(prestamos_cliente_fts, rowid, nombres, apellidos, numero_documento)
+        VALUES ('delete', old.id, old.nombres, old.apellidos, old.numero_documento);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS prestamos_cliente_fts_au AFTER UPDATE ON prestamos_cliente BEGIN
+        INSERT INTO prestamos_cliente_fts(prestamos_cliente_fts, rowid, nombres, apellidos, numero_documento)
+        VALUES ('delete', old.id, old.nombres, old.apellidos, old.numero_documento);
+        INSERT INTO prestamos_cliente_fts(rowid, nombres, apellidos, numero_documento)
+        VALUES (new.id, new.nombres, new.apellidos, new.numero_documento);
+    END
+    """,
+    "INSERT INTO prestamos_cliente_fts(prestamos_cliente_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BORRAR = [
+    'DROP TRIGGER IF EXISTS prestamos_cliente_fts_ai',
+    'DROP TRIGGER IF EXISTS prestamos_cliente_fts_ad',
+    'DROP TRIGGER IF EXISTS prestamos_cliente_fts_au',
+    'DROP TABLE IF EXISTS prestamos_cliente_fts',
+]
+
+POSTGRES_CREAR = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    f'CREATE INDEX IF NOT EXISTS prestamos_cliente_{campo}_trgm '
+    f'ON prestamos_cliente USING gin ({campo} gin_trgm_ops)'
+    for campo in CAMPOS
+]
+
+POSTGRES_BORRAR = [f'DROP INDEX IF EXISTS prestamos_cliente_{campo}_trgm' for campo in CAMPOS]
+
+
+def _sqlite_tiene_trigram(connection):
+    # El tokenizador trigram existe desde SQLite 3.34.
+    return connection.Database.sqlite_version_info >= (3, 34, 0)
+
+
+def crear_indice(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite' and _sqlite_tiene_trigram(connection):
+        sentencias = SQLITE_CREAR
+    elif connection.vendor == 'postgresql':
+        sentencias = POSTGRES_CREAR
+    else:
+        return
+    for sql in sentencias:
+        schema_editor.execute(sql)
+
+
+def borrar_indice(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        sentencias = SQLITE_BORRAR
+    elif connection.vendor == 'postgresql':
+        sentencias = POSTGRES_BORRAR
+    else:
+        return
+    for sql in sentencias:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_prestamos', '0028_portfoliosnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-17 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_prestamos', '0029_indice_busqueda_clientes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['-fecha_registro', '-id'], name='cliente_registro_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(fields=['fecha_vencimiento', 'id'], name='cuota_vencimiento_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['estado', '-fecha_creacion', '-id'], name='prestamo_estado_creacion_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-17 18:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_prestamos', '0030_indices_paginacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReciboPago',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(auto_now_add=True, verbose_name='Fecha')),
+                ('monto_total', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Monto Cobrado')),
+                ('saldo_anterior', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Saldo Anterior')),
+                ('saldo_restante', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Saldo Restante')),
+                ('fecha_proximo_pago', models.DateField(blank=True, null=True, verbose_name='Próximo Vencimiento')),
+                ('detalle', models.JSONField(default=list, verbose_name='Distribución del Pago')),
+                ('prestamo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recibos', to='gestion_prestamos.prestamo', verbose_name='Préstamo')),
+            ],
+            options={
+                'verbose_name': 'Recibo de Pago',
+                'verbose_name_plural': 'Recibos de Pago',
+                'db_table': 'prestamos_recibo_pago',
+                'ordering': ['-fecha'],
+            },
+        ),
+        migrations.AddField(
+            model_name='pago',
+            name='recibo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pagos', to='gestion_prestamos.recibopago', verbose_name='Recibo'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-17 18:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_prestamos', '0031_recibopago'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pago',
+            name='fecha_pago',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Fecha de Pago'),
+        ),
+        migrations.AlterField(
+            model_name='recibopago',
+            name='fecha',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Fecha'),
+        ),
+    ]
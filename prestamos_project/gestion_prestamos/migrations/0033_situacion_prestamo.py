@@ -0,0 +1,70 @@
+# Generated by Django 5.2.5 on 2026-10-17 18:17
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Q, Sum, Value
+from django.db.models.functions import Greatest
+
+
+def llenar_situacion_prestamos(apps, schema_editor):
+    """
+    Crea la situación de los préstamos existentes con la misma agregación que
+    `actualizar_situacion_prestamos` (los modelos históricos no tienen sus métodos).
+    """
+    Prestamo = apps.get_model('gestion_prestamos', 'Prestamo')
+    Cuota = apps.get_model('gestion_prestamos', 'Cuota')
+    SituacionPrestamo = apps.get_model('gestion_prestamos', 'SituacionPrestamo')
+
+    abiertas = Q(estado__in=['pendiente', 'pagada_parcialmente', 'vencida'])
+    totales = {
+        fila['prestamo_id']: fila
+        for fila in Cuota.objects.order_by().values('prestamo_id').annotate(
+            saldo_pendiente=Sum(Greatest(F('monto_cuota') + F('monto_penalidad_acumulada') - F('monto_pagado_acumulado'), Value(Decimal('0.00')))),
+            total_pagado=Sum('monto_pagado_acumulado'),
+            total_penalidades=Sum('monto_penalidad_acumulada'),
+            cuotas_pendientes=Count('pk', filter=abiertas),
+            proximo_vencimiento=Min('fecha_vencimiento', filter=abiertas),
+        )
+    }
+    filas = []
+    for prestamo_id in Prestamo.objects.values_list('pk', flat=True).iterator():
+        datos = totales.get(prestamo_id, {})
+        filas.append(SituacionPrestamo(
+            prestamo_id=prestamo_id,
+            saldo_pendiente=datos.get('saldo_pendiente') or Decimal('0.00'),
+            total_pagado=datos.get('total_pagado') or Decimal('0.00'),
+            total_penalidades=datos.get('total_penalidades') or Decimal('0.00'),
+            cuotas_pendientes=datos.get('cuotas_pendientes') or 0,
+            proximo_vencimiento=datos.get('proximo_vencimiento'),
+        ))
+    SituacionPrestamo.objects.bulk_create(filas, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_prestamos', '0032_fecha_pago_importable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SituacionPrestamo',
+            fields=[
+                ('prestamo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='situacion', serialize=False, to='gestion_prestamos.prestamo', verbose_name='Préstamo')),
+                ('saldo_pendiente', models.DecimalField(decimal_places=2, default=0, help_text='Cuotas más penalidades, menos lo pagado.', max_digits=12, verbose_name='Saldo Pendiente')),
+                ('total_pagado', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total Pagado')),
+                ('total_penalidades', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Penalidades Acumuladas')),
+                ('cuotas_pendientes', models.PositiveIntegerField(default=0, verbose_name='Cuotas por Pagar')),
+                ('proximo_vencimiento', models.DateField(blank=True, null=True, verbose_name='Próximo Vencimiento')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Actualizado')),
+            ],
+            options={
+                'verbose_name': 'Situación del Préstamo',
+                'verbose_name_plural': 'Situación de los Préstamos',
+                'db_table': 'prestamos_situacion_prestamo',
+                'indexes': [models.Index(fields=['saldo_pendiente', 'prestamo'], name='situacion_saldo_idx'), models.Index(fields=['proximo_vencimiento', 'prestamo'], name='situacion_vencimiento_idx')],
+            },
+        ),
+        migrations.RunPython(llenar_situacion_prestamos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-17 18:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_prestamos', '0033_situacion_prestamo'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(condition=models.Q(('estado__in', ['pendiente', 'pagada_parcialmente', 'vencida'])), fields=['fecha_vencimiento', 'prestamo'], name='cuota_impaga_vencimiento_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# En PostgreSQL, `icontains` se compila como `UPPER("campo"::text) LIKE UPPER(%s)`,
+# así que los índices de trigramas de la 0029 (sobre la columna tal cual) nunca
+# se usaban. Se reemplazan por índices sobre esa misma expresión. En otros
+# motores no hace nada.
+
+CAMPOS = ('nombres', 'apellidos', 'numero_documento')
+
+POSTGRES_CREAR = [
+    f'CREATE INDEX IF NOT EXISTS prestamos_cliente_{campo}_upper_trgm '
+    f'ON prestamos_cliente USING gin ((UPPER({campo}::text)) gin_trgm_ops)'
+    for campo in CAMPOS
+] + [f'DROP INDEX IF EXISTS prestamos_cliente_{campo}_trgm' for campo in CAMPOS]
+
+POSTGRES_BORRAR = [
+    f'CREATE INDEX IF NOT EXISTS prestamos_cliente_{campo}_trgm '
+    f'ON prestamos_cliente USING gin ({campo} gin_trgm_ops)'
+    for campo in CAMPOS
+] + [f'DROP INDEX IF EXISTS prestamos_cliente_{campo}_upper_trgm' for campo in CAMPOS]
+
+
+def crear_indices(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in POSTGRES_CREAR:
+            schema_editor.execute(sql)
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in POSTGRES_BORRAR:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_prestamos', '0034_indice_cuotas_impagas'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
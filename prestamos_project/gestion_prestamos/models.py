@@ -1,8 +1,23 @@
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Q, UniqueConstraint
+from django.db import models, transaction
+from django.db.models import OuterRef, Q, Subquery, UniqueConstraint
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
 from decimal import Decimal
 from django.utils import timezone
+from . import telemetria
+
+# Se envía tras escrituras masivas (bulk_create/bulk_update) de pagos o cuotas,
+# que no disparan post_save. Lo escuchan las cachés que resumen la cartera y
+# `SituacionPrestamo`, que se actualiza dentro de la misma transacción.
+cartera_modificada = Signal()
+
+# Cuotas que todavía pueden recibir pagos.
+ESTADOS_CUOTA_ABIERTA = ['pendiente', 'pagada_parcialmente', 'vencida']
+
+# Préstamos en cobro: los aprobados y los que `actualizar_cuotas` marcó como
+# vencidos por tener cuotas atrasadas. Ambos siguen recibiendo pagos.
+ESTADOS_PRESTAMO_EN_COBRO = ['aprobado', 'vencido']
 
 # ==================================================
 # === MODELO TIPO DE GASTO ===
@@ -115,6 +130,10 @@ class Cliente(models.Model):
         db_table = 'prestamos_cliente'
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
+        # Orden del listado de clientes (paginación por cursor).
+        indexes = [
+            models.Index(fields=['-fecha_registro', '-id'], name='cliente_registro_idx'),
+        ]
 
 # ==================================================
 # === MODELO GARANTE ===
@@ -290,35 +309,107 @@ class Prestamo(models.Model):
     def registrar_pago(self, monto_pagado):
         """
         Registra un pago para este préstamo, lo distribuye entre las cuotas pendientes
-        y devuelve una lista de los objetos Pago creados.
+        y devuelve una lista de los objetos Pago creados. En la misma transacción
+        guarda el `ReciboPago` con los saldos de ese momento (accesible como
+        `pago.recibo` en cualquiera de los pagos devueltos).
+
+        Todo ocurre en una transacción con el préstamo y sus cuotas abiertas
+        bloqueados (`select_for_update`), de modo que dos pagos simultáneos sobre
+        el mismo préstamo no repartan dos veces el mismo saldo. La cantidad de
+        consultas no depende de cuántas cuotas cubra el pago.
+        """
+        with transaction.atomic():
+            # Bloquear el préstamo serializa los pagos concurrentes sobre él.
+            Prestamo.objects.select_for_update().only('id').get(pk=self.pk)
+            cuotas_abiertas = list(
+                self.cuotas.select_for_update()
+                .filter(estado__in=ESTADOS_CUOTA_ABIERTA)
+                .order_by('numero_cuota')
+            )
+
+            pagos_creados, cuotas_modificadas, recibo = self.distribuir_pago(cuotas_abiertas, monto_pagado)
+            if recibo is not None:
+                recibo.save()
+                for pago in pagos_creados:
+                    pago.recibo = recibo
+
+            # bulk_create no pasa por Pago.save(), así que el acumulado de cada
+            # cuota se guarda aquí junto con su nuevo estado.
+            Pago.objects.bulk_create(pagos_creados)
+            Cuota.objects.bulk_update(cuotas_modificadas, ['monto_pagado_acumulado', 'estado'])
+
+            if all(cuota.estado == 'pagada' for cuota in cuotas_abiertas):
+                self.estado = 'pagado'
+                self.save(update_fields=['estado'])
+
+            cartera_modificada.send(sender=Pago, prestamo_ids=[self.pk])
+            if recibo is not None:
+                telemetria.incrementar_al_confirmar('prestamos_pagos_registrados_total')
+                telemetria.incrementar_al_confirmar('prestamos_pagos_monto_total', monto_pagado)
+
+        return pagos_creados
+
+    def distribuir_pago(self, cuotas_abiertas, monto_pagado, fecha_pago=None):
+        """
+        Reparte `monto_pagado` entre `cuotas_abiertas` (ya bloqueadas y en orden)
+        sin tocar la base: actualiza en memoria el acumulado y el estado de cada
+        cuota y arma los `Pago` y el `ReciboPago` que hay que guardar.
+
+        Returns:
+            tuple: (lista de Pago sin guardar, cuotas que cambiaron, ReciboPago
+            sin guardar o None si no se aplicó nada).
         """
+        fecha_pago = fecha_pago or timezone.now()
+        # Fuera de las cuotas abiertas todo está pagado, así que esto es el saldo del préstamo.
+        saldo_anterior = sum(
+            (max(cuota.monto_total_a_pagar - cuota.monto_pagado_acumulado, Decimal('0.00')) for cuota in cuotas_abiertas),
+            Decimal('0.00')
+        )
+
         pagos_creados = []
+        cuotas_modificadas = []
         monto_a_distribuir = monto_pagado
-        cuotas_pendientes = self.cuotas.filter(
-            estado__in=['pendiente', 'pagada_parcialmente', 'vencida']
-        ).order_by('numero_cuota')
-
-        for cuota in cuotas_pendientes:
+        for cuota in cuotas_abiertas:
             if monto_a_distribuir <= 0:
                 break
 
-            monto_necesario = cuota.monto_total_a_pagar - cuota.total_pagado
+            monto_necesario = cuota.monto_total_a_pagar - cuota.monto_pagado_acumulado
             pago_a_cuota = min(monto_a_distribuir, monto_necesario)
-
-            nuevo_pago = Pago.objects.create(
-                cuota=cuota,
-                monto_pagado=pago_a_cuota
-            )
-            pagos_creados.append(nuevo_pago)
-            
-            cuota.actualizar_estado()
-            monto_a_distribuir -= pago_a_cuota
-
-        if not self.cuotas.filter(estado__in=['pendiente', 'pagada_parcialmente', 'vencida']).exists():
-            self.estado = 'pagado'
-            self.save()
-        
-        return pagos_creados
+            if pago_a_cuota > 0:
+                pagos_creados.append(Pago(cuota=cuota, monto_pagado=pago_a_cuota, fecha_pago=fecha_pago))
+                cuota.monto_pagado_acumulado += pago_a_cuota
+                monto_a_distribuir -= pago_a_cuota
+
+            cuota.estado = cuota.calcular_estado()
+            cuotas_modificadas.append(cuota)
+
+        if not pagos_creados:
+            return pagos_creados, cuotas_modificadas, None
+
+        total_pagado = sum((pago.monto_pagado for pago in pagos_creados), Decimal('0.00'))
+        proxima_cuota = min(
+            (cuota for cuota in cuotas_abiertas if cuota.estado != 'pagada'),
+            key=lambda cuota: (cuota.fecha_vencimiento, cuota.numero_cuota),
+            default=None
+        )
+        recibo = ReciboPago(
+            prestamo=self,
+            fecha=fecha_pago,
+            monto_total=total_pagado,
+            saldo_anterior=saldo_anterior,
+            saldo_restante=saldo_anterior - total_pagado,
+            fecha_proximo_pago=proxima_cuota.fecha_vencimiento if proxima_cuota else None,
+            detalle=[
+                {
+                    'cuota': pago.cuota.numero_cuota,
+                    'fecha_vencimiento': pago.cuota.fecha_vencimiento.isoformat(),
+                    'monto': str(pago.monto_pagado),
+                    'estado': pago.cuota.estado,
+                }
+                for pago in pagos_creados
+            ],
+        )
+        return pagos_creados, cuotas_modificadas, recibo
 
     class Meta:
         db_table = 'prestamos_prestamo'
@@ -334,6 +425,10 @@ class Prestamo(models.Model):
                 name='unique_active_loan_per_client'
             )
         ]
+        # Orden de los listados de préstamos por estado (paginación por cursor).
+        indexes = [
+            models.Index(fields=['estado', '-fecha_creacion', '-id'], name='prestamo_estado_creacion_idx'),
+        ]
 
 
 # ==================================================
@@ -368,30 +463,41 @@ class Cuota(models.Model):
         blank=True,
         verbose_name="Fecha Última Penalidad Calculada"
     )
+    # Suma de los pagos de esta cuota. Se mantiene al crear o borrar un Pago
+    # (ver Pago.save y signals.py); `recalcular_monto_pagado` la reconstruye.
+    monto_pagado_acumulado = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        verbose_name="Monto Pagado Acumulado"
+    )
 
     def __str__(self):
         return f"Cuota {self.numero_cuota} - {self.prestamo.cliente} (Préstamo #{self.prestamo.id})"
 
     @property
     def total_pagado(self):
-        return self.pagos.aggregate(total=models.Sum('monto_pagado'))['total'] or Decimal(0)
+        return self.monto_pagado_acumulado
 
     @property
     def monto_total_a_pagar(self):
         """Suma el monto de la cuota y la penalidad acumulada."""
         return self.monto_cuota + self.monto_penalidad_acumulada
 
-    def actualizar_estado(self):
+    def calcular_estado(self):
+        """Devuelve el estado que corresponde a lo pagado, sin guardarlo."""
         total_pagado_actual = self.total_pagado
 
         # AHORA SE COMPARA CON EL MONTO TOTAL (CUOTA + PENALIDAD)
         if total_pagado_actual >= self.monto_total_a_pagar:
-            self.estado = 'pagada'
+            return 'pagada'
         elif total_pagado_actual > Decimal('0.00'):
-            self.estado = 'pagada_parcialmente'
-        else:
-            self.estado = 'pendiente'
-        self.save()
+            return 'pagada_parcialmente'
+        return 'pendiente'
+
+    def actualizar_estado(self):
+        self.estado = self.calcular_estado()
+        self.save(update_fields=['estado'])
 
     class Meta:
         db_table = 'prestamos_cuota'
@@ -399,6 +505,17 @@ class Cuota(models.Model):
         verbose_name_plural = "Cuotas"
         unique_together = ('prestamo', 'numero_cuota')
         ordering = ['prestamo', 'numero_cuota']
+        # Listado de cobros, ordenado por días de atraso (paginación por cursor).
+        indexes = [
+            models.Index(fields=['fecha_vencimiento', 'id'], name='cuota_vencimiento_idx'),
+            # Solo las cuotas impagas: el informe de antigüedad de la mora recorre
+            # la parte vencida sin tocar el historial de cuotas pagadas.
+            models.Index(
+                fields=['fecha_vencimiento', 'prestamo'],
+                condition=Q(estado__in=ESTADOS_CUOTA_ABIERTA),
+                name='cuota_impaga_vencimiento_idx',
+            ),
+        ]
 
 
 # ==================================================
@@ -409,16 +526,76 @@ class Pago(models.Model):
     # Relación con la cuota que se está pagando.
     cuota = models.ForeignKey(Cuota, on_delete=models.CASCADE, related_name="pagos")
     monto_pagado = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Monto Pagado")
-    fecha_pago = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Pago")
+    # default en lugar de auto_now_add para poder importar pagos con su fecha real.
+    fecha_pago = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Fecha de Pago")
+    # Recibo emitido junto con el pago; vacío en los pagos anteriores a los recibos guardados.
+    recibo = models.ForeignKey('ReciboPago', on_delete=models.SET_NULL, null=True, blank=True, related_name="pagos", verbose_name="Recibo")
 
     def __str__(self):
         return f"Pago de {self.monto_pagado} para la cuota #{self.cuota.numero_cuota} del préstamo #{self.cuota.prestamo.id}"
 
+    def save(self, *args, **kwargs):
+        # El pago y el acumulado de la cuota se guardan en la misma transacción.
+        with transaction.atomic():
+            es_nuevo = self._state.adding
+            if not es_nuevo:
+                # Si el pago pasa a otra cuota, la anterior también cambia.
+                cuota_anterior_id = Pago.objects.filter(pk=self.pk).values_list('cuota_id', flat=True).first()
+            super().save(*args, **kwargs)
+            if es_nuevo:
+                Cuota.objects.filter(pk=self.cuota_id).update(
+                    monto_pagado_acumulado=models.F('monto_pagado_acumulado') + self.monto_pagado
+                )
+                # Mantener al día la instancia de la cuota si ya está cargada en memoria.
+                if Pago.cuota.is_cached(self):
+                    self.cuota.monto_pagado_acumulado += self.monto_pagado
+                prestamo_ids = [self.cuota.prestamo_id]
+            else:
+                prestamo_ids = self._recalcular_cuotas({self.cuota_id, cuota_anterior_id} - {None})
+            # post_save llega antes de actualizar el acumulado; se avisa aquí.
+            cartera_modificada.send(sender=Pago, prestamo_ids=prestamo_ids)
+
+    def _recalcular_cuotas(self, cuota_ids):
+        """
+        Recalcula el acumulado y el estado de las cuotas indicadas a partir de
+        sus pagos. Devuelve los IDs de sus préstamos.
+        """
+        Cuota.objects.filter(pk__in=cuota_ids).update(monto_pagado_acumulado=suma_pagos_cuota())
+        prestamo_ids = set()
+        for cuota in Cuota.objects.filter(pk__in=cuota_ids):
+            estado = cuota.calcular_estado()
+            if estado != cuota.estado:
+                Cuota.objects.filter(pk=cuota.pk).update(estado=estado)
+                cuota.estado = estado
+            prestamo_ids.add(cuota.prestamo_id)
+            # Mantener al día la instancia de la cuota si ya está cargada en memoria.
+            if cuota.pk == self.cuota_id and Pago.cuota.is_cached(self):
+                self.cuota.monto_pagado_acumulado = cuota.monto_pagado_acumulado
+                self.cuota.estado = cuota.estado
+        return sorted(prestamo_ids)
+
     class Meta:
         db_table = 'prestamos_pago'
         verbose_name = "Pago"
         verbose_name_plural = "Pagos"
 
+def suma_pagos_cuota():
+    """
+    Expresión con la suma real de los pagos de cada cuota (subconsulta
+    correlacionada). Sirve para recalcular o verificar `monto_pagado_acumulado`.
+    """
+    return Coalesce(
+        Subquery(
+            Pago.objects.filter(cuota=OuterRef('pk'))
+            .order_by()
+            .values('cuota')
+            .annotate(total=models.Sum('monto_pagado'))
+            .values('total')
+        ),
+        Decimal('0.00'),
+        output_field=models.DecimalField()
+    )
+
 # ==================================================
 # === MODELO CAPITAL ===
 # ==================================================
@@ -445,6 +622,106 @@ class Capital(models.Model):
         verbose_name_plural = "Capital de la Empresa"
 
 
+# ==================================================
+# === MODELO RECIBO DE PAGO ===
+# ==================================================
+# Foto del préstamo en el momento de un pago: lo cobrado, los saldos antes y
+# después, cómo se repartió entre las cuotas y el próximo vencimiento. Se
+# guarda en la misma transacción que los pagos y no vuelve a cambiar, así que
+# reimprimir un recibo muestra siempre lo mismo aunque después haya más pagos.
+class ReciboPago(models.Model):
+    prestamo = models.ForeignKey(Prestamo, on_delete=models.CASCADE, related_name="recibos", verbose_name="Préstamo")
+    fecha = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Fecha")
+    monto_total = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Monto Cobrado")
+    saldo_anterior = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Saldo Anterior")
+    saldo_restante = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Saldo Restante")
+    fecha_proximo_pago = models.DateField(null=True, blank=True, verbose_name="Próximo Vencimiento")
+    # Lista de {'cuota', 'fecha_vencimiento', 'monto', 'estado'} en el orden en que se aplicó el pago.
+    detalle = models.JSONField(default=list, verbose_name="Distribución del Pago")
+
+    def __str__(self):
+        return f"Recibo {self.numero}"
+
+    @property
+    def numero(self):
+        return f"{self.pk:06d}"
+
+    class Meta:
+        db_table = 'prestamos_recibo_pago'
+        ordering = ['-fecha']
+        verbose_name = "Recibo de Pago"
+        verbose_name_plural = "Recibos de Pago"
+
+
+# ==================================================
+# === MODELO SITUACIÓN DEL PRÉSTAMO ===
+# ==================================================
+# Una fila por préstamo con su saldo, lo pagado y el próximo vencimiento, para
+# que las pantallas y listados no tengan que sumar cuotas y pagos cada vez.
+# Se mantiene en la misma transacción que los pagos, la generación de cuotas
+# y las penalidades (ver `actualizar_situacion_prestamos` en utils.py) y se
+# puede reconstruir con el comando `reconstruir_situacion_prestamos`.
+class SituacionPrestamo(models.Model):
+    prestamo = models.OneToOneField(Prestamo, on_delete=models.CASCADE, primary_key=True, related_name="situacion", verbose_name="Préstamo")
+    saldo_pendiente = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Saldo Pendiente", help_text="Cuotas más penalidades, menos lo pagado.")
+    total_pagado = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Total Pagado")
+    total_penalidades = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Penalidades Acumuladas")
+    cuotas_pendientes = models.PositiveIntegerField(default=0, verbose_name="Cuotas por Pagar")
+    # Vencimiento de la cuota impaga más antigua; si ya pasó, el préstamo está en atraso desde ese día.
+    proximo_vencimiento = models.DateField(null=True, blank=True, verbose_name="Próximo Vencimiento")
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name="Actualizado")
+
+    def __str__(self):
+        return f"Situación del préstamo #{self.prestamo_id}"
+
+    def dias_atraso(self, hoy=None):
+        """Días desde el vencimiento impago más antiguo (0 si está al día)."""
+        if self.proximo_vencimiento is None:
+            return 0
+        hoy = hoy or timezone.localdate()
+        return max((hoy - self.proximo_vencimiento).days, 0)
+
+    class Meta:
+        db_table = 'prestamos_situacion_prestamo'
+        verbose_name = "Situación del Préstamo"
+        verbose_name_plural = "Situación de los Préstamos"
+        # Ordenar y filtrar listados por saldo o por atraso.
+        indexes = [
+            models.Index(fields=['saldo_pendiente', 'prestamo'], name='situacion_saldo_idx'),
+            models.Index(fields=['proximo_vencimiento', 'prestamo'], name='situacion_vencimiento_idx'),
+        ]
+
+
+# ==================================================
+# === MODELO FOTO DIARIA DE LA CARTERA ===
+# ==================================================
+# Guarda una fila por día con las cifras del panel, para poder graficar su
+# evolución sin recorrer todo el historial de pagos y cuotas.
+class PortfolioSnapshot(models.Model):
+    fecha = models.DateField(unique=True, verbose_name="Fecha")
+    capital_inicial = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Capital Inicial")
+    total_desembolsado = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Total Desembolsado")
+    total_recibido = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Total Cobrado")
+    dinero_en_caja = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Dinero en Caja")
+    dinero_en_la_calle = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Cartera Activa")
+    ganancia_realizada = models.DecimalField(max_digits=15, decimal_places=2, default=0, verbose_name="Ganancia Realizada")
+    num_prestamos_activos = models.PositiveIntegerField(default=0, verbose_name="Préstamos Activos")
+    num_prestamos_en_atraso = models.PositiveIntegerField(default=0, verbose_name="Préstamos en Atraso")
+    # Las penalidades no tienen historial, así que en días reconstruidos queda vacío.
+    total_penalidades = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True, verbose_name="Penalidades Pendientes")
+    reconstruida = models.BooleanField(default=False, verbose_name="Reconstruida", help_text="Calculada a posteriori desde el historial de pagos.")
+    fecha_generacion = models.DateTimeField(auto_now=True, verbose_name="Fecha de Generación")
+
+    def __str__(self):
+        return f"Cartera al {self.fecha:%d/%m/%Y}"
+
+    class Meta:
+        db_table = 'prestamos_portfolio_snapshot'
+        ordering = ['fecha']
+        verbose_name = "Foto Diaria de la Cartera"
+        verbose_name_plural = "Fotos Diarias de la Cartera"
+
+
 # ==================================================
 # === MODELO REQUISITO ===
 # ==================================================
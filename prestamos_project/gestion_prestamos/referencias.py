@@ -0,0 +1,134 @@
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from . import telemetria
+
+# ==================================================
+# === CACHÉ DE DATOS DE REFERENCIA ===
+# ==================================================
+# Configuración de impresión, tipos de préstamo y de gasto, grupos: datos que
+# casi nunca cambian y que se leían de la base en cada petición. Cada proceso
+# guarda su copia en memoria junto con una "versión". La versión vigente vive
+# en la caché compartida (CACHE_URL): al leer se compara y, si otro proceso
+# publicó una nueva, se recarga desde la base. Así un cambio hecho en un
+# worker de WSGI se ve en todos los demás sin reiniciarlos.
+#
+# Con la caché por defecto (locmem) la versión no se comparte entre procesos;
+# en ese caso REFERENCIAS_TTL limita cuánto puede tardar un worker en ver el
+# cambio.
+
+_copias_locales = {}
+_bloqueo = threading.Lock()
+
+# Backends cuyo contenido no ven los demás procesos (o que no guardan nada).
+BACKENDS_NO_COMPARTIDOS = frozenset([
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+])
+
+
+def cache_compartida():
+    """Indica si la caché por defecto la comparten todos los procesos (CACHE_URL)."""
+    return settings.CACHES['default']['BACKEND'] not in BACKENDS_NO_COMPARTIDOS
+
+
+def _clave_version(nombre):
+    return f'referencias:version:{nombre}'
+
+
+def version_referencia(nombre):
+    """Devuelve la versión vigente de `nombre`, creándola si aún no existe."""
+    clave = _clave_version(nombre)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, uuid.uuid4().hex, None)
+        version = cache.get(clave)
+    return version
+
+
+def obtener_referencia(nombre, cargar):
+    """
+    Devuelve el valor de `nombre` desde la copia del proceso; si la versión
+    compartida cambió o la copia venció, lo recarga con `cargar()`.
+
+    El valor se comparte entre peticiones: quien lo use no debe modificarlo.
+    """
+    version = version_referencia(nombre)
+    copia = _copias_locales.get(nombre)
+    if copia is not None and copia[0] == version and copia[1] > time.monotonic():
+        telemetria.registrar_lectura_cache('referencias', True)
+        return copia[2]
+    telemetria.registrar_lectura_cache('referencias', False)
+
+    valor = cargar()
+    with _bloqueo:
+        _copias_locales[nombre] = (version, time.monotonic() + settings.REFERENCIAS_TTL, valor)
+    return valor
+
+
+def invalidar_referencia(*nombres):
+    """
+    Publica una versión nueva de cada referencia al confirmar la transacción,
+    para que todos los procesos la vuelvan a cargar.
+    """
+    def publicar():
+        cache.set_many({_clave_version(nombre): uuid.uuid4().hex for nombre in nombres}, None)
+        with _bloqueo:
+            for nombre in nombres:
+                _copias_locales.pop(nombre, None)
+    transaction.on_commit(publicar)
+
+
+# --- Referencias concretas ---
+
+REF_CONFIGURACION_IMPRESION = 'configuracion_impresion'
+REF_TIPOS_PRESTAMO = 'tipos_prestamo'
+REF_TIPOS_GASTO = 'tipos_gasto'
+REF_GRUPOS = 'grupos'
+
+
+def _cargar_tipos_prestamo():
+    from .models import TipoPrestamo
+    return {
+        tipo.pk: {
+            'tasa_interes_predeterminada': str(tipo.tasa_interes_predeterminada),
+            'monto_minimo': str(tipo.monto_minimo),
+            'monto_maximo': str(tipo.monto_maximo),
+            'plazo_minimo_meses': tipo.plazo_minimo_meses,
+            'plazo_maximo_meses': tipo.plazo_maximo_meses,
+            'requiere_garantia': tipo.requiere_garantia,
+        }
+        for tipo in TipoPrestamo.objects.all()
+    }
+
+
+def obtener_detalles_tipo_prestamo(pk):
+    """Datos de un tipo de préstamo para el formulario, o None si no existe."""
+    return obtener_referencia(REF_TIPOS_PRESTAMO, _cargar_tipos_prestamo).get(pk)
+
+
+def obtener_opciones_tipo_gasto():
+    """Lista de (pk, nombre) de los tipos de gasto, en orden alfabético."""
+    from .models import TipoGasto
+    return obtener_referencia(
+        REF_TIPOS_GASTO,
+        lambda: list(TipoGasto.objects.order_by('nombre').values_list('pk', 'nombre'))
+    )
+
+
+def _cargar_grupos():
+    from django.contrib.auth.models import Group
+    return dict(Group.objects.values_list('name', 'pk'))
+
+
+def obtener_id_grupo(nombre):
+    """
+    Id del grupo `nombre`, o None si no existe. Solo se guardan los ids: la
+    membresía decide permisos y se consulta siempre en la base (ver
+    configuracion.views.es_administrador), porque con una caché por proceso un
+    usuario quitado de un grupo lo seguiría teniendo en los demás workers.
+    """
+    return obtener_referencia(REF_GRUPOS, _cargar_grupos).get(nombre)
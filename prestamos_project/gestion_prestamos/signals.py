@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
 from django.contrib.auth.models import User, Group
 from django.dispatch import receiver
-from .models import Cliente
+from .models import Cliente, Cuota, Pago, Prestamo, SituacionPrestamo, TipoGasto, TipoPrestamo, cartera_modificada
+from .utils import CAMPOS_CUOTA_SITUACION, actualizar_situacion_prestamos, diferir_situacion
+from .referencias import REF_GRUPOS, REF_TIPOS_GASTO, REF_TIPOS_PRESTAMO, invalidar_referencia, obtener_id_grupo
 
 @receiver(post_save, sender=Cliente)
 def create_client_user(sender, instance, created, **kwargs):
@@ -23,13 +26,70 @@ def create_client_user(sender, instance, created, **kwargs):
             user.save()
 
             # Asignar el usuario al grupo 'Clientes'
-            try:
-                client_group = Group.objects.get(name='Clientes')
-                user.groups.add(client_group)
-            except Group.DoesNotExist:
-                # Manejar el caso en que el grupo no exista (aunque la migración debería crearlo)
-                pass
+            client_group_id = obtener_id_grupo('Clientes')
+            # Si el grupo no existe (aunque la migración debería crearlo), no se asigna
+            if client_group_id is not None:
+                user.groups.add(client_group_id)
 
             # Vincula el usuario recién creado con el perfil del cliente.
             instance.user = user
             instance.save()
+
+@receiver(post_delete, sender=Pago)
+def descontar_pago_de_cuota(sender, instance, origin=None, **kwargs):
+    """
+    Resta el pago borrado del acumulado de su cuota. Django envía esta señal
+    dentro de la transacción del borrado, también en borrados por queryset.
+    """
+    Cuota.objects.filter(pk=instance.cuota_id).update(
+        monto_pagado_acumulado=F('monto_pagado_acumulado') - instance.monto_pagado
+    )
+    # Si se borra el préstamo o la cuota entera, no hay situación que recalcular.
+    if isinstance(origin, Pago) or getattr(origin, 'model', None) is Pago:
+        actualizar_situacion_prestamos([instance.cuota.prestamo_id])
+
+
+# --- Situación de los préstamos (ver SituacionPrestamo) ---
+# Se actualiza de forma síncrona, dentro de la transacción que cambió las
+# cuotas: si el pago se revierte, la situación también. El borrado de cuotas
+# no se escucha para no recalcular fila por fila al regenerarlas; quien las
+# regenera envía `cartera_modificada` al terminar.
+
+@receiver(cartera_modificada)
+def actualizar_situacion_cartera(sender, prestamo_ids, **kwargs):
+    actualizar_situacion_prestamos(prestamo_ids)
+
+@receiver(post_save, sender=Cuota)
+def actualizar_situacion_cuota(sender, instance, update_fields=None, **kwargs):
+    """
+    Cuesta un agregado y un upsert por cuota guardada. Se omite si el save no
+    tocó campos de los que depende la situación, o dentro de
+    `situacion_diferida`, que recalcula todo una vez al final.
+    """
+    if update_fields is not None and not CAMPOS_CUOTA_SITUACION & set(update_fields):
+        return
+    if not diferir_situacion(instance.prestamo_id):
+        actualizar_situacion_prestamos([instance.prestamo_id])
+
+@receiver(post_save, sender=Prestamo)
+def crear_situacion_prestamo(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        SituacionPrestamo.objects.create(prestamo=instance)
+
+
+# --- Caché de datos de referencia (ver referencias.py) ---
+
+@receiver(post_save, sender=TipoPrestamo)
+@receiver(post_delete, sender=TipoPrestamo)
+def invalidar_tipos_prestamo(sender, **kwargs):
+    invalidar_referencia(REF_TIPOS_PRESTAMO)
+
+@receiver(post_save, sender=TipoGasto)
+@receiver(post_delete, sender=TipoGasto)
+def invalidar_tipos_gasto(sender, **kwargs):
+    invalidar_referencia(REF_TIPOS_GASTO)
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidar_grupos(sender, **kwargs):
+    invalidar_referencia(REF_GRUPOS)
@@ -0,0 +1,215 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# ==================================================
+# === TELEMETRÍA DEL PROCESO ===
+# ==================================================
+# Contadores e histogramas livianos para el endpoint /metrics (formato de
+# texto de Prometheus). Cada proceso los acumula en memoria con un bloqueo y,
+# como mucho cada METRICAS_INTERVALO segundos, vuelca una foto en su propio
+# archivo JSON dentro de METRICAS_DIR (escritura atómica, como los documentos
+# en caché). El endpoint suma los archivos de todos los workers de WSGI, así
+# que un scrape ve el total sin importar qué proceso lo atienda. Un worker
+# puede tardar hasta METRICAS_INTERVALO segundos en aparecer actualizado.
+#
+# Sin METRICAS_DIR no se escribe nada y el endpoint muestra solo el proceso
+# que atiende el scrape. Los archivos de procesos terminados se conservan
+# para que los contadores no retrocedan; la carpeta se puede vaciar al
+# desplegar (Prometheus lo toma como un reinicio de los contadores).
+
+BUCKETS_SEGUNDOS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# nombre: (tipo, ayuda)
+METRICAS = {
+    'prestamos_peticiones_total': ('counter', 'Peticiones atendidas por vista, método y estado HTTP.'),
+    'prestamos_peticion_segundos': ('histogram', 'Duración de las peticiones por vista.'),
+    'prestamos_pagos_registrados_total': ('counter', 'Pagos registrados (un recibo por pago), en caja o por importación.'),
+    'prestamos_pagos_monto_total': ('counter', 'Monto de los pagos registrados.'),
+    'prestamos_cuotas_generadas_total': ('counter', 'Cuotas escritas al generar o regenerar tablas de amortización.'),
+    'prestamos_penalidades_segundos': ('histogram', 'Duración de cada cálculo de penalidades en lote, por alcance.'),
+    'prestamos_penalidades_cuotas_total': ('counter', 'Cuotas a las que se les sumó penalidad.'),
+    'prestamos_cache_lecturas_total': ('counter', 'Lecturas de cada caché por resultado (acierto o fallo).'),
+}
+
+_bloqueo = threading.Lock()
+_estado = {'pid': None}
+
+
+def _registro():
+    """
+    Estado del proceso actual. Si el proceso se bifurcó (un servidor que
+    carga la app antes de crear los workers), el hijo empieza de cero y con
+    su propio archivo.
+    """
+    if _estado['pid'] != os.getpid():
+        _estado.update(
+            pid=os.getpid(), contadores={}, histogramas={},
+            archivo=f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json', volcado=time.monotonic(),
+        )
+    return _estado
+
+
+def _clave(nombre, etiquetas):
+    return nombre, tuple(sorted(etiquetas.items()))
+
+
+def incrementar(nombre, valor=1, **etiquetas):
+    """Suma `valor` al contador `nombre` con esas etiquetas."""
+    with _bloqueo:
+        contadores = _registro()['contadores']
+        clave = _clave(nombre, etiquetas)
+        contadores[clave] = contadores.get(clave, 0) + float(valor)
+    _volcar_si_corresponde()
+
+
+def observar(nombre, valor, **etiquetas):
+    """Anota `valor` (segundos) en el histograma `nombre`."""
+    with _bloqueo:
+        histogramas = _registro()['histogramas']
+        # Un conteo por límite, el de +Inf y la suma.
+        datos = histogramas.setdefault(_clave(nombre, etiquetas), [0] * (len(BUCKETS_SEGUNDOS) + 1) + [0.0])
+        posicion = next((i for i, limite in enumerate(BUCKETS_SEGUNDOS) if valor <= limite), len(BUCKETS_SEGUNDOS))
+        datos[posicion] += 1
+        datos[-1] += valor
+    _volcar_si_corresponde()
+
+
+def incrementar_al_confirmar(nombre, valor=1, **etiquetas):
+    """Como `incrementar`, pero solo si la transacción en curso se confirma."""
+    transaction.on_commit(lambda: incrementar(nombre, valor, **etiquetas))
+
+
+def registrar_lectura_cache(cache, acierto):
+    """Anota una lectura de la caché `cache` para la proporción de aciertos."""
+    incrementar('prestamos_cache_lecturas_total', cache=cache, resultado='acierto' if acierto else 'fallo')
+
+
+# --- Volcado a disco y agregación ---
+
+def _volcar_si_corresponde():
+    if settings.METRICAS_DIR and time.monotonic() - _registro()['volcado'] >= settings.METRICAS_INTERVALO:
+        volcar()
+
+
+def volcar():
+    """Escribe la foto de este proceso en su archivo de METRICAS_DIR."""
+    if not settings.METRICAS_DIR:
+        return
+    with _bloqueo:
+        registro = _registro()
+        registro['volcado'] = time.monotonic()
+        foto = _serializar(registro['contadores'], registro['histogramas'])
+        archivo = registro['archivo']
+
+    carpeta = Path(settings.METRICAS_DIR)
+    try:
+        carpeta.mkdir(parents=True, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=carpeta, suffix='.tmp')
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as destino:
+            json.dump(foto, destino)
+        os.replace(temporal, carpeta / archivo)
+    except OSError:
+        # Las métricas nunca deben romper una petición.
+        logger.exception('No se pudieron volcar las métricas del proceso')
+
+
+atexit.register(volcar)
+
+
+def _serializar(contadores, histogramas):
+    return {
+        'contadores': [[nombre, list(etiquetas), valor] for (nombre, etiquetas), valor in contadores.items()],
+        'histogramas': [[nombre, list(etiquetas), datos] for (nombre, etiquetas), datos in histogramas.items()],
+    }
+
+
+def leer_agregado():
+    """
+    Devuelve (contadores, histogramas) sumados entre todos los procesos que
+    volcaron en METRICAS_DIR, o solo los de este proceso si no hay carpeta.
+    """
+    if not settings.METRICAS_DIR:
+        with _bloqueo:
+            registro = _registro()
+            return dict(registro['contadores']), {clave: list(datos) for clave, datos in registro['histogramas'].items()}
+
+    volcar()
+    contadores, histogramas = {}, {}
+    for ruta in Path(settings.METRICAS_DIR).glob('*.json'):
+        try:
+            foto = json.loads(ruta.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        for nombre, etiquetas, valor in foto['contadores']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            contadores[clave] = contadores.get(clave, 0) + valor
+        for nombre, etiquetas, datos in foto['histogramas']:
+            clave = (nombre, tuple(map(tuple, etiquetas)))
+            acumulado = histogramas.setdefault(clave, [0] * len(datos))
+            histogramas[clave] = [a + b for a, b in zip(acumulado, datos)]
+    return contadores, histogramas
+
+
+# --- Formato de exposición de Prometheus ---
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(etiquetas):
+    if not etiquetas:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in etiquetas) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor))
+
+
+def exposicion():
+    """Todas las métricas agregadas en el formato de texto de Prometheus (0.0.4)."""
+    contadores, histogramas = leer_agregado()
+    lineas = []
+    for nombre, (tipo, ayuda) in METRICAS.items():
+        lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} {tipo}']
+        if tipo == 'counter':
+            for (metrica, etiquetas), valor in sorted(contadores.items()):
+                if metrica == nombre:
+                    lineas.append(f'{nombre}{_etiquetas(etiquetas)} {_numero(valor)}')
+            continue
+        for (metrica, etiquetas), datos in sorted(histogramas.items()):
+            if metrica != nombre:
+                continue
+            acumulado = 0
+            for limite, cantidad in zip([*map(str, BUCKETS_SEGUNDOS), '+Inf'], datos[:-1]):
+                acumulado += cantidad
+                lineas.append(f'{nombre}_bucket{_etiquetas(etiquetas + (("le", limite),))} {_numero(acumulado)}')
+            lineas.append(f'{nombre}_sum{_etiquetas(etiquetas)} {_numero(datos[-1])}')
+            lineas.append(f'{nombre}_count{_etiquetas(etiquetas)} {_numero(acumulado)}')
+
+    # Proporción de aciertos por caché, calculada sobre los contadores agregados.
+    lecturas = {}
+    for (metrica, etiquetas), valor in contadores.items():
+        if metrica == 'prestamos_cache_lecturas_total':
+            etiquetas = dict(etiquetas)
+            total = lecturas.setdefault(etiquetas['cache'], [0, 0])
+            total[0] += valor if etiquetas['resultado'] == 'acierto' else 0
+            total[1] += valor
+    lineas += [
+        '# HELP prestamos_cache_aciertos_ratio Proporción de lecturas de cada caché que fueron aciertos.',
+        '# TYPE prestamos_cache_aciertos_ratio gauge',
+    ]
+    for cache, (aciertos, total) in sorted(lecturas.items()):
+        lineas.append(f'prestamos_cache_aciertos_ratio{_etiquetas((("cache", cache),))} {_numero(aciertos / total)}')
+    return '\n'.join(lineas) + '\n'
@@ -1,3 +1,685 @@
-from django.test import TestCase
+import csv
+import datetime
+import os
+import random
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from configuracion.views import es_administrador
+
+from . import busqueda, referencias, utils
+from .busqueda import buscar_por_cliente
+from .importacion_pagos import importar_pagos, leer_csv
+from .models import Cliente, Cuota, Pago, Prestamo, ReciboPago, SituacionPrestamo, TipoPrestamo, cartera_modificada
+from .utils import (
+    actualizar_situacion_prestamos,
+    aplicar_penalidades_en_lote,
+    calcular_penalidad_cuota,
+    calcular_tabla_amortizacion,
+    calcular_tablas_amortizacion_lote,
+    generar_cuotas,
+    regenerar_cuotas_lote,
+)
+
+
+class CalcularTablasAmortizacionLoteTests(SimpleTestCase):
+    """El cálculo por lotes debe dar exactamente las mismas tablas que el individual."""
+
+    def _prestamo(self, monto, tasa, periodo_tasa, plazo, frecuencia, fecha):
+        return Prestamo(
+            monto=Decimal(monto),
+            tasa_interes=Decimal(tasa),
+            periodo_tasa=periodo_tasa,
+            plazo=plazo,
+            frecuencia_pago=frecuencia,
+            fecha_desembolso=fecha,
+        )
+
+    def test_paridad_con_calculo_individual(self):
+        rng = random.Random(17)
+        prestamos = [
+            self._prestamo(
+                Decimal(rng.randrange(50000, 50000000)) / 100,
+                Decimal(rng.randrange(0, 6000)) / 100,
+                rng.choice(['anual', 'mensual']),
+                rng.randint(1, 72),
+                rng.choice(['semanal', 'quincenal', 'mensual']),
+                datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randint(0, 800)),
+            )
+            for _ in range(300)
+        ]
+
+        lote = calcular_tablas_amortizacion_lote(prestamos)
+
+        self.assertEqual(len(lote), len(prestamos))
+        for prestamo, tabla in zip(prestamos, lote):
+            self.assertEqual(tabla, calcular_tabla_amortizacion(prestamo))
+
+    def test_fin_de_mes_y_tasa_cero(self):
+        prestamos = [
+            self._prestamo('1000.00', '24.00', 'anual', 12, 'mensual', datetime.date(2024, 1, 31)),
+            self._prestamo('100.01', '0.00', 'anual', 2, 'quincenal', datetime.date(2024, 2, 29)),
+        ]
+
+        lote = calcular_tablas_amortizacion_lote(prestamos)
+
+        self.assertEqual(lote[0][0]['fecha_vencimiento'], datetime.date(2024, 2, 29))
+        self.assertEqual(lote[0][-1]['saldo_pendiente'], Decimal('0.00'))
+        for prestamo, tabla in zip(prestamos, lote):
+            self.assertEqual(tabla, calcular_tabla_amortizacion(prestamo))
+
+
+class GenerarCuotasTests(TestCase):
+
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nombres='Ana', apellidos='Pérez', numero_documento='00112345678')
+
+    def _prestamo(self, **kwargs):
+        datos = {
+            'cliente': self.cliente,
+            'monto': Decimal('12000.00'),
+            'tasa_interes': Decimal('18.00'),
+            'plazo': 12,
+            'frecuencia_pago': 'semanal',
+            'fecha_desembolso': datetime.date(2025, 1, 15),
+            'estado': 'pagado',
+        }
+        datos.update(kwargs)
+        return Prestamo.objects.create(**datos)
+
+    def test_generar_cuotas_guarda_toda_la_tabla_en_una_insercion(self):
+        prestamo = self._prestamo()
+
+        with self.assertNumQueries(5):  # SAVEPOINT, INSERT, situación (agregado y upsert), RELEASE
+            resumen = generar_cuotas(prestamo)
+
+        tabla = calcular_tabla_amortizacion(prestamo)
+        self.assertEqual(resumen['cuotas'], 48)
+        self.assertEqual(
+            list(prestamo.cuotas.values_list('numero_cuota', 'monto_cuota', 'capital', 'interes', 'saldo_pendiente')),
+            [(c['numero_cuota'], c['cuota_fija'], c['capital'], c['interes'], c['saldo_pendiente']) for c in tabla],
+        )
+
+    def test_regenerar_cuotas_lote_omite_prestamos_con_pagos(self):
+        con_pagos = self._prestamo()
+        generar_cuotas(con_pagos)
+        Pago.objects.create(cuota=con_pagos.cuotas.first(), monto_pagado=Decimal('10.00'))
+        sin_pagos = self._prestamo(plazo=6, frecuencia_pago='mensual')
+        generar_cuotas(sin_pagos)
+        sin_pagos.cuotas.update(estado='vencida')
+
+        resumen = regenerar_cuotas_lote(Prestamo.objects.all())
+
+        self.assertEqual(resumen['omitidos'], [con_pagos.pk])
+        self.assertEqual(resumen['cuotas'], 6)
+        self.assertEqual(sin_pagos.cuotas.filter(estado='pendiente').count(), 6)
+        self.assertEqual(Pago.objects.filter(cuota__prestamo=con_pagos).count(), 1)
+
+    def test_regenerar_cuotas_lote_respeta_un_pago_registrado_mientras_tanto(self):
+        prestamo = self._prestamo(plazo=6, frecuencia_pago='mensual', estado='aprobado')
+        generar_cuotas(prestamo)
+        calcular = utils.calcular_tablas_amortizacion_lote
+
+        def calcular_y_cobrar(bloque):
+            # Otro proceso cobra después de que se leyeron los préstamos y antes de escribir el bloque.
+            prestamo.registrar_pago(Decimal('10.00'))
+            return calcular(bloque)
+
+        with mock.patch.object(utils, 'calcular_tablas_amortizacion_lote', calcular_y_cobrar):
+            resumen = regenerar_cuotas_lote(Prestamo.objects.all())
+
+        self.assertEqual((resumen['prestamos'], resumen['omitidos']), (0, [prestamo.pk]))
+        self.assertEqual(Pago.objects.filter(cuota__prestamo=prestamo).count(), 1)
+
+
+class AplicarPenalidadesEnLoteTests(TestCase):
+    """El UPDATE por lotes debe dejar las cuotas igual que `calcular_penalidad_cuota`."""
+
+    def setUp(self):
+        rng = random.Random(5)
+        hoy = timezone.localdate()
+        cliente = Cliente.objects.create(nombres='Luis', apellidos='Gómez', numero_documento='00187654321')
+        tipos = [
+            TipoPrestamo.objects.create(
+                nombre=f'Tipo {i}', tasa_interes_predeterminada=Decimal('20.00'), monto_maximo=Decimal('50000.00'),
+                plazo_maximo_meses=24, tasa_penalidad_diaria=tasa, dias_gracia=gracia,
+            )
+            for i, (tasa, gracia) in enumerate([
+                (Decimal('0.0100'), 0), (Decimal('0.0037'), 3), (Decimal('0.0005'), 5), (Decimal('0.0000'), 2),
+            ])
+        ]
+        prestamos = [
+            Prestamo.objects.create(
+                cliente=cliente, tipo_prestamo=tipo, monto=Decimal('5000.00'), tasa_interes=Decimal('20.00'),
+                plazo=24, fecha_desembolso=hoy, estado='pagado',
+            )
+            for tipo in tipos + [None]
+        ]
+        for prestamo in prestamos:
+            for numero in range(1, 41):
+                cuota = Cuota.objects.create(
+                    prestamo=prestamo,
+                    numero_cuota=numero,
+                    fecha_vencimiento=hoy + datetime.timedelta(days=rng.randint(-90, 3)),
+                    monto_cuota=Decimal(rng.randrange(1, 500000)) / 100,
+                    capital=Decimal('0.00'),
+                    interes=Decimal('0.00'),
+                    saldo_pendiente=Decimal('0.00'),
+                    estado=rng.choice(['pendiente', 'pendiente', 'pagada_parcialmente', 'vencida', 'pagada']),
+                    monto_penalidad_acumulada=Decimal(rng.randrange(0, 300)) / 100,
+                    fecha_ultima_penalidad_calculada=rng.choice(
+                        [None, None, hoy, hoy - datetime.timedelta(days=rng.randint(1, 30))]
+                    ),
+                )
+                if rng.random() < 0.4:
+                    monto_pagado = cuota.monto_cuota * Decimal(rng.choice(['0.25', '0.5', '1.2']))
+                    Pago.objects.create(cuota=cuota, monto_pagado=monto_pagado.quantize(Decimal('0.01')))
+
+    def _estado_cuotas(self):
+        return list(Cuota.objects.order_by('pk').values_list('pk', 'monto_penalidad_acumulada', 'fecha_ultima_penalidad_calculada'))
+
+    def test_paridad_con_calculo_por_fila(self):
+        with transaction.atomic():
+            for cuota in Cuota.objects.select_related('prestamo__tipo_prestamo'):
+                calcular_penalidad_cuota(cuota)
+            esperado = self._estado_cuotas()
+            transaction.set_rollback(True)
+
+        antes = self._estado_cuotas()
+        actualizadas = aplicar_penalidades_en_lote()
+
+        self.assertEqual(self._estado_cuotas(), esperado)
+        self.assertEqual(actualizadas, sum(1 for a, b in zip(antes, esperado) if a != b))
+        self.assertGreater(actualizadas, 0)
+
+    def test_segunda_ejecucion_del_mismo_dia_no_cambia_nada(self):
+        aplicar_penalidades_en_lote()
+        estado = self._estado_cuotas()
+
+        self.assertEqual(aplicar_penalidades_en_lote(), 0)
+        self.assertEqual(self._estado_cuotas(), estado)
+
+
+class MontoPagadoAcumuladoTests(TestCase):
+
+    def setUp(self):
+        cliente = Cliente.objects.create(nombres='Rosa', apellidos='Díaz', numero_documento='00155555555')
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente, monto=Decimal('1000.00'), tasa_interes=Decimal('12.00'), plazo=3,
+            fecha_desembolso=datetime.date(2025, 1, 1), estado='aprobado',
+        )
+        generar_cuotas(self.prestamo)
+        self.cuota = self.prestamo.cuotas.get(numero_cuota=1)
+
+    def test_se_actualiza_al_crear_y_borrar_pagos(self):
+        pago = Pago.objects.create(cuota=self.cuota, monto_pagado=Decimal('100.00'))
+        Pago.objects.create(cuota=self.cuota, monto_pagado=Decimal('50.25'))
+        self.cuota.refresh_from_db()
+        self.assertEqual(self.cuota.monto_pagado_acumulado, Decimal('150.25'))
+
+        pago.delete()
+        self.cuota.refresh_from_db()
+        self.assertEqual(self.cuota.total_pagado, Decimal('50.25'))
+
+        Pago.objects.filter(cuota=self.cuota).delete()
+        self.cuota.refresh_from_db()
+        self.assertEqual(self.cuota.total_pagado, Decimal('0.00'))
+
+    def test_mover_un_pago_recalcula_las_dos_cuotas(self):
+        otro_cliente = Cliente.objects.create(nombres='Otto', apellidos='Díaz', numero_documento='00155555556')
+        otro_prestamo = Prestamo.objects.create(
+            cliente=otro_cliente, monto=Decimal('500.00'), tasa_interes=Decimal('12.00'), plazo=2,
+            fecha_desembolso=datetime.date(2025, 1, 1), estado='aprobado',
+        )
+        generar_cuotas(otro_prestamo)
+        destino = otro_prestamo.cuotas.get(numero_cuota=1)
+        pago = Pago.objects.create(cuota=self.cuota, monto_pagado=self.cuota.monto_cuota)
+        Cuota.objects.filter(pk=self.cuota.pk).update(estado='pagada')
+
+        avisos = []
+
+        def receptor(prestamo_ids, **kwargs):
+            avisos.append(set(prestamo_ids))
+
+        cartera_modificada.connect(receptor)
+        self.addCleanup(cartera_modificada.disconnect, receptor)
+        pago.cuota = destino
+        pago.monto_pagado = Decimal('20.00')
+        pago.save()
+
+        self.cuota.refresh_from_db()
+        destino.refresh_from_db()
+        self.assertEqual((self.cuota.monto_pagado_acumulado, self.cuota.estado), (Decimal('0.00'), 'pendiente'))
+        self.assertEqual((destino.monto_pagado_acumulado, destino.estado), (Decimal('20.00'), 'pagada_parcialmente'))
+        self.assertIn({self.prestamo.pk, otro_prestamo.pk}, avisos)
+
+    def test_registrar_pago_no_pisa_el_acumulado(self):
+        monto = self.cuota.monto_cuota + Decimal('10.00')
+        self.prestamo.registrar_pago(monto)
+
+        self.assertEqual(
+            list(self.prestamo.cuotas.values_list('monto_pagado_acumulado', flat=True)[:2]),
+            [self.cuota.monto_cuota, Decimal('10.00')],
+        )
+
+    def test_comando_detecta_y_corrige_desfases(self):
+        Pago.objects.create(cuota=self.cuota, monto_pagado=Decimal('75.00'))
+        Cuota.objects.filter(pk=self.cuota.pk).update(monto_pagado_acumulado=Decimal('1.00'))
+
+        salida = StringIO()
+        call_command('recalcular_monto_pagado', '--solo-verificar', stdout=salida)
+        self.assertIn('1 cuota(s) con diferencias', salida.getvalue())
+        self.cuota.refresh_from_db()
+        self.assertEqual(self.cuota.monto_pagado_acumulado, Decimal('1.00'))
+
+        call_command('recalcular_monto_pagado', stdout=StringIO())
+        self.cuota.refresh_from_db()
+        self.assertEqual(self.cuota.monto_pagado_acumulado, Decimal('75.00'))
+
+
+class RegistrarPagoTests(TestCase):
+
+    def setUp(self):
+        cliente = Cliente.objects.create(nombres='Pedro', apellidos='Mota', numero_documento='00166666666')
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente, monto=Decimal('24000.00'), tasa_interes=Decimal('24.00'), plazo=24,
+            frecuencia_pago='semanal', fecha_desembolso=datetime.date(2025, 1, 1), estado='aprobado',
+        )
+        generar_cuotas(self.prestamo)
+        self.cuotas = list(self.prestamo.cuotas.order_by('numero_cuota'))
+
+    def test_consultas_constantes_sin_importar_las_cuotas_cubiertas(self):
+        with self.assertNumQueries(9):
+            self.prestamo.registrar_pago(Decimal('10.00'))
+        with self.assertNumQueries(9):
+            self.prestamo.registrar_pago(self.cuotas[0].monto_cuota * 40)
+
+    def test_distribuye_en_orden_y_salda_el_prestamo(self):
+        cuota_1, cuota_2 = self.cuotas[0], self.cuotas[1]
+        Cuota.objects.filter(pk=cuota_1.pk).update(monto_penalidad_acumulada=Decimal('5.00'), estado='vencida')
+
+        pagos = self.prestamo.registrar_pago(cuota_1.monto_cuota + Decimal('15.00'))
+
+        self.assertEqual([p.monto_pagado for p in pagos], [cuota_1.monto_cuota + Decimal('5.00'), Decimal('10.00')])
+        self.assertTrue(all(p.pk for p in pagos))
+        cuota_1.refresh_from_db()
+        cuota_2.refresh_from_db()
+        self.assertEqual((cuota_1.estado, cuota_2.estado), ('pagada', 'pagada_parcialmente'))
+        self.assertEqual(cuota_2.monto_pagado_acumulado, Decimal('10.00'))
+
+        saldo = sum(c.monto_cuota for c in self.cuotas)
+        self.prestamo.registrar_pago(saldo)
+        self.prestamo.refresh_from_db()
+        self.assertEqual(self.prestamo.estado, 'pagado')
+        self.assertFalse(self.prestamo.cuotas.exclude(estado='pagada').exists())
+
+    def test_emite_el_recibo_con_los_saldos_del_momento(self):
+        cuota_1, cuota_2 = self.cuotas[0], self.cuotas[1]
+        saldo = sum(c.monto_cuota for c in self.cuotas)
+
+        pagos = self.prestamo.registrar_pago(cuota_1.monto_cuota + Decimal('10.00'))
+        recibo = pagos[0].recibo
+        self.assertEqual({p.recibo_id for p in Pago.objects.filter(pk__in=[p.pk for p in pagos])}, {recibo.pk})
+        self.assertEqual(
+            (recibo.monto_total, recibo.saldo_anterior, recibo.saldo_restante, recibo.fecha_proximo_pago),
+            (cuota_1.monto_cuota + Decimal('10.00'), saldo, saldo - cuota_1.monto_cuota - Decimal('10.00'), cuota_2.fecha_vencimiento)
+        )
+        self.assertEqual(
+            [(linea['cuota'], linea['monto'], linea['estado']) for linea in recibo.detalle],
+            [(1, str(cuota_1.monto_cuota), 'pagada'), (2, '10.00', 'pagada_parcialmente')]
+        )
+
+
+class BuscarPorClienteTests(TestCase):
+
+    def setUp(self):
+        self.juan = Cliente.objects.create(nombres='Juan Carlos', apellidos='Pérez Soto', numero_documento='00112345678')
+        self.maria = Cliente.objects.create(nombres='María', apellidos='Pérez', numero_documento='40298765432')
+        self.luis = Cliente.objects.create(nombres='Luis', apellidos='Almonte', numero_documento='00155555555')
+
+    def _buscar(self, texto, queryset=None, **kwargs):
+        return set(buscar_por_cliente(queryset if queryset is not None else Cliente.objects.all(), texto, **kwargs))
+
+    def test_todas_las_palabras_deben_coincidir(self):
+        self.assertEqual(self._buscar('pérez'), {self.juan, self.maria})
+        self.assertEqual(self._buscar('juan pérez'), {self.juan})
+        self.assertEqual(self._buscar('rez Soto'), {self.juan})
+        self.assertEqual(self._buscar('al'), {self.luis})
+
+    def test_documento_exacto_usa_la_via_rapida(self):
+        self.assertEqual(self._buscar('40298765432'), {self.maria})
+        # Un documento parcial no es coincidencia exacta y cae en la búsqueda por palabras.
+        self.assertEqual(self._buscar('5555'), {self.luis})
+
+    def test_el_id_se_suma_a_los_documentos_que_contienen_los_digitos(self):
+        # '1234' es parte de la cédula de Juan y a la vez el ID de Ana.
+        ana = Cliente.objects.create(pk=1234, nombres='Ana', apellidos='Reyes', numero_documento='40200000000')
+        self.assertEqual(self._buscar('1234'), {self.juan, ana})
+        self.assertEqual(self._buscar('1234', campo_id=None), {self.juan})
+        self.assertEqual(self._buscar('001'), {self.juan, self.luis})
+
+    def test_el_indice_sigue_los_cambios_del_cliente(self):
+        self.luis.apellidos = 'Guzmán'
+        self.luis.save()
+        self.assertEqual(self._buscar('Almonte'), set())
+        self.assertEqual(self._buscar('guzm'), {self.luis})
+        self.maria.delete()
+        self.assertEqual(self._buscar('María'), set())
+
+    def test_filtra_prestamos_a_traves_del_cliente(self):
+        prestamo = Prestamo.objects.create(
+            cliente=self.maria, monto=Decimal('500.00'), tasa_interes=Decimal('10.00'), plazo=2,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2025, 1, 1), estado='aprobado',
+        )
+        prestamos = Prestamo.objects.all()
+        self.assertEqual(self._buscar('maría pérez', prestamos, ruta_cliente='cliente__'), {prestamo})
+        self.assertEqual(self._buscar(str(prestamo.pk), prestamos, ruta_cliente='cliente__'), {prestamo})
+        self.assertEqual(self._buscar('Almonte', prestamos, ruta_cliente='cliente__'), set())
+
+    @skipUnless(connection.vendor == 'sqlite', 'Los triggers FTS solo existen en SQLite.')
+    def test_restaura_los_triggers_perdidos_al_reconstruir_la_tabla(self):
+        # Lo mismo que deja un AlterField de Cliente en SQLite: la tabla nueva sin triggers.
+        with connection.cursor() as cursor:
+            for nombre in busqueda.TRIGGERS_FTS_CLIENTES:
+                cursor.execute(f'DROP TRIGGER {nombre}')
+        Cliente.objects.filter(pk=self.luis.pk).update(apellidos='Guzmán')
+
+        with self.assertLogs('gestion_prestamos.busqueda', 'WARNING'):
+            self.assertEqual(busqueda.restaurar_triggers_fts(), list(busqueda.TRIGGERS_FTS_CLIENTES))
+        self.assertEqual(self._buscar('guzm'), {self.luis})
+        nueva = Cliente.objects.create(nombres='Rosa', apellidos='Quiroga', numero_documento='00166666666')
+        self.assertEqual(self._buscar('quiroga'), {nueva})
+        self.assertEqual(busqueda.restaurar_triggers_fts(), [])
+
+
+class ReferenciasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        referencias._copias_locales.clear()
+
+    def test_se_carga_una_vez_y_se_recarga_con_otra_version(self):
+        tipo = TipoPrestamo.objects.create(nombre='Tipo de prueba A', monto_maximo=Decimal('50000.00'), tasa_interes_predeterminada=Decimal('18.00'), plazo_maximo_meses=12)
+        self.assertEqual(referencias.obtener_detalles_tipo_prestamo(tipo.pk)['tasa_interes_predeterminada'], '18.00')
+
+        TipoPrestamo.objects.filter(pk=tipo.pk).update(tasa_interes_predeterminada=Decimal('21.00'))
+        with self.assertNumQueries(0):
+            self.assertEqual(referencias.obtener_detalles_tipo_prestamo(tipo.pk)['tasa_interes_predeterminada'], '18.00')
+
+        # Otro proceso publica una versión nueva en la caché compartida.
+        cache.set('referencias:version:tipos_prestamo', 'otra', None)
+        self.assertEqual(referencias.obtener_detalles_tipo_prestamo(tipo.pk)['tasa_interes_predeterminada'], '21.00')
+
+    def test_guardar_invalida_al_confirmar(self):
+        tipo = TipoPrestamo.objects.create(nombre='Tipo de prueba B', monto_maximo=Decimal('50000.00'), tasa_interes_predeterminada=Decimal('15.00'), plazo_maximo_meses=36)
+        self.assertIsNotNone(referencias.obtener_detalles_tipo_prestamo(tipo.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tipo.delete()
+        self.assertIsNone(referencias.obtener_detalles_tipo_prestamo(tipo.pk))
+
+    def test_grupos_desde_la_cache(self):
+        cliente = Cliente.objects.create(nombres='Gil', apellidos='Grupo', numero_documento='00188800000')
+        cliente.refresh_from_db()
+        self.assertTrue(cliente.user.groups.filter(name='Clientes').exists())
+        grupo_clientes = Group.objects.get(name='Clientes')
+        with self.assertNumQueries(0):
+            self.assertEqual(referencias.obtener_id_grupo('Clientes'), grupo_clientes.pk)
+
+    def test_la_membresia_de_administradores_no_sale_de_la_cache(self):
+        grupo = Group.objects.get(name='Administradores')
+        admin = User.objects.create_user('contador', password='x')
+        admin.groups.add(grupo)
+        # Dentro de una petición se consulta una sola vez.
+        self.assertTrue(es_administrador(admin))
+        with self.assertNumQueries(0):
+            self.assertTrue(es_administrador(admin))
+
+        # Quitarlo del grupo vale en la siguiente petición, sin depender de que se invalide ninguna caché.
+        admin.groups.remove(grupo)
+        self.assertFalse(es_administrador(User.objects.get(pk=admin.pk)))
+
+
+class ImportarPagosTests(TestCase):
+
+    def setUp(self):
+        self.prestamos = []
+        for i in range(2):
+            cliente = Cliente.objects.create(nombres=f'Cobro {i}', apellidos='Lote', numero_documento=f'0022200000{i}')
+            prestamo = Prestamo.objects.create(
+                cliente=cliente, monto=Decimal('1000.00'), tasa_interes=Decimal('12.00'), plazo=4,
+                frecuencia_pago='mensual', fecha_desembolso=datetime.date(2024, 1, 1), estado='aprobado',
+            )
+            generar_cuotas(prestamo)
+            self.prestamos.append(prestamo)
+        self.cuota = self.prestamos[0].cuotas.get(numero_cuota=1)
+
+    def _importar(self, texto, **kwargs):
+        return importar_pagos(leer_csv(StringIO(texto)), hoy=datetime.date(2024, 6, 30), **kwargs)
+
+    def test_aplica_las_filas_validas_e_informa_las_demas(self):
+        p1, p2 = self.prestamos
+        resumen = self._importar(
+            'prestamo,documento,monto,fecha\n'
+            f'{p1.pk},,{self.cuota.monto_cuota},2024-02-01\n'
+            f',00222000001,"1,000.00",15/02/2024\n'
+            '999,,10.00,2024-02-01\n'
+            f'{p1.pk},,abc,2024-02-01\n'
+            f'{p1.pk},,10.00,2024-07-01\n'
+            f'{p1.pk},,99999.00,\n'
+        )
+
+        self.assertEqual((resumen['filas'], resumen['aplicadas'], resumen['pagos']), (6, 2, 5))
+        self.assertEqual([linea for linea, _ in resumen['errores']], [4, 5, 6, 7])
+        self.assertIn('supera el saldo', resumen['errores'][3][1])
+
+        pago = Pago.objects.get(cuota=self.cuota)
+        self.assertEqual(pago.fecha_pago.date(), datetime.date(2024, 2, 1))
+        self.assertEqual(pago.recibo.saldo_restante, pago.recibo.saldo_anterior - self.cuota.monto_cuota)
+        self.assertEqual(
+            p2.cuotas.aggregate(total=Sum('monto_pagado_acumulado'))['total'], Decimal('1000.00')
+        )
+
+    def test_varias_filas_del_mismo_prestamo_hasta_saldarlo(self):
+        prestamo = self.prestamos[0]
+        cuotas = list(prestamo.cuotas.order_by('numero_cuota'))
+        filas = 'prestamo,monto\n' + ''.join(f'{prestamo.pk},{cuota.monto_cuota}\n' for cuota in cuotas)
+        filas += f'{prestamo.pk},1.00\n'
+
+        resumen = self._importar(filas, tamano_lote=3)
+
+        self.assertEqual(resumen['aplicadas'], len(cuotas))
+        self.assertEqual(resumen['prestamos_saldados'], 1)
+        self.assertEqual(resumen['errores'], [(len(cuotas) + 2, f'El préstamo #{prestamo.pk} está pagado.')])
+        prestamo.refresh_from_db()
+        self.assertEqual(prestamo.estado, 'pagado')
+        self.assertEqual(ReciboPago.objects.filter(prestamo=prestamo).count(), len(cuotas))
+
+    def test_consultas_por_lote_y_no_por_fila(self):
+        prestamo = self.prestamos[0]
+        filas = 'prestamo,monto\n' + f'{prestamo.pk},1.00\n' * 40
+
+        # Resolver, bloquear préstamos y cuotas, recibos, pagos, cuotas, situación, savepoints.
+        with self.assertNumQueries(10):
+            resumen = self._importar(filas)
+        self.assertEqual(resumen['aplicadas'], 40)
+
+    def test_acepta_pagos_de_prestamos_vencidos(self):
+        # `actualizar_cuotas` marca como vencidos los préstamos con cuotas atrasadas; siguen en cobro.
+        Prestamo.objects.filter(pk=self.prestamos[0].pk).update(estado='vencido')
+
+        resumen = self._importar(f'documento,monto\n00222000000,{self.cuota.monto_cuota}\n')
+
+        self.assertEqual((resumen['aplicadas'], resumen['errores']), (1, []))
+        self.cuota.refresh_from_db()
+        self.assertEqual(self.cuota.estado, 'pagada')
+
+    def test_error_de_lectura_conserva_los_lotes_aplicados(self):
+        prestamo = self.prestamos[0]
+        # La quinta línea supera el tamaño máximo de campo del lector de CSV.
+        texto = 'prestamo,monto\n' + f'{prestamo.pk},1.00\n' * 3 + 'x' * (csv.field_size_limit() + 1) + '\n'
+
+        resumen = self._importar(texto, tamano_lote=2)
+
+        # Se aplican el lote completo y el parcial leídos antes del error.
+        self.assertEqual((resumen['filas'], resumen['aplicadas'], resumen['linea_interrumpida']), (3, 3, 5))
+        self.assertEqual([linea for linea, _ in resumen['errores']], [5])
+        self.assertIn('CSV mal formado', resumen['errores'][0][1])
+        self.assertEqual(Pago.objects.filter(cuota__prestamo=prestamo).count(), 3)
+
+    def test_comando_informa_lo_aplicado_antes_de_un_error_de_codificacion(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as archivo:
+            # Las líneas en blanco se saltan; alejan el byte inválido del primer bloque que se decodifica.
+            archivo.write(f'prestamo,monto\n{self.prestamos[0].pk},100.00\n'.encode('utf-8') + b'\n' * 10000 + b'\xff,1\n')
+        self.addCleanup(os.unlink, archivo.name)
+
+        salida = StringIO()
+        with self.assertRaisesMessage(CommandError, 'se interrumpió en la línea'):
+            call_command('importar_pagos', archivo.name, stdout=salida)
+        self.assertIn('Filas aplicadas: 1 de 1', salida.getvalue())
+        self.assertIn('El archivo no está en UTF-8', salida.getvalue())
+
+    def test_comando(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as archivo:
+            archivo.write(f'prestamo;monto\n{self.prestamos[0].pk};100.00\n;5\n')
+        self.addCleanup(os.unlink, archivo.name)
+
+        salida = StringIO()
+        call_command('importar_pagos', archivo.name, '--delimitador', ';', stdout=salida)
+        self.assertIn('Filas aplicadas: 1 de 2', salida.getvalue())
+        self.assertIn('Línea 3: Falta el préstamo', salida.getvalue())
+
+
+class SituacionPrestamoTests(TestCase):
+
+    def setUp(self):
+        cliente = Cliente.objects.create(nombres='Elena', apellidos='Castro', numero_documento='00233300000')
+        tipo = TipoPrestamo.objects.create(
+            nombre='Tipo de prueba C', tasa_interes_predeterminada=Decimal('12.00'), monto_maximo=Decimal('50000.00'),
+            plazo_maximo_meses=12, tasa_penalidad_diaria=Decimal('0.0100'), dias_gracia=0,
+        )
+        self.prestamo = Prestamo.objects.create(
+            cliente=cliente, tipo_prestamo=tipo, monto=Decimal('1200.00'), tasa_interes=Decimal('12.00'), plazo=4,
+            frecuencia_pago='mensual', fecha_desembolso=datetime.date(2024, 1, 1), estado='aprobado',
+        )
+
+    def _situacion(self):
+        return SituacionPrestamo.objects.get(prestamo=self.prestamo)
+
+    def _esperada(self):
+        cuotas = list(self.prestamo.cuotas.all())
+        abiertas = [c for c in cuotas if c.estado != 'pagada']
+        return (
+            sum((max(c.monto_total_a_pagar - c.monto_pagado_acumulado, Decimal('0.00')) for c in cuotas), Decimal('0.00')),
+            sum((c.monto_pagado_acumulado for c in cuotas), Decimal('0.00')),
+            len(abiertas),
+            min((c.fecha_vencimiento for c in abiertas), default=None),
+        )
+
+    def _actual(self):
+        situacion = self._situacion()
+        return (situacion.saldo_pendiente, situacion.total_pagado, situacion.cuotas_pendientes, situacion.proximo_vencimiento)
+
+    def test_se_mantiene_con_cuotas_pagos_y_penalidades(self):
+        self.assertEqual(self._actual(), (Decimal('0.00'), Decimal('0.00'), 0, None))
+
+        generar_cuotas(self.prestamo)
+        self.assertEqual(self._actual(), self._esperada())
+        self.assertEqual(self._situacion().proximo_vencimiento, datetime.date(2024, 2, 1))
+
+        self.prestamo.registrar_pago(Decimal('400.00'))
+        self.assertEqual(self._actual(), self._esperada())
+
+        aplicar_penalidades_en_lote()
+        self.assertGreater(self._situacion().total_penalidades, 0)
+        self.assertEqual(self._actual(), self._esperada())
+
+        Pago.objects.filter(cuota__prestamo=self.prestamo).order_by('-pk').first().delete()
+        self.assertEqual(self._actual(), self._esperada())
+
+    def test_el_recorrido_por_fila_recalcula_una_vez_al_final(self):
+        generar_cuotas(self.prestamo)
+
+        with CaptureQueriesContext(connection) as consultas:
+            call_command('update_penalties', '--por-fila', stdout=StringIO())
+
+        # Las cuatro cuotas están vencidas y se guardan una por una; la situación se escribe una sola vez.
+        upserts = [q['sql'] for q in consultas.captured_queries if q['sql'].startswith('INSERT INTO "prestamos_situacion_prestamo"')]
+        self.assertEqual(len(upserts), 1)
+        self.assertGreater(self._situacion().total_penalidades, 0)
+        self.assertEqual(self._actual(), self._esperada())
+
+    def test_un_save_que_no_toca_los_montos_no_recalcula(self):
+        generar_cuotas(self.prestamo)
+        cuota = self.prestamo.cuotas.first()
+        with self.assertNumQueries(1):
+            cuota.save(update_fields=['fecha_ultima_penalidad_calculada'])
+
+    def test_dias_de_atraso(self):
+        generar_cuotas(self.prestamo)
+        situacion = self._situacion()
+        self.assertEqual(situacion.dias_atraso(datetime.date(2024, 2, 11)), 10)
+        self.assertEqual(situacion.dias_atraso(datetime.date(2024, 1, 15)), 0)
+
+    def test_se_revierte_con_la_transaccion(self):
+        generar_cuotas(self.prestamo)
+        antes = self._actual()
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.prestamo.registrar_pago(Decimal('100.00'))
+                raise RuntimeError
+        self.assertEqual(self._actual(), antes)
+
+    def test_reconstruccion(self):
+        generar_cuotas(self.prestamo)
+        self.prestamo.registrar_pago(Decimal('250.00'))
+        SituacionPrestamo.objects.all().delete()
+
+        self.assertEqual(actualizar_situacion_prestamos(tamano_lote=1), 1)
+        self.assertEqual(self._actual(), self._esperada())
+
+        SituacionPrestamo.objects.update(saldo_pendiente=0)
+        salida = StringIO()
+        call_command('reconstruir_situacion_prestamos', str(self.prestamo.pk), '999', stdout=salida)
+        self.assertIn('No existen los préstamos: 999', salida.getvalue())
+        self.assertEqual(self._actual(), self._esperada())
+
+
+class PopulateDataTests(TestCase):
+
+    def _huella(self):
+        return (
+            list(Cliente.objects.order_by('numero_documento').values_list('numero_documento', 'nombres', 'apellidos')),
+            list(Prestamo.objects.order_by('cliente__numero_documento', 'fecha_desembolso').values_list('monto', 'plazo', 'estado')),
+            Cuota.objects.aggregate(total=Sum('monto_cuota'), pagado=Sum('monto_pagado_acumulado')),
+            Pago.objects.aggregate(total=Sum('monto_pagado')),
+        )
+
+    def test_determinista_y_consistente(self):
+        opciones = dict(clients=15, seed=7, years=3, fecha_referencia=datetime.date(2025, 6, 30), batch_size=4, stdout=StringIO())
+        call_command('populate_data', **opciones)
+        primera = self._huella()
+        call_command('populate_data', **opciones)
+        self.assertEqual(self._huella(), primera)
+
+        self.assertEqual(Cliente.objects.count(), 15)
+        self.assertEqual(primera[2]['pagado'], primera[3]['total'])
+        cliente = Cliente.objects.select_related('user').first()
+        self.assertFalse(cliente.user.has_usable_password())
+        self.assertTrue(cliente.user.groups.filter(name='Clientes').exists())
+        self.assertEqual(SituacionPrestamo.objects.count(), Prestamo.objects.count())
+
+        call_command('populate_data', **{**opciones, 'seed': 8})
+        self.assertNotEqual(self._huella(), primera)
@@ -1,6 +1,23 @@
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, DateField, Exists, F, Func, IntegerField, Min, OuterRef, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest, Round
+from django.db.models.lookups import GreaterThan
 from django.utils import timezone
 import datetime
+import logging
+import threading
+import time
+from contextlib import contextmanager
 from decimal import Decimal
+from itertools import islice
+import numpy as np
+
+from . import telemetria
+from .models import ESTADOS_CUOTA_ABIERTA, Cuota, Pago, Prestamo, SituacionPrestamo, TipoPrestamo, cartera_modificada
+
+logger = logging.getLogger(__name__)
+
+CENTAVO = Decimal('0.01')
 
 def calcular_tabla_amortizacion(prestamo):
     """
@@ -107,6 +124,297 @@ def _calcular_metodo_frances(prestamo):
     
     return tabla_amortizacion
 
+def calcular_tablas_amortizacion_lote(prestamos):
+    """
+    Calcula las tablas de amortización de varios préstamos a la vez.
+
+    Es la versión por lotes de `calcular_tabla_amortizacion`: los préstamos se
+    agrupan por número de pagos y cada grupo se calcula con arreglos de NumPy,
+    convirtiendo el resultado a centavos enteros con el mismo redondeo
+    (mitad al par) que aplica `Decimal.quantize` en el cálculo individual.
+
+    Args:
+        prestamos (iterable): Objetos Prestamo o un queryset de Prestamo.
+
+    Returns:
+        list: Una tabla por préstamo, en el mismo orden de entrada. Cada tabla
+        tiene el mismo formato que devuelve `calcular_tabla_amortizacion`.
+    """
+    if hasattr(prestamos, 'select_related'):
+        prestamos = prestamos.select_related('tipo_prestamo')
+    prestamos = list(prestamos)
+    tablas = [None] * len(prestamos)
+
+    # Por ahora el único método soportado es el francés (ver calcular_tabla_amortizacion).
+    grupos = {}
+    for indice, prestamo in enumerate(prestamos):
+        tasa_periodo, numero_pagos = _tasa_y_numero_pagos(prestamo)
+        if numero_pagos <= 0:
+            # Caso degenerado: se deja que el cálculo individual reporte el error.
+            tablas[indice] = calcular_tabla_amortizacion(prestamo)
+            continue
+        grupos.setdefault(numero_pagos, []).append((indice, tasa_periodo))
+
+    for numero_pagos, miembros in grupos.items():
+        indices = [indice for indice, _ in miembros]
+        resultado = _calcular_metodo_frances_lote(
+            [prestamos[i] for i in indices],
+            np.array([float(tasa) for _, tasa in miembros]),
+            numero_pagos,
+        )
+        for posicion, indice in enumerate(indices):
+            if resultado[posicion] is None:
+                # El valor en coma flotante quedó demasiado cerca de medio centavo;
+                # se recalcula con Decimal para garantizar el mismo redondeo.
+                tablas[indice] = calcular_tabla_amortizacion(prestamos[indice])
+            else:
+                tablas[indice] = resultado[posicion]
+
+    return tablas
+
+def _tasa_y_numero_pagos(prestamo):
+    """
+    Devuelve la tasa por período y el número de pagos, con las mismas reglas
+    de conversión que `_calcular_metodo_frances`.
+    """
+    tasa_interes = prestamo.tasa_interes / Decimal(100)
+    tasa_mensual = tasa_interes if prestamo.periodo_tasa == 'mensual' else tasa_interes / 12
+
+    if prestamo.frecuencia_pago == 'quincenal':
+        return tasa_mensual / 2, prestamo.plazo * 2
+    elif prestamo.frecuencia_pago == 'semanal':
+        return tasa_mensual / 4, prestamo.plazo * 4
+    return tasa_mensual, prestamo.plazo
+
+def _calcular_metodo_frances_lote(prestamos, tasas, numero_pagos):
+    """
+    Calcula el método francés para préstamos que comparten el número de pagos.
+
+    Las filas de los arreglos son préstamos y las columnas son cuotas. Devuelve
+    una tabla por préstamo, o None para los préstamos cuyo redondeo a centavos
+    no se puede decidir con seguridad en coma flotante.
+    """
+    montos = np.array([float(p.monto) for p in prestamos])[:, None]
+    tasas = tasas[:, None]
+    n = numero_pagos
+    pagos_restantes = np.arange(n, -1, -1)[None, :]
+
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        # Se usan log1p/expm1 para no perder precisión con tasas muy pequeñas.
+        log_factor = np.log1p(tasas)
+        cuota_fija = np.where(
+            tasas > 0,
+            montos * tasas / -np.expm1(-n * log_factor),
+            montos / n,
+        )
+        # El saldo tras cada pago es el valor presente de los pagos que faltan.
+        # Es equivalente al bucle de `_calcular_metodo_frances`, pero sin la
+        # cancelación numérica de restar cantidades grandes.
+        saldos = np.where(
+            tasas > 0,
+            cuota_fija * -np.expm1(-pagos_restantes * log_factor) / tasas,
+            cuota_fija * pagos_restantes,
+        )
+        intereses = saldos[:, :-1] * tasas
+        capitales = cuota_fija - intereses
+        saldos = saldos[:, 1:]
+
+        # Ajuste final para la última cuota para que el saldo sea exactamente cero.
+        capitales[:, -1] += saldos[:, -1]
+        saldos[:, -1] = 0
+
+        # Margen de error en centavos. Incluye el error de la coma flotante y el
+        # que acumula el cálculo con Decimal cuando (1 + i)^n es muy grande.
+        crecimiento = np.exp(n * log_factor)
+        tolerancia = np.maximum(montos, cuota_fija) * 100 * (1e-13 + 1e-26 * crecimiento) + 1e-9
+
+    cuotas_c = _a_centavos(cuota_fija, tolerancia)
+    intereses_c = _a_centavos(intereses, tolerancia)
+    capitales_c = _a_centavos(capitales, tolerancia)
+    saldos_c = _a_centavos(saldos, tolerancia)
+
+    ambiguos = (
+        cuotas_c.mask.any(axis=1)
+        | intereses_c.mask.any(axis=1)
+        | capitales_c.mask.any(axis=1)
+        | saldos_c.mask.any(axis=1)
+    )
+    fechas = _fechas_vencimiento_lote(prestamos, n)
+
+    tablas = []
+    for fila, prestamo in enumerate(prestamos):
+        if ambiguos[fila]:
+            tablas.append(None)
+            continue
+        cuota = cuotas_c.data[fila, 0].item() * CENTAVO
+        tablas.append([
+            {
+                'numero_cuota': numero,
+                'fecha_vencimiento': fecha,
+                'cuota_fija': cuota,
+                'interes': interes * CENTAVO,
+                'capital': capital * CENTAVO,
+                'saldo_pendiente': saldo * CENTAVO,
+            }
+            for numero, fecha, interes, capital, saldo in zip(
+                range(1, n + 1),
+                fechas[fila],
+                intereses_c.data[fila].tolist(),
+                capitales_c.data[fila].tolist(),
+                saldos_c.data[fila].tolist(),
+            )
+        ])
+    return tablas
+
+def _a_centavos(valores, tolerancia):
+    """
+    Redondea montos a centavos enteros (mitad al par, como Decimal.quantize).
+    Marca en la máscara los valores que quedan a menos de `tolerancia`
+    centavos de medio centavo, o que no son finitos.
+    """
+    with np.errstate(invalid='ignore', over='ignore'):
+        centavos = valores * 100
+        distancia = np.abs(centavos - np.floor(centavos) - 0.5)
+        mascara = ~np.isfinite(centavos) | ~(distancia > tolerancia)
+    redondeados = np.rint(np.where(mascara, 0, centavos)).astype(np.int64)
+    return np.ma.MaskedArray(redondeados, mask=mascara)
+
+def _fechas_vencimiento_lote(prestamos, numero_pagos):
+    """
+    Calcula las fechas de vencimiento de todas las cuotas con aritmética de
+    fechas de NumPy. Replica las reglas de `_calcular_metodo_frances`.
+    """
+    periodos = np.arange(1, numero_pagos + 1)
+    fechas = []
+    for prestamo in prestamos:
+        inicio = np.datetime64(prestamo.fecha_desembolso, 'D')
+        if prestamo.frecuencia_pago == 'quincenal':
+            vencimientos = inicio + 15 * periodos
+        elif prestamo.frecuencia_pago == 'semanal':
+            vencimientos = inicio + 7 * periodos
+        else:
+            # Mismo día del mes, ajustado al último día si el mes es más corto.
+            meses = inicio.astype('datetime64[M]') + periodos
+            primer_dia = meses.astype('datetime64[D]')
+            dias_del_mes = ((meses + 1).astype('datetime64[D]') - primer_dia).astype(np.int64)
+            dia = np.minimum(prestamo.fecha_desembolso.day, dias_del_mes)
+            vencimientos = primer_dia + (dia - 1)
+        fechas.append(vencimientos.tolist())
+    return fechas
+
+def _cuotas_desde_tabla(prestamo, tabla):
+    return [
+        Cuota(
+            prestamo=prestamo,
+            numero_cuota=item_cuota['numero_cuota'],
+            fecha_vencimiento=item_cuota['fecha_vencimiento'],
+            monto_cuota=item_cuota['cuota_fija'],
+            capital=item_cuota['capital'],
+            interes=item_cuota['interes'],
+            saldo_pendiente=item_cuota['saldo_pendiente'],
+        )
+        for item_cuota in tabla
+    ]
+
+def _resumen_generacion(prestamos, cuotas, inicio):
+    segundos = time.perf_counter() - inicio
+    return {
+        'prestamos': prestamos,
+        'cuotas': cuotas,
+        'segundos': segundos,
+        'cuotas_por_segundo': cuotas / segundos if segundos > 0 else 0.0,
+    }
+
+def generar_cuotas(prestamo, tabla_amortizacion=None):
+    """
+    Guarda la tabla de amortización completa de un préstamo con un solo
+    `bulk_create`, dentro de una transacción.
+
+    Args:
+        prestamo (Prestamo): Préstamo ya guardado en la base de datos.
+        tabla_amortizacion (list): Tabla precalculada. Si no se indica, se
+            calcula con `calcular_tabla_amortizacion`.
+
+    Returns:
+        dict: Préstamos y cuotas escritos, segundos y cuotas por segundo.
+    """
+    inicio = time.perf_counter()
+    if tabla_amortizacion is None:
+        tabla_amortizacion = calcular_tabla_amortizacion(prestamo)
+
+    with transaction.atomic():
+        cuotas = Cuota.objects.bulk_create(_cuotas_desde_tabla(prestamo, tabla_amortizacion))
+        cartera_modificada.send(sender=Cuota, prestamo_ids=[prestamo.pk])
+        telemetria.incrementar_al_confirmar('prestamos_cuotas_generadas_total', len(cuotas))
+
+    resumen = _resumen_generacion(1, len(cuotas), inicio)
+    logger.info(
+        'Préstamo #%s: %d cuotas generadas en %.3f s (%.0f cuotas/s).',
+        prestamo.pk, resumen['cuotas'], resumen['segundos'], resumen['cuotas_por_segundo']
+    )
+    return resumen
+
+def regenerar_cuotas_lote(prestamos, tamano_lote=500):
+    """
+    Vuelve a generar las tablas de amortización de muchos préstamos.
+
+    Las tablas se calculan con `calcular_tablas_amortizacion_lote` y se
+    escriben por bloques de `tamano_lote` préstamos; cada bloque borra las
+    cuotas anteriores y crea las nuevas en una sola transacción.
+    Los préstamos que ya tienen pagos registrados se omiten, porque borrar
+    sus cuotas eliminaría también el historial de pagos. La comprobación se
+    hace dentro de la transacción de cada bloque, con sus préstamos
+    bloqueados (el mismo bloqueo que toma `registrar_pago`), y el borrado
+    vuelve a excluir las cuotas de préstamos con pagos: un pago que entre
+    mientras tanto nunca se pierde.
+
+    Returns:
+        dict: Igual que `generar_cuotas`, más la lista `omitidos` con los
+        IDs de los préstamos que no se regeneraron.
+    """
+    inicio = time.perf_counter()
+    if hasattr(prestamos, 'select_related'):
+        prestamos = prestamos.select_related('tipo_prestamo')
+    prestamos = list(prestamos)
+
+    omitidos, regenerados, total_cuotas = [], 0, 0
+    for desde in range(0, len(prestamos), tamano_lote):
+        bloque = prestamos[desde:desde + tamano_lote]
+        tablas = calcular_tablas_amortizacion_lote(bloque)
+        ids = [p.pk for p in bloque]
+
+        with transaction.atomic():
+            list(Prestamo.objects.select_for_update().filter(pk__in=ids).values_list('pk', flat=True))
+            con_pagos = set(
+                Pago.objects.filter(cuota__prestamo__in=ids).values_list('cuota__prestamo_id', flat=True).distinct()
+            )
+            nuevas, ids_regenerados = [], []
+            for prestamo, tabla in zip(bloque, tablas):
+                if prestamo.pk in con_pagos:
+                    omitidos.append(prestamo.pk)
+                    continue
+                ids_regenerados.append(prestamo.pk)
+                nuevas.extend(_cuotas_desde_tabla(prestamo, tabla))
+            if not ids_regenerados:
+                continue
+
+            Cuota.objects.filter(prestamo__in=ids_regenerados).filter(
+                ~Exists(Pago.objects.filter(cuota__prestamo=OuterRef('prestamo')))
+            ).delete()
+            Cuota.objects.bulk_create(nuevas, batch_size=1000)
+            cartera_modificada.send(sender=Cuota, prestamo_ids=ids_regenerados)
+            telemetria.incrementar_al_confirmar('prestamos_cuotas_generadas_total', len(nuevas))
+        regenerados += len(ids_regenerados)
+        total_cuotas += len(nuevas)
+
+    resumen = _resumen_generacion(regenerados, total_cuotas, inicio)
+    resumen['omitidos'] = omitidos
+    logger.info(
+        '%d préstamos regenerados, %d cuotas en %.3f s (%.0f cuotas/s).',
+        resumen['prestamos'], resumen['cuotas'], resumen['segundos'], resumen['cuotas_por_segundo']
+    )
+    return resumen
+
 def calcular_penalidad_cuota(cuota):
     """
     Calcula y actualiza la penalidad acumulada para una cuota específica.
@@ -142,7 +450,7 @@ def calcular_penalidad_cuota(cuota):
             dias_atraso_calculo = (hoy - fecha_desde_calculo).days
             
             # Monto base para la penalidad: monto_cuota menos lo ya pagado de esa cuota
-            monto_base_penalidad = cuota.monto_cuota - (cuota.total_pagado if cuota.total_pagado is not None else Decimal('0.00'))
+            monto_base_penalidad = cuota.monto_cuota - cuota.total_pagado
             
             # Asegurarse de que el monto base no sea negativo
             monto_base_penalidad = max(Decimal('0.00'), monto_base_penalidad)
@@ -151,4 +459,202 @@ def calcular_penalidad_cuota(cuota):
             
             cuota.monto_penalidad_acumulada += penalidad_calculada.quantize(Decimal('0.01'))
             cuota.fecha_ultima_penalidad_calculada = hoy
-            cuota.save()
\ No newline at end of file
+            cuota.save(update_fields=['monto_penalidad_acumulada', 'fecha_ultima_penalidad_calculada'])
+
+class DiasTranscurridos(Func):
+    """
+    Días enteros transcurridos desde una columna de fecha hasta la fecha `hasta`.
+    Devuelve NULL si la columna es NULL.
+    """
+    output_field = IntegerField()
+    template = '(%(expressions)s)'
+    arg_joiner = ' - '
+
+    def __init__(self, expression, hasta, **extra):
+        super().__init__(Value(hasta, output_field=DateField()), expression, **extra)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)',
+            arg_joiner=') - julianday(',
+            **extra_context
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='DATEDIFF(%(expressions)s)', arg_joiner=', ', **extra_context)
+
+def aplicar_penalidades_en_lote(hoy=None, prestamo_ids=None):
+    """
+    Calcula y guarda las penalidades de todas las cuotas vencidas con un
+    UPDATE por tipo de préstamo, en lugar de llamar a `calcular_penalidad_cuota`
+    cuota por cuota. Aplica exactamente las mismas reglas y el mismo redondeo
+    (mitad al par, a centavos).
+
+    Args:
+        hoy (date): Fecha de cálculo. Por defecto, `timezone.localdate()`.
+        prestamo_ids (list): Si se indica, solo las cuotas de esos préstamos.
+
+    Returns:
+        int: Número de cuotas actualizadas.
+    """
+    inicio = time.perf_counter()
+    hoy = hoy or timezone.localdate()
+
+    # Monto base en centavos enteros: monto de la cuota menos lo pagado, nunca negativo.
+    base_centavos = Greatest(
+        Cast(Round((F('monto_cuota') - F('monto_pagado_acumulado')) * Value(100)), BigIntegerField()),
+        Value(0),
+    )
+
+    tipos = TipoPrestamo.objects.all()
+    if prestamo_ids is not None:
+        tipos = tipos.filter(prestamo__in=prestamo_ids).distinct()
+
+    actualizadas = 0
+    prestamo_ids_tocados = set()
+    with transaction.atomic():
+        for tipo in tipos:
+            fecha_limite = hoy - datetime.timedelta(days=tipo.dias_gracia)
+            dias = Coalesce(
+                DiasTranscurridos('fecha_ultima_penalidad_calculada', hoy),
+                DiasTranscurridos('fecha_vencimiento', hoy) - Value(tipo.dias_gracia),
+            )
+
+            # base (2 decimales) x tasa (4 decimales) x días es exacto en millonésimas.
+            tasa_diezmilesimas = int(tipo.tasa_penalidad_diaria * 10000)
+            millonesimas = Cast(base_centavos * Value(tasa_diezmilesimas) * dias, BigIntegerField())
+            centavos = millonesimas / Value(10000)
+            resto = millonesimas - centavos * Value(10000)
+            # Redondeo mitad al par: se sube si el resto pasa de la mitad, o si es
+            # justo la mitad y el cociente es impar (2 * resto + impar > 10000).
+            impar = centavos - (centavos / Value(2)) * Value(2)
+            penalidad_centavos = Case(
+                When(GreaterThan(resto * Value(2) + impar, 10000), then=centavos + Value(1)),
+                default=centavos,
+                output_field=BigIntegerField(),
+            )
+
+            tocadas = Cuota.objects.filter(
+                prestamo__tipo_prestamo=tipo,
+                estado__in=['pendiente', 'pagada_parcialmente'],
+                fecha_vencimiento__lt=hoy,
+            ).filter(
+                # La penalidad empieza después de los días de gracia...
+                fecha_vencimiento__lt=fecha_limite,
+            ).exclude(
+                # ...y no se vuelve a calcular si ya se calculó hoy.
+                fecha_ultima_penalidad_calculada__gte=hoy,
+            )
+            if prestamo_ids is not None:
+                tocadas = tocadas.filter(prestamo_id__in=prestamo_ids)
+            prestamo_ids_tocados.update(tocadas.order_by().values_list('prestamo_id', flat=True).distinct())
+            actualizadas += tocadas.update(
+                monto_penalidad_acumulada=F('monto_penalidad_acumulada') + penalidad_centavos * Value(CENTAVO),
+                fecha_ultima_penalidad_calculada=hoy,
+            )
+
+        if prestamo_ids_tocados:
+            cartera_modificada.send(sender=Cuota, prestamo_ids=list(prestamo_ids_tocados))
+
+    alcance = 'cartera' if prestamo_ids is None else 'prestamos'
+    telemetria.observar('prestamos_penalidades_segundos', time.perf_counter() - inicio, alcance=alcance)
+    telemetria.incrementar('prestamos_penalidades_cuotas_total', actualizadas)
+    return actualizadas
+
+
+# ==================================================
+# === SITUACIÓN DE LOS PRÉSTAMOS ===
+# ==================================================
+
+CAMPOS_SITUACION = ['saldo_pendiente', 'total_pagado', 'total_penalidades', 'cuotas_pendientes', 'proximo_vencimiento', 'fecha_actualizacion']
+
+# Campos de Cuota de los que depende la situación: un save() con
+# update_fields que no toque ninguno no la recalcula.
+CAMPOS_CUOTA_SITUACION = frozenset([
+    'monto_cuota', 'monto_penalidad_acumulada', 'monto_pagado_acumulado', 'estado', 'fecha_vencimiento', 'prestamo',
+])
+
+_situacion_diferida = threading.local()
+
+
+@contextmanager
+def situacion_diferida():
+    """
+    Mientras dura, guardar una Cuota no recalcula la situación de su préstamo
+    (un agregado y un upsert por save): se anotan los préstamos y al salir se
+    envía `cartera_modificada` una sola vez con todos. Es para los recorridos
+    fila por fila (`--por-fila` de los comandos nocturnos); la situación de
+    esos préstamos queda atrasada hasta el final del recorrido. Si el bloque
+    termina con una excepción no se recalcula nada;
+    `reconstruir_situacion_prestamos` la pone al día.
+    """
+    if getattr(_situacion_diferida, 'prestamo_ids', None) is not None:
+        # Anidado: recalcula el bloque de afuera.
+        yield
+        return
+    _situacion_diferida.prestamo_ids = set()
+    try:
+        yield
+        prestamo_ids = _situacion_diferida.prestamo_ids
+    finally:
+        _situacion_diferida.prestamo_ids = None
+    if prestamo_ids:
+        cartera_modificada.send(sender=Cuota, prestamo_ids=sorted(prestamo_ids))
+
+
+def diferir_situacion(prestamo_id):
+    """Anota el préstamo si hay una `situacion_diferida` en curso; indica si lo anotó."""
+    prestamo_ids = getattr(_situacion_diferida, 'prestamo_ids', None)
+    if prestamo_ids is None:
+        return False
+    prestamo_ids.add(prestamo_id)
+    return True
+
+
+def actualizar_situacion_prestamos(prestamo_ids=None, tamano_lote=1000):
+    """
+    Recalcula `SituacionPrestamo` de los préstamos indicados (o de todos) a
+    partir de sus cuotas: una consulta agrupada y un upsert por bloque. Se
+    llama dentro de la transacción que modificó las cuotas, así que la tabla
+    nunca queda desfasada de ellas. Los ids deben ser de préstamos existentes.
+
+    Returns:
+        int: Préstamos actualizados.
+    """
+    if prestamo_ids is None:
+        prestamo_ids = Prestamo.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=tamano_lote)
+    prestamo_ids = iter(prestamo_ids)
+
+    cero = Value(Decimal('0.00'))
+    actualizados = 0
+    while True:
+        bloque = list(islice(prestamo_ids, tamano_lote))
+        if not bloque:
+            break
+        totales = {
+            fila['prestamo_id']: fila
+            for fila in Cuota.objects.filter(prestamo_id__in=bloque).order_by().values('prestamo_id').annotate(
+                saldo_pendiente=Sum(Greatest(F('monto_cuota') + F('monto_penalidad_acumulada') - F('monto_pagado_acumulado'), cero)),
+                total_pagado=Sum('monto_pagado_acumulado'),
+                total_penalidades=Sum('monto_penalidad_acumulada'),
+                cuotas_pendientes=Count('pk', filter=Q(estado__in=ESTADOS_CUOTA_ABIERTA)),
+                proximo_vencimiento=Min('fecha_vencimiento', filter=Q(estado__in=ESTADOS_CUOTA_ABIERTA)),
+            )
+        }
+        filas = []
+        for prestamo_id in bloque:
+            datos = totales.get(prestamo_id, {})
+            filas.append(SituacionPrestamo(
+                prestamo_id=prestamo_id,
+                saldo_pendiente=(datos.get('saldo_pendiente') or Decimal('0.00')).quantize(CENTAVO),
+                total_pagado=(datos.get('total_pagado') or Decimal('0.00')).quantize(CENTAVO),
+                total_penalidades=(datos.get('total_penalidades') or Decimal('0.00')).quantize(CENTAVO),
+                cuotas_pendientes=datos.get('cuotas_pendientes') or 0,
+                proximo_vencimiento=datos.get('proximo_vencimiento'),
+            ))
+        SituacionPrestamo.objects.bulk_create(
+            filas, update_conflicts=True, unique_fields=['prestamo'], update_fields=CAMPOS_SITUACION
+        )
+        actualizados += len(filas)
+    return actualizados